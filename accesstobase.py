@@ -7,8 +7,11 @@ from typing import Optional
 from datetime import datetime
 
 import pandas as pd
+from dateutil.relativedelta import relativedelta
 
 from config import path_to_base
+from dbschema import to_epoch_hour
+from database import days_without_forecast
 
 
 def check_base(date: datetime) -> Optional[pd.DataFrame]:
@@ -20,36 +23,11 @@ def check_base(date: datetime) -> Optional[pd.DataFrame]:
 
     Возвращает датафрейм с колонкой dates
     """
-    conn = sqlite3.connect(path_to_base)
     # извлечем все имеющиеся даты за указанный месяц,
     # на которые имеются фактические данные, но нет прогнозов
-    query = f"""
-        SELECT
-            t1.date AS dates
-        FROM
-            (SELECT
-                DATE(t1.datetime) AS date
-            FROM
-                consumption_table AS t1
-            WHERE
-                SUBSTRING(t1.datetime, 1, 7) = SUBSTRING('{date}', 1, 7)
-            GROUP BY
-                DATE(t1.datetime)) AS t1
-            LEFT JOIN
-            (SELECT
-                DATE(t2.datetime) AS date
-            FROM
-                predict_table AS t2
-            WHERE
-                SUBSTRING(t2.datetime, 1, 7) = SUBSTRING('{date}', 1, 7)
-            GROUP BY
-                DATE(t2.datetime)) AS t2 ON t1.date = t2.date
-        WHERE t2.date IS NULL;
-    """
-
-    df = pd.read_sql(sql=query, con=conn)
-    df['dates'] = pd.to_datetime(df['dates'], format='%Y-%m-%d')
-    conn.close()
+    month_start = date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    df = days_without_forecast(start_time=month_start,
+                               end_time=month_start + relativedelta(months=1))
 
     if len(df) > 0:
         return df
@@ -61,25 +39,26 @@ if __name__ == '__main__':
 
     conn_ = sqlite3.connect(path_to_base)
     cursor_ = conn_.cursor()
+    day_start_ = to_epoch_hour(datetime.strptime('2022-12-31', '%Y-%m-%d'))
     # для тестирования создадим временную таблицу для хранения части предиктов
-    query_ = """
+    query_ = f"""
         CREATE TABLE
             temp_table AS
         SELECT
             *
         FROM
             predict_table AS t
-        WHERE 
-            DATE(t.datetime) = '2022-12-31';
+        WHERE
+            t.datetime BETWEEN {day_start_} AND {day_start_ + 23};
     """
     cursor_.execute(query_)
     conn_.commit()
     # удалим эти предикты из основной таблицы
-    query_ = """
+    query_ = f"""
         DELETE FROM
             predict_table AS t
         WHERE
-            DATE(t.datetime) = '2022-12-31'
+            t.datetime BETWEEN {day_start_} AND {day_start_ + 23}
     """
     cursor_.execute(query_)
     conn_.commit()
@@ -0,0 +1,105 @@
+"""
+модуль выполняет догоняющие прогнозы на много дат в пуле процессов.
+
+Даты делятся на непрерывные части, каждая часть прогнозируется в процессе пула
+одним вызовом call_predictors_batch. Модели загружаются в каждом процессе
+один раз (кэш моделей живет в течение процесса) и переиспользуются для всех его частей.
+Процессы пула только читают БД, а запись выполняет один писатель -
+функция on_ready в основном процессе, которая получает части строго в порядке дат,
+поэтому запись в БД и выгрузка в ОИК не конкурируют за блокировки sqlite.
+Статистика кэшей моделей процессов пула возвращается вместе с прогнозами
+"""
+import os
+import math
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from config import backfill_workers, use_history_cache
+from predict import call_predictors_batch, resolve_predictors
+from predictors.modelcache import model_cache, sum_stats
+
+
+# модели процесса пула (задаются инициализатором)
+_predictors: List[Tuple[Callable, str, str]] = []
+
+
+def _init_worker(specs: List[Tuple[str, str, str]]) -> None:
+    """
+    инициализатор процесса пула: модели по описаниям specs (тип, имя, путь к модели)
+    """
+    global _predictors
+    _predictors = resolve_predictors(specs)
+    return None
+
+
+def _predict_part(dates: List[datetime]) -> Tuple[Dict[datetime, pd.DataFrame], int, Dict[str, int]]:
+    """
+    прогноз части дат в процессе пула. Возвращает прогнозы, идентификатор процесса
+    и накопленную статистику его кэша моделей
+    """
+    preds = call_predictors_batch(dates=dates, predictors=_predictors)
+    return preds, os.getpid(), model_cache.stats()
+
+
+def split_dates(dates: List[datetime], parts: int) -> List[List[datetime]]:
+    """
+    функция делит упорядоченный список дат на parts непрерывных частей близкой длины
+    """
+    size = math.ceil(len(dates) / max(parts, 1))
+    return [dates[i:i + size] for i in range(0, len(dates), size)]
+
+
+def backfill(dates   : List[datetime],
+             specs   : List[Tuple[str, str, str]],
+             on_ready: Callable[[List[datetime], Dict[datetime, pd.DataFrame]], None],
+             workers : Optional[int] = None) -> Tuple[Dict[datetime, pd.DataFrame], Dict[str, int]]:
+    """
+    функция выполняет прогнозы моделей specs (тип, имя, путь к модели,
+    см. predict.resolve_predictors) на даты dates в workers процессах
+    (по умолчанию config.backfill_workers, 0 - по числу ядер).
+
+    Части дат передаются в on_ready(даты части, {дата: прогнозы моделей}) по мере готовности,
+    но строго в порядке дат. Даты, на которые нет исходных данных, попадают в часть
+    без прогноза.
+
+    Возвращает словарь {дата: прогнозы моделей}, как call_predictors_batch,
+    и статистику кэша моделей (при нескольких процессах - сумму по процессам пула,
+    число процессов - в ключе processes)
+    """
+    dates = sorted(dates)
+    workers = backfill_workers if workers is None else workers
+    workers = min(workers or os.cpu_count() or 1, len(dates))
+    if workers <= 1:
+        preds = call_predictors_batch(dates=dates, predictors=resolve_predictors(specs))
+        on_ready(dates, preds)
+        return preds, {**model_cache.stats(), 'processes': 1}
+
+    if use_history_cache:
+        # кэш истории дописывается один раз до запуска пула,
+        # процессы пула его только читают
+        from historycache import sync_history_cache
+        sync_history_cache()
+
+    # по две части на процесс: записи начинаются, не дожидаясь самых долгих частей
+    parts = split_dates(dates, parts=2 * workers)
+    preds, done, next_part = {}, {}, 0
+    # последняя (накопленная) статистика кэша каждого процесса пула
+    worker_stats: Dict[int, Dict[str, int]] = {}
+    # spawn - как в Windows: процессы не наследуют подключения к БД и потоки родителя
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(specs,)) as executor:
+        futures = {executor.submit(_predict_part, part): i for i, part in enumerate(parts)}
+        for future in as_completed(futures):
+            done[futures[future]], pid, worker_stats[pid] = future.result()
+            while next_part in done:
+                part_preds = done.pop(next_part)
+                on_ready(parts[next_part], part_preds)
+                preds.update(part_preds)
+                next_part += 1
+    return preds, {**sum_stats(list(worker_stats.values())), 'processes': len(worker_stats)}
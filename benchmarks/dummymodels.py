@@ -0,0 +1,130 @@
+"""
+модуль создает фиктивные модели с теми же входами и форматом файлов, что и рабочие:
+модель onnx с двумя входами и скеллеры для predictor_rnn, словарь бустеров lightgbm
+по горизонтам для predictor_lgbm. Качество прогноза фиктивных моделей не важно,
+они нужны для замера времени работы конвейера
+"""
+import os
+import pickle
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from predictors.lgbm.predictor_lgbm import HorizonPlan, make_data
+
+
+# горизонты и параметры признаков рабочих моделей
+Y_LAGS = list(range(12, 36))
+LGBM_LAGS = list(range(180))
+TIME_FREQ = ['hour', 'day_of_year', 'month', 'weekday']
+
+# размеры входов модели rnn: окно 180 часов по 11 признаков
+# (потребление, температура, 8 тригонометрических признаков, выходной день)
+# и 288 признаков полносвязного входа
+RNN_WINDOW = 180
+RNN_FEATURES = 11
+DENSE_FEATURES = 288
+
+
+def make_rnn_model(model_path: str, history: pd.DataFrame, seed: int = 0) -> None:
+    """
+    функция сохраняет в папку model_path модель model.onnx
+    (два полносвязных блока по входам и общий выходной слой на 24 часа)
+    и скеллеры scallers.pickle, обученные на истории history
+    """
+    from onnx import TensorProto, helper, numpy_helper, save_model
+    from sklearn.preprocessing import StandardScaler
+
+    os.makedirs(model_path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    def weights(name: str, *shape: int) -> 'TensorProto':
+        values = rng.normal(0, 1 / np.sqrt(shape[0]), size=shape).astype(np.float32)
+        return numpy_helper.from_array(values, name=name)
+
+    hidden = 32
+    graph = helper.make_graph(
+        nodes=[helper.make_node('Flatten', ['rnn_input'], ['rnn_flat'], axis=1),
+               helper.make_node('MatMul', ['rnn_flat', 'w_rnn'], ['rnn_mm']),
+               helper.make_node('Relu', ['rnn_mm'], ['rnn_hidden']),
+               helper.make_node('MatMul', ['dense_input', 'w_dense'], ['dense_mm']),
+               helper.make_node('Relu', ['dense_mm'], ['dense_hidden']),
+               helper.make_node('Concat', ['rnn_hidden', 'dense_hidden'], ['hidden'], axis=1),
+               helper.make_node('MatMul', ['hidden', 'w_out'], ['out_mm']),
+               helper.make_node('Add', ['out_mm', 'b_out'], ['power_pred'])],
+        name='dummy_rnn',
+        inputs=[helper.make_tensor_value_info('rnn_input', TensorProto.FLOAT,
+                                              ['n', RNN_WINDOW, RNN_FEATURES]),
+                helper.make_tensor_value_info('dense_input', TensorProto.FLOAT,
+                                              ['n', DENSE_FEATURES])],
+        outputs=[helper.make_tensor_value_info('power_pred', TensorProto.FLOAT, ['n', 24])],
+        initializer=[weights('w_rnn', RNN_WINDOW * RNN_FEATURES, hidden),
+                     weights('w_dense', DENSE_FEATURES, hidden),
+                     weights('w_out', 2 * hidden, 24),
+                     numpy_helper.from_array(np.full(24, 5500, dtype=np.float32), name='b_out')])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    save_model(model, os.path.join(model_path, 'model.onnx'))
+
+    # скаллируемые колонки: потребление и температура рекуррентного входа,
+    # прошлогодние потребление и температура по горизонтам полносвязного входа
+    facts = history[['power_true', 'temperature']].dropna().to_numpy(dtype=float)
+    scaller_RNN = StandardScaler().fit(facts)
+    scaller_Dense = StandardScaler().fit(np.tile(facts, len(Y_LAGS)))
+    with open(os.path.join(model_path, 'scallers.pickle'), 'wb') as file:
+        pickle.dump((scaller_RNN, scaller_Dense), file)
+    return None
+
+
+def lgbm_feature_counts(history: pd.DataFrame) -> Dict[int, int]:
+    """
+    число признаков модели каждого горизонта - по колонкам make_data
+    и плану инференса predictor_lgbm
+    """
+    sample = history.iloc[:24 * 14].assign(day_off=0)
+    X = make_data(df=sample,
+                  lags=LGBM_LAGS,
+                  y_lags=Y_LAGS,
+                  time_freq=TIME_FREQ,
+                  points=list(sample['datetime'].iloc[[-1]]))
+    indices = HorizonPlan(model=dict.fromkeys(Y_LAGS)).indices(list(X.columns))
+    return {lag: len(columns) for lag, columns in indices.items()}
+
+
+def make_lgbm_model(model_path: str,
+                    history   : pd.DataFrame,
+                    n_trees   : int = 100,
+                    seed      : int = 0) -> None:
+    """
+    функция сохраняет в папку model_path словарь бустеров lightgbm
+    {горизонт: модель} (model.pickle) с n_trees деревьями, обученных на случайных
+    признаках нужной размерности
+    """
+    import lightgbm as lgb
+
+    os.makedirs(model_path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    power = history['power_true'].dropna().to_numpy(dtype=float)
+
+    models = {}
+    for lag, n_features in lgbm_feature_counts(history).items():
+        X = rng.normal(size=(2000, n_features))
+        y = rng.choice(power, size=len(X)) + 100 * X[:, 0]
+        models[lag] = lgb.train(params={'objective': 'regression',
+                                        'num_leaves': 31,
+                                        'verbose': -1,
+                                        'seed': seed},
+                                train_set=lgb.Dataset(X, y),
+                                num_boost_round=n_trees)
+    with open(os.path.join(model_path, 'model.pickle'), 'wb') as file:
+        pickle.dump(models, file)
+    return None
+
+
+def model_requirements() -> Dict[str, List[str]]:
+    """
+    модули, необходимые для создания и вызова фиктивных моделей каждого типа
+    """
+    return {'lgbm': ['lightgbm'],
+            'rnn': ['onnx', 'onnxruntime', 'sklearn'],}
@@ -0,0 +1,460 @@
+"""
+Замеры производительности конвейера прогноза на синтетических данных.
+
+Для каждого объема истории (по умолчанию 1, 5 и 20 лет) в отдельном процессе
+создаются рабочая БД, папка телеметрии и фиктивные модели (см. syntheticdata.py и
+dummymodels.py), после чего замеряются этапы конвейера: чтение истории,
+кэш истории, модели lgbm и rnn, call_predictors, запись прогнозов, мониторинг,
+очистка выбросов и догрузка телеметрии.
+
+Каждый этап выполняется repeat раз (первый повтор - холодный, с загрузкой моделей),
+пик памяти Python (tracemalloc) замеряется отдельным прогоном, чтобы не искажать время.
+Этапы, для которых не установлены нужные библиотеки, помечаются пропущенными.
+
+Результаты сохраняются в json и сравниваются с сохраненной базовой линией:
+медиана времени или пик памяти этапа больше базовых более чем на tolerance
+считаются регрессией (код возврата 1). Базовая линия зависит от машины и в репозиторий
+не входит: она сохраняется ключом --save-baseline на эталонной машине. Если ее нет,
+сравнение невозможно (код возврата 2), замеры без сравнения - ключ --no-compare.
+
+Запуск из корня проекта:
+python -m benchmarks.run_benchmarks --years 1 5 20
+python -m benchmarks.run_benchmarks --years 1 --save-baseline
+python -m benchmarks.run_benchmarks --years 1 --no-compare
+"""
+import gc
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import importlib.util
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_OUTPUT = os.path.join(ROOT, 'benchmarks', 'results.json')
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+# библиотеки, версии которых сохраняются вместе с результатами
+VERSIONED_MODULES = ['numpy', 'pandas', 'onnx', 'onnxruntime', 'lightgbm', 'sklearn', 'matplotlib']
+
+# число дат пакетного прогноза
+BATCH_DATES = 30
+# запас истории сверх заданного числа лет, сутки
+HISTORY_MARGIN_DAYS = 60
+# отставание фактов в БД от даты окончания данных (догружается из телеметрии), сутки
+TELEMETRY_LAG_DAYS = 3
+
+
+def missing_modules(modules: List[str]) -> List[str]:
+    """
+    перечень неустановленных модулей
+    """
+    return [module for module in modules if importlib.util.find_spec(module) is None]
+
+
+def measure(run: Callable, setup: Callable[[], Dict[str, Any]], repeat: int) -> Dict[str, Any]:
+    """
+    функция замеряет время repeat вызовов run(**setup()) и пик памяти,
+    выделенной Python за отдельный вызов. Подготовка setup в замер не входит,
+    вывод этапа подавляется
+    """
+    seconds = []
+    with open(os.devnull, 'w', encoding='utf8') as devnull, redirect_stdout(devnull):
+        for _ in range(repeat):
+            kwargs = setup()
+            gc.collect()
+            start = time.perf_counter()
+            run(**kwargs)
+            seconds.append(time.perf_counter() - start)
+
+        kwargs = setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run(**kwargs)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {'seconds': [round(value, 6) for value in seconds],
+            'first': round(seconds[0], 6),
+            'median': round(float(np.median(seconds)), 6),
+            'min': round(min(seconds), 6),
+            'peak_mib': round(peak / 1024 ** 2, 3),}
+
+
+def configure(workdir: str) -> Dict[str, str]:
+    """
+    функция направляет config проекта в рабочую папку workdir.
+    Вызывается до импорта модулей проекта, которые читают config при импорте
+    """
+    import config
+
+    paths = {'path_to_base': os.path.join(workdir, 'base.sqlite'),
+             'path_to_history_cache': os.path.join(workdir, 'history_cache'),
+             'path_to_ort_cache': os.path.join(workdir, 'ort_cache'),
+             'path_to_monitor_reports': os.path.join(workdir, 'monitor_reports'),
+             'path_to_reports': os.path.join(workdir, 'reports'),
+             'telemetry_path': os.path.join(workdir, 'telemetry'),}
+    for name, path in paths.items():
+        setattr(config, name, path)
+    config.telemetry_source = 'local'
+    config.use_history_cache = True
+    os.makedirs(paths['path_to_monitor_reports'], exist_ok=True)
+    os.makedirs(paths['path_to_reports'], exist_ok=True)
+    return paths
+
+
+def run_size(years     : int,
+             workdir   : str,
+             repeat    : int,
+             seed      : int,
+             end       : datetime,
+             lgbm_trees: int,
+             stages    : Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    функция готовит данные на years лет истории в рабочей папке workdir
+    и замеряет все этапы (или только перечисленные в stages).
+    Выполняется в отдельном процессе, так как направляет config в рабочую папку
+    """
+    paths = configure(workdir)
+    models_path = os.path.join(workdir, 'models')
+
+    import pandas as pd
+    from dateutil.relativedelta import relativedelta
+
+    from benchmarks.syntheticdata import synthetic_history, synthetic_calendar, \
+        create_synthetic_db, write_telemetry
+    from benchmarks.dummymodels import make_rnn_model, make_lgbm_model, model_requirements
+    from database import close_connections, read_history
+    from historycache import sync_history_cache, read_cached_history
+    from predict import call_predictors, call_predictors_batch, resolve_predictors
+    from writetodb import write_to_db, write_many_to_db
+    from predictors.modelcache import model_cache
+    from preprocessing.timeseriesoutlier import clean_outliers, catch_time_series_outs, \
+        StreamingOutlierCleaner
+
+    # подготовка данных
+    setup_start = time.perf_counter()
+    start = end - relativedelta(years=years) - timedelta(days=HISTORY_MARGIN_DAYS)
+    last_fact = end - timedelta(days=TELEMETRY_LAG_DAYS) + timedelta(hours=11)
+    history = synthetic_history(start=start, end=end + timedelta(days=1), seed=seed)
+    calendar = synthetic_calendar(start=start, end=end + timedelta(days=HISTORY_MARGIN_DAYS))
+    db_counts = create_synthetic_db(path=paths['path_to_base'],
+                                    history=history,
+                                    calendar=calendar,
+                                    last_fact=last_fact)
+    write_telemetry(path=paths['telemetry_path'],
+                    history=history[history['datetime'] > last_fact - timedelta(days=30)])
+
+    predictor_specs, skipped_models = [], {}
+    for kind, modules in model_requirements().items():
+        missing = missing_modules(modules)
+        if missing:
+            skipped_models[kind] = missing
+            continue
+        model_path = os.path.join(models_path, kind)
+        if kind == 'lgbm':
+            make_lgbm_model(model_path=model_path, history=history, n_trees=lgbm_trees, seed=seed)
+        else:
+            make_rnn_model(model_path=model_path, history=history, seed=seed)
+        predictor_specs.append((kind, f'{kind}_bench', model_path))
+    predictors = resolve_predictors(predictor_specs)
+
+    # даты прогноза: первая дата, для которой в БД есть все исходные данные,
+    # и BATCH_DATES дат до нее
+    predict_date = datetime.combine(last_fact.date(), datetime.min.time()) + timedelta(days=1)
+    batch_dates = [predict_date - timedelta(days=i) for i in range(BATCH_DATES)][::-1]
+    predict_time = predict_date - timedelta(hours=13)
+    window = (predict_date - relativedelta(years=1) - timedelta(days=1), predict_date)
+
+    # прогнозы за последний полный месяц с фактами для мониторинга
+    check_date = datetime.combine(last_fact.date().replace(day=1), datetime.min.time()) \
+        - relativedelta(months=1)
+    facts = history[(history['datetime'] >= check_date) &
+                    (history['datetime'] < check_date + relativedelta(months=1))]
+    rng = np.random.default_rng(seed)
+    write_many_to_db({day: pd.DataFrame({'lgbm': group['power_true'].to_numpy() +
+                                                 rng.normal(0, 80, len(group)),
+                                         'rnn_v1': group['power_true'].to_numpy() +
+                                                   rng.normal(0, 90, len(group))})
+                      for day, group in facts.groupby(facts['datetime'].dt.floor('D'))})
+    close_connections()
+    setup_seconds = time.perf_counter() - setup_start
+
+    # прогнозы для записи - на даты после последней даты с данными (без совпадений)
+    write_dates = iter([predict_date + timedelta(days=i) for i in range(1, repeat + 2)])
+
+    def outlier_frame() -> Dict[str, Any]:
+        return {'df': history[['datetime', 'power_true', 'temperature']].copy()}
+
+    def indexed_frame() -> Dict[str, Any]:
+        return {'df': history.set_index('datetime')[['power_true']].copy()}
+
+    def stream_outliers(df: pd.DataFrame) -> None:
+        cleaner = StreamingOutlierCleaner(thresholds={'power_true': 650, 'temperature': 10},
+                                          time_col='datetime')
+        for chunk_start in range(0, len(df), 24 * 7):
+            cleaner.process(df.iloc[chunk_start:chunk_start + 24 * 7])
+        cleaner.flush()
+
+    def forecast_frame() -> Dict[str, Any]:
+        return {'data': pd.DataFrame({'lgbm': rng.normal(5500, 300, 24),
+                                      'rnn_v1': rng.normal(5500, 300, 24)}),
+                'date': next(write_dates)}
+
+    db_snapshot = os.path.join(workdir, 'snapshot.sqlite')
+    cache_snapshot = os.path.join(workdir, 'snapshot_cache')
+
+    def restore_before_update() -> Dict[str, Any]:
+        # догрузка изменяет БД и кэш: каждый повтор начинается с одного состояния
+        close_connections()
+        if not os.path.isfile(db_snapshot):
+            shutil.copyfile(paths['path_to_base'], db_snapshot)
+            if os.path.isdir(paths['path_to_history_cache']):
+                shutil.copytree(paths['path_to_history_cache'], cache_snapshot)
+        for suffix in ('-wal', '-shm'):
+            if os.path.isfile(paths['path_to_base'] + suffix):
+                os.remove(paths['path_to_base'] + suffix)
+        shutil.copyfile(db_snapshot, paths['path_to_base'])
+        shutil.rmtree(paths['path_to_history_cache'], ignore_errors=True)
+        if os.path.isdir(cache_snapshot):
+            shutil.copytree(cache_snapshot, paths['path_to_history_cache'])
+        return {}
+
+    def clear_cache() -> Dict[str, Any]:
+        shutil.rmtree(paths['path_to_history_cache'], ignore_errors=True)
+        return {}
+
+    def lgbm_stage(data: pd.DataFrame) -> None:
+        from predictors.lgbm.predictor_lgbm import lgbm_model
+        lgbm_model(data=data, date=[predict_time], model_path=os.path.join(models_path, 'lgbm'))
+
+    def rnn_stage(data: pd.DataFrame) -> None:
+        from predictors.rnn.predictor_rnn import rnn_model
+        rnn_model(data=data, date=[predict_time], model_path=os.path.join(models_path, 'rnn'))
+
+    def check_quality() -> None:
+        from monitor import check_the_quality
+        check_the_quality(check_date=check_date)
+
+    def update_db() -> None:
+        from updatedb import update_db_by_data_from_oik
+        update_db_by_data_from_oik()
+
+    def window_data() -> Dict[str, Any]:
+        return {'data': read_history(*window)}
+
+    no_setup = dict
+    # прогноз через call_predictors возможен, если доступна хотя бы одна модель
+    predictors_required = [] if predictor_specs else \
+        sorted({module for modules in model_requirements().values() for module in modules})
+
+    # этапы: (имя, необходимые модули, подготовка, вызов)
+    all_stages: List[Tuple[str, List[str], Callable[[], Dict[str, Any]], Callable]] = [
+        ('read_history', [], no_setup, lambda: read_history(*window)),
+        ('sync_history_cache', [], clear_cache, sync_history_cache),
+        ('read_cached_history', [], no_setup, lambda: read_cached_history(*window)),
+        ('lgbm_model', model_requirements()['lgbm'], window_data, lgbm_stage),
+        ('rnn_model', model_requirements()['rnn'], window_data, rnn_stage),
+        ('call_predictors', predictors_required, no_setup,
+         lambda: call_predictors(date=predict_date, predictors=predictors)),
+        ('call_predictors_batch', predictors_required, no_setup,
+         lambda: call_predictors_batch(dates=batch_dates, predictors=predictors)),
+        ('write_to_db', [], forecast_frame, write_to_db),
+        ('check_the_quality', ['matplotlib'], no_setup, check_quality),
+        ('catch_time_series_outs', [], indexed_frame,
+         lambda df: catch_time_series_outs(df=df, col_name='power_true', min_diff=650,
+                                           time_delta=1, freq='H')),
+        ('clean_outliers', [], outlier_frame,
+         lambda df: clean_outliers(df=df, thresholds={'power_true': 650, 'temperature': 10},
+                                   time_col='datetime')),
+        ('streaming_outlier_cleaner', [], outlier_frame, stream_outliers),
+        ('update_db_by_data_from_oik', [], restore_before_update, update_db),
+    ]
+
+    results = {}
+    for name, requires, setup, run in all_stages:
+        if stages and name not in stages:
+            continue
+        missing = missing_modules(requires)
+        if missing:
+            results[name] = {'skipped': f'не установлены {", ".join(missing)}'}
+            print(f'{years} лет, {name}: пропущен ({results[name]["skipped"]})')
+            continue
+        # первый повтор каждого этапа - с загрузкой моделей
+        model_cache.clear()
+        try:
+            results[name] = measure(run=run, setup=setup, repeat=repeat)
+        except Exception as error:
+            results[name] = {'error': f'{type(error).__name__}: {error}'}
+            print(f'{years} лет, {name}: ошибка {results[name]["error"]}')
+            continue
+        print(f'{years} лет, {name}: медиана {results[name]["median"]:.4f} с, '
+              f'пик памяти {results[name]["peak_mib"]:.1f} МиБ')
+    close_connections()
+
+    return {'hours': db_counts['hours'],
+            'days': db_counts['days'],
+            'setup_seconds': round(setup_seconds, 3),
+            'skipped_models': skipped_models,
+            'max_rss_mib': max_rss_mib(),
+            'stages': results,}
+
+
+def max_rss_mib() -> Optional[float]:
+    """
+    пиковый размер памяти процесса (недоступен в Windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # в macOS - байты, в Linux - КиБ
+    return round(max_rss / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def environment(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    сведения об окружении и параметрах запуска
+    """
+    versions = {}
+    for module in VERSIONED_MODULES:
+        if importlib.util.find_spec(module) is None:
+            versions[module] = None
+            continue
+        versions[module] = getattr(__import__(module), '__version__', 'unknown')
+    return {'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'versions': versions,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'end': args.end,
+            'lgbm_trees': args.lgbm_trees,}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    функция печатает сравнение медиан времени и пиков памяти с базовой линией
+    и возвращает перечень регрессий (превышений более чем на tolerance)
+    """
+    regressions = []
+    print(f'{"история":>8} {"этап":<28} {"время, с":>10} {"база, с":>10} {"x":>6} '
+          f'{"память, МиБ":>12} {"база, МиБ":>10} {"x":>6}')
+    for size, size_results in results['sizes'].items():
+        base_stages = baseline.get('sizes', {}).get(size, {}).get('stages', {})
+        for name, stage in size_results.get('stages', {}).items():
+            base = base_stages.get(name, {})
+            if 'median' not in stage or 'median' not in base:
+                continue
+            time_ratio = stage['median'] / base['median'] if base['median'] else 1.0
+            memory_ratio = stage['peak_mib'] / base['peak_mib'] if base['peak_mib'] else 1.0
+            print(f'{size:>8} {name:<28} {stage["median"]:>10.4f} {base["median"]:>10.4f} '
+                  f'{time_ratio:>6.2f} {stage["peak_mib"]:>12.1f} {base["peak_mib"]:>10.1f} '
+                  f'{memory_ratio:>6.2f}')
+            if time_ratio > 1 + tolerance:
+                regressions.append(f'{size} {name}: время x{time_ratio:.2f}')
+            if memory_ratio > 1 + tolerance:
+                regressions.append(f'{size} {name}: память x{memory_ratio:.2f}')
+    return regressions
+
+
+def main(args: argparse.Namespace) -> int:
+    """
+    функция выполняет замеры для каждого объема истории в отдельном процессе,
+    сохраняет результаты и сравнивает их с базовой линией.
+    Возвращает код возврата
+    """
+    workdir = args.workdir or tempfile.mkdtemp(prefix='benchmarks_')
+    results = {'environment': environment(args), 'sizes': {}}
+    try:
+        for years in args.years:
+            size_dir = os.path.join(workdir, f'{years}y')
+            os.makedirs(size_dir, exist_ok=True)
+            size_output = os.path.join(size_dir, 'result.json')
+            command = [sys.executable, '-m', 'benchmarks.run_benchmarks',
+                       '--child-years', str(years),
+                       '--child-output', size_output,
+                       '--workdir', size_dir,
+                       '--repeat', str(args.repeat),
+                       '--seed', str(args.seed),
+                       '--end', args.end,
+                       '--lgbm-trees', str(args.lgbm_trees)]
+            if args.stages:
+                command += ['--stages'] + args.stages
+            process = subprocess.run(command, cwd=ROOT, check=False)
+            if process.returncode != 0:
+                results['sizes'][f'{years}y'] = {'error': f'код возврата {process.returncode}'}
+                continue
+            with open(size_output, 'r', encoding='utf8') as file:
+                results['sizes'][f'{years}y'] = json.load(file)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = DEFAULT_BASELINE if args.save_baseline else args.output
+    with open(output, 'w', encoding='utf8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+    print(f'Результаты сохранены в {output}')
+
+    if args.save_baseline or args.no_compare:
+        return 0
+    if not os.path.isfile(args.baseline):
+        print(f'Базовая линия {args.baseline} не найдена: сохраните ее ключом --save-baseline '
+              f'на эталонной машине или запустите замеры с ключом --no-compare')
+        return 2
+    with open(args.baseline, 'r', encoding='utf8') as file:
+        baseline = json.load(file)
+    regressions = compare(results=results, baseline=baseline, tolerance=args.tolerance)
+    if regressions:
+        print('Регрессии относительно базовой линии:\n' + '\n'.join(regressions))
+        return 1
+    print('Регрессий относительно базовой линии нет')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 5, 20])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--end', type=str, default=datetime.now().strftime('%Y-%m-%d'))
+    parser.add_argument('--lgbm-trees', type=int, default=100)
+    parser.add_argument('--stages', type=str, nargs='+')
+    parser.add_argument('--workdir', type=str)
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--no-compare', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--child-years', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--child-output', type=str, help=argparse.SUPPRESS)
+    args_ = parser.parse_args()
+
+    if args_.child_years is None:
+        sys.exit(main(args_))
+
+    result = run_size(years=args_.child_years,
+                      workdir=args_.workdir,
+                      repeat=args_.repeat,
+                      seed=args_.seed,
+                      end=datetime.strptime(args_.end, '%Y-%m-%d'),
+                      lgbm_trees=args_.lgbm_trees,
+                      stages=args_.stages)
+    with open(args_.child_output, 'w', encoding='utf8') as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,108 @@
+"""
+модуль генерирует синтетические почасовые потребление, температуру и календарь
+выходных дней за несколько лет и записывает их в рабочую БД sqlite (схема версии 2)
+и в папку телеметрии для LocalDirectorySource.
+
+Значения определяются только зерном генератора и меткой времени,
+поэтому одинаковые параметры дают одинаковые данные
+"""
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from dbschema import create_schema
+from database import close_connections, insert_calendar, update_facts
+
+
+# праздники (месяц, день), дополнительно к субботам и воскресеньям
+HOLIDAYS = [(1, 1), (1, 2), (1, 7), (3, 8), (5, 1), (5, 9), (7, 3), (11, 7), (12, 25)]
+
+
+def synthetic_calendar(start: datetime, end: datetime) -> pd.DataFrame:
+    """
+    календарь суток [start, end] с колонками day и day_off
+    (выходные - суббота, воскресенье и праздники HOLIDAYS)
+    """
+    days = pd.date_range(start=start, end=end, freq='D')
+    holidays = pd.Series(list(zip(days.month, days.day))).isin(HOLIDAYS).to_numpy()
+    return pd.DataFrame({'day': days,
+                         'day_off': ((days.weekday >= 5) | holidays).astype(int)})
+
+
+def synthetic_history(start: datetime,
+                      end  : datetime,
+                      seed : int = 0) -> pd.DataFrame:
+    """
+    почасовые потребление (МВт) и температура за [start, end) с колонками
+    datetime, power_true, temperature.
+
+    Потребление - уровень около 5500 МВт с суточной, недельной и годовой
+    периодичностью и зависимостью от температуры, температура - годовой и суточный
+    ход с шумом. В ряды добавлены кратковременные выбросы для очистки
+    """
+    index = pd.date_range(start=start, end=end, freq='H', inclusive='left')
+    hours = index.hour.to_numpy()
+    year_phase = 2 * np.pi * (index.dayofyear.to_numpy() - 15) / 365.25
+    rng = np.random.default_rng(seed)
+
+    temperature = 7 - 12 * np.cos(year_phase) \
+        - 4 * np.cos(2 * np.pi * (hours - 3) / 24) \
+        + rng.normal(0, 2.5, len(index))
+
+    weekend = index.weekday.to_numpy() >= 5
+    power = 5500 + 450 * np.cos(year_phase) \
+        + 350 * np.sin(2 * np.pi * (hours - 6) / 24) \
+        - 300 * weekend \
+        - 12 * np.clip(temperature, None, 15) \
+        + rng.normal(0, 40, len(index))
+
+    # выбросы длительностью в один час
+    for values, size in ((power, 1200), (temperature, 20)):
+        outliers = rng.choice(len(index), size=len(index) // 500, replace=False)
+        values[outliers] += rng.choice([-size, size], size=len(outliers))
+
+    return pd.DataFrame({'datetime': index,
+                         'power_true': power.round(1),
+                         'temperature': temperature.round(1)})
+
+
+def create_synthetic_db(path      : str,
+                        history   : pd.DataFrame,
+                        calendar  : pd.DataFrame,
+                        last_fact : datetime) -> Dict[str, int]:
+    """
+    функция создает БД path (прежний файл удаляется) с календарем calendar
+    и фактами history до часа last_fact включительно.
+    Возвращает число записанных часов и суток
+    """
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.isfile(path + suffix):
+            os.remove(path + suffix)
+    conn = sqlite3.connect(path)
+    create_schema(conn)
+    conn.close()
+
+    insert_calendar(calendar, path=path)
+    counts = update_facts(history[history['datetime'] <= last_fact], path=path)
+    close_connections()
+    return {'hours': counts['inserted'] + counts['updated'], 'days': len(calendar)}
+
+
+def write_telemetry(path: str, history: pd.DataFrame, chunk_days: int = 30) -> int:
+    """
+    функция записывает факты history в папку path файлами .csv по chunk_days суток
+    в соглашении ОИК (метка часа сдвинута на час вперед, см. updatedb.py).
+    Возвращает число файлов
+    """
+    os.makedirs(path, exist_ok=True)
+    data = history.assign(datetime=history['datetime'] + timedelta(hours=1))
+    chunks = (data['datetime'] - data['datetime'].iloc[0]) // pd.Timedelta(days=chunk_days)
+    for number, chunk in data.groupby(chunks):
+        chunk.to_csv(os.path.join(path, f'telemetry_{number:05d}.csv'),
+                     index=False,
+                     date_format='%Y-%m-%d %H:%M:%S')
+    return int(chunks.nunique())
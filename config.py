@@ -4,3 +4,93 @@
 path_to_base = 'D:/Another/EnergyConsumptionPrediction/energy_consumpion.sqlite'
 path_to_monitor_reports = 'D:/Another/EnergyConsumptionPrediction/monitor_reports'
 path_to_reports = 'D:/Another/EnergyConsumptionPrediction/reports'
+
+# лимит памяти кэша загруженных моделей, байт
+model_cache_max_bytes = 512 * 1024 ** 2
+
+# число потоков для одновременного вызова моделей ансамбля в call_predictors
+# (0 - по числу моделей, 1 - последовательно)
+predictor_threads = 0
+# число потоков для параллельного вызова моделей lgbm по горизонтам (1 - последовательно)
+lgbm_horizon_threads = 1
+# вызывать модели lgbm через граф onnx (model.onnx в папке модели, см.
+# predictors/lgbm/export_onnx.py), если он есть, вместо model.pickle.
+# Граф считает во float32, прогнозы отличаются от model.pickle в пределах округления
+# float32 - включается после приемки таких прогнозов
+lgbm_use_onnx = False
+
+# настройки сессий onnxruntime (см. predictors/ortsession.py)
+# число потоков внутри оператора и между операторами, 0 - по выбору onnxruntime
+ort_intra_op_threads = 0
+ort_inter_op_threads = 0
+# уровень оптимизации графа: disable, basic, extended, all
+ort_graph_optimization = 'all'
+# порядок выполнения операторов: sequential или parallel (использует ort_inter_op_threads)
+ort_execution_mode = 'sequential'
+# арена памяти CPU и предварительное планирование памяти по форме входов
+ort_cpu_mem_arena = True
+ort_mem_pattern = True
+# сохранять оптимизированный граф в папку path_to_ort_cache и загружать его
+ort_cache_optimized_graph = True
+path_to_ort_cache = 'D:/Another/EnergyConsumptionPrediction/ort_cache'
+
+# проверка квантованной (INT8) модели rnn перед публикацией (см. predictors/rnn/quantize.py):
+# число последних суток с фактом для сравнения с исходной моделью и допустимый
+# относительный рост MAE и MAPE (доля)
+quantization_replay_days = 60
+quantization_max_degradation = 0.02
+
+# настройки подключения к БД (см. database.py)
+# объем отображаемой в память части файла БД, байт
+db_mmap_size = 256 * 1024 ** 2
+# размер страничного кэша подключения, КиБ
+db_cache_size_kib = 64 * 1024
+# время ожидания снятия блокировки БД другим процессом, с
+db_busy_timeout = 30
+# число разобранных запросов, хранимых подключением
+db_cached_statements = 256
+# число строк телеметрии, записываемых в БД одной транзакцией
+db_upsert_batch_size = 5000
+
+# источник телеметрии (см. telemetrysource.py): oik - макрос ОИК,
+# local - папка с файлами .csv/.parquet, http - HTTP-сервис
+telemetry_source = 'oik'
+telemetry_path = 'D:/Another/EnergyConsumptionPrediction/telemetry'
+telemetry_url = 'http://127.0.0.1:8765/'
+# длина части периода при догрузке телеметрии, сутки
+telemetry_chunk_days = 7
+# число одновременных запросов к источнику и повторов запроса при ошибке
+telemetry_workers = 4
+telemetry_retries = 3
+
+# колоночный кэш почасовой истории для подготовки исходных данных моделей
+# (см. historycache.py)
+path_to_history_cache = 'D:/Another/EnergyConsumptionPrediction/history_cache'
+use_history_cache = True
+
+# модели, используемые по умолчанию: (тип, имя, путь к модели), см. predict.resolve_predictors
+predictors = [
+    # ('lgbm', 'lgbm', r'predictors\lgbm\models\model_v0'),
+    ('rnn', 'rnn_v1', r'predictors\rnn\models\model_v1_2023-12-15'),
+]
+
+# сервис прогнозов (см. forecastservice.py)
+service_host = '127.0.0.1'
+service_port = 8780
+# время ожидания запросов для объединения в один пакет, мс
+service_batch_window_ms = 20
+
+# замеры этапов daily_predict.py и monthly_monitor.py в таблице pipeline_metrics
+# (см. pipelinemetrics.py)
+metrics_enabled = True
+# дополнительный замер пика памяти Python этапов через tracemalloc (замедляет код,
+# создающий много объектов, и не видит память onnxruntime и LightGBM; пик резидентной
+# памяти процесса замеряется всегда)
+metrics_trace_memory = False
+
+# число процессов для рисования картинок отчетов (см. rendering.py), 0 - по числу ядер
+render_workers = 0
+
+# число процессов для догоняющих прогнозов в monthly_monitor.py (см. backfill.py):
+# 1 - прогноз одним пакетом в основном процессе, 0 - по числу ядер
+backfill_workers = 1
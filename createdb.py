@@ -6,32 +6,15 @@ import sqlite3
 import pandas as pd
 
 from config import path_to_base
+from dbschema import create_schema, to_epoch_hours
 
 
 if __name__ == '__main__':
 
     conn = sqlite3.connect(path_to_base)
-    cursor = conn.cursor()
 
-    # Создадим таблицы
-    cursor.execute("""CREATE TABLE IF NOT EXISTS consumption_table
-                          (id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                          power_true  REAL,
-                          temperature REAL,
-                          datetime    TIMESTAMP)""")
-
-    cursor.execute("""CREATE TABLE IF NOT EXISTS day_off_table
-                          (id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                          day_off     INTEGER,
-                          datetime    TIMESTAMP,
-                          FOREIGN KEY (datetime) REFERENCES consumption_table (datetime))""")
-
-    cursor.execute("""CREATE TABLE IF NOT EXISTS predict_table
-                          (id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                          power_pred  REAL,
-                          model       TEXT,
-                          datetime    TIMESTAMP,
-                          FOREIGN KEY (datetime) REFERENCES consumption_table (datetime))""")
+    # Создадим таблицы и индексы
+    create_schema(conn)
 
     # заполним таблицу consumption_table
     df = pd.read_csv('./data/consumption_and_temperature_data.csv')
@@ -49,6 +32,7 @@ if __name__ == '__main__':
                        'one_hour_consumption': 'power_true',
                        'one_hour_temperature': 'temperature'},
              inplace=True)
+    df['datetime'] = to_epoch_hours(df['datetime'])
     df = df[['power_true', 'temperature', 'datetime']]
     # запишем в БД
     df.to_sql(name='consumption_table',
@@ -60,6 +44,7 @@ if __name__ == '__main__':
     df = pd.read_excel('./data/calendar.xlsx', index_col='day')
     df.reset_index(inplace=True)
     df.rename(columns={'day': 'datetime'}, inplace=True)
+    df['datetime'] = to_epoch_hours(df['datetime'])
     # запишем в БД
     df.to_sql(name='day_off_table',
               con=conn,
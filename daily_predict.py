@@ -1,45 +1,76 @@
 """
 Файл, вызвающий последовательно все модули для выполнения
 однократного предсказания на сутки вперед
+
+Тяжелые зависимости (pandas, модели, matplotlib, pywin32) импортируются только
+на тех ветках, где они нужны: проверка необходимости обновления БД обходится
+sqlite3. С ключом --timing выводится время запуска (импорта модулей)
+и общее время работы. Замеры этапов сохраняются
+в таблицу pipeline_metrics (см. pipelinemetrics.py)
 """
+import time
+START_TIME = time.perf_counter()
+
+import atexit
 import argparse
 from datetime import datetime, timedelta
 
+from config import predictors
+from pipelinemetrics import pipeline_run, span
 from updatedb import update_db_by_data_from_oik
-from predict import call_predictors
-# from predictors.lgbm.predictor_lgbm import lgbm_model
-from predictors.rnn.predictor_rnn import rnn_model
-from writetodb import write_to_db
-from makereport import make_report
-from connect_to_oik import load_data_to_oik
+
+STARTUP_TIME = time.perf_counter() - START_TIME
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--date', type=str)
-args = parser.parse_args()
+def print_timing() -> None:
+    """
+    выводит время запуска и общее время работы скрипта
+    """
+    print(f'Время запуска {STARTUP_TIME:.3f} с, '
+          f'общее время работы {time.perf_counter() - START_TIME:.3f} с')
+
 
 if __name__ == '__main__':
-    update_db_by_data_from_oik()
-
-    if args.date:
-        date = datetime.strptime(args.date, '%Y-%m-%d')
-    else:
-        date = (datetime.now() + timedelta(days=1)).replace(
-            hour=0,
-            minute=0,
-            second=0,
-            microsecond=0
-        )
-
-    pred = call_predictors(date=date, predictors=[
-        # (lgbm_model, 'lgbm', r'predictors\lgbm\model\model_v0'),
-        (rnn_model, 'rnn_v1', r'predictors\rnn\models\model_v1_2023-12-15'),
-    ])
-
-    if pred is None:
-        print(f'Прогноз на {str(date)} сделать невозможно...')
-    else:
-        write_to_db(data=pred.copy(), date=date)
-        make_report(data=pred.copy(), date=date)
-        load_data_to_oik(date=date)
-        print(f'Прогноз на {str(date)} выполнен, результаты сохранены')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--date', type=str)
+    parser.add_argument('--timing', action='store_true')
+    args = parser.parse_args()
+
+    if args.timing:
+        atexit.register(print_timing)
+
+    with pipeline_run('daily_predict'):
+        with span('update_db'):
+            update_db_by_data_from_oik()
+
+        if args.date:
+            date = datetime.strptime(args.date, '%Y-%m-%d')
+        else:
+            date = (datetime.now() + timedelta(days=1)).replace(
+                hour=0,
+                minute=0,
+                second=0,
+                microsecond=0
+            )
+
+        # модули моделей импортируются при первом вызове модели
+        from predict import call_predictors, resolve_predictors
+
+        with span('call_predictors'):
+            pred = call_predictors(date=date, predictors=resolve_predictors(predictors))
+
+        if pred is None:
+            print(f'Прогноз на {str(date)} сделать невозможно...')
+        else:
+            from writetodb import write_to_db
+            from makereport import make_report
+            from connect_to_oik import load_data_to_oik
+
+            with span('write_to_db') as stage:
+                write_to_db(data=pred.copy(), date=date)
+                stage.rows = pred.size
+            with span('make_report'):
+                make_report(data=pred.copy(), date=date)
+            with span('load_data_to_oik'):
+                load_data_to_oik(date=date)
+            print(f'Прогноз на {str(date)} выполнен, результаты сохранены')
@@ -0,0 +1,555 @@
+"""
+модуль доступа к базе данных.
+
+Содержит параметризованные запросы, которыми пользуются остальные модули.
+Подключения к БД (по одному настроенному подключению на поток) и запросы,
+не требующие pandas, находятся в dbconnection.py и доступны и отсюда.
+Тексты запросов постоянны, поэтому sqlite разбирает каждый из них один раз
+и берет из кэша подключения.
+
+Интервалы времени задаются полуоткрытыми: [start_time, end_time)
+"""
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import db_upsert_batch_size
+from dbconnection import get_connection, close_connections, last_consumption_hour, \
+    last_day_off_hour, first_hour, last_calendar_day, history_values_count, \
+    write_metrics, ensure_metrics
+from dbschema import ARCHIVE_SCHEMA, ERRORS_SCHEMA, \
+    to_epoch_hour, to_epoch_hours, from_epoch_hours
+
+
+def _hour_range(start_time: datetime, end_time: datetime) -> Dict[str, int]:
+    """
+    параметры запроса для интервала [start_time, end_time) в часах от начала эпохи
+    """
+    return {'start': to_epoch_hour(start_time), 'end': to_epoch_hour(end_time)}
+
+
+HISTORY_QUERY = """
+    SELECT
+        t.power_true,
+        t.temperature,
+        t.datetime,
+        (CASE WHEN
+            day_off_table.day_off = 1
+        THEN
+            1
+        ELSE
+            0
+        END) AS day_off
+    FROM
+        consumption_table AS t
+        LEFT JOIN day_off_table ON day_off_table.datetime = t.datetime - t.datetime % 24
+    WHERE
+        t.datetime >= :start AND
+        t.datetime < :end
+    ORDER BY
+        t.datetime;
+"""
+
+
+def read_history_hours(start_hour: int,
+                       end_hour  : int,
+                       path      : Optional[str] = None) -> pd.DataFrame:
+    """
+    функция возвращает почасовые потребление, температуру и признак выходного дня
+    за часы [start_hour, end_hour) (в часах от начала эпохи) в хронологическом порядке.
+    Колонка datetime остается номером часа
+    """
+    return pd.read_sql(sql=HISTORY_QUERY,
+                       con=get_connection(path),
+                       params={'start': start_hour, 'end': end_hour})
+
+
+def read_history(start_time: datetime,
+                 end_time  : datetime,
+                 path      : Optional[str] = None) -> pd.DataFrame:
+    """
+    функция возвращает почасовые потребление, температуру и признак выходного дня
+    за интервал [start_time, end_time) в хронологическом порядке
+    """
+    data = read_history_hours(start_hour=to_epoch_hour(start_time),
+                              end_hour=to_epoch_hour(end_time),
+                              path=path)
+    data['datetime'] = from_epoch_hours(data['datetime'])
+    return data
+
+
+DAYS_WITHOUT_FORECAST_QUERY = """
+    SELECT
+        t1.day * 24 AS dates
+    FROM
+        (SELECT
+            t1.datetime / 24 AS day
+        FROM
+            consumption_table AS t1
+        WHERE
+            t1.datetime >= :start AND
+            t1.datetime < :end
+        GROUP BY
+            t1.datetime / 24) AS t1
+        LEFT JOIN
+        (SELECT
+            t2.datetime / 24 AS day
+        FROM
+            predict_table AS t2
+        WHERE
+            t2.datetime >= :start AND
+            t2.datetime < :end
+        GROUP BY
+            t2.datetime / 24) AS t2 ON t1.day = t2.day
+    WHERE t2.day IS NULL
+    ORDER BY t1.day;
+"""
+
+
+def days_without_forecast(start_time: datetime,
+                          end_time  : datetime,
+                          path      : Optional[str] = None) -> pd.DataFrame:
+    """
+    функция возвращает датафрейм с колонкой dates - начала суток интервала
+    [start_time, end_time), которые есть в БД, но на которые нет прогнозов
+    """
+    df = pd.read_sql(sql=DAYS_WITHOUT_FORECAST_QUERY,
+                     con=get_connection(path),
+                     params=_hour_range(start_time, end_time))
+    df['dates'] = from_epoch_hours(df['dates'])
+    return df
+
+
+ERRORS_TABLE_EXISTS_QUERY = """
+    SELECT
+        COUNT(*)
+    FROM
+        sqlite_master
+    WHERE
+        type = 'table' AND
+        name = 'forecast_errors';
+"""
+
+DELETE_FORECAST_ERRORS_QUERY = """
+    DELETE FROM
+        forecast_errors
+    WHERE
+        datetime >= :start AND
+        datetime < :end;
+"""
+
+# агрегаты ошибок по суткам часов [:start, :end), границы - начала суток.
+# Ограничение снизу модуля факта при расчете процентной ошибки - как в sklearn
+REFRESH_FORECAST_ERRORS_QUERY = """
+    INSERT INTO
+        forecast_errors (model, datetime, abs_error_sum, pct_error_sum, count)
+    SELECT
+        t.model,
+        t.datetime - t.datetime % 24,
+        SUM(ABS(t.power_pred - c.power_true)),
+        SUM(ABS(t.power_pred - c.power_true) / MAX(ABS(c.power_true), 2.220446049250313e-16) * 100),
+        COUNT(*)
+    FROM
+        predict_table AS t
+        INNER JOIN consumption_table AS c ON c.datetime = t.datetime
+    WHERE
+        t.datetime >= :start AND
+        t.datetime < :end AND
+        t.power_pred IS NOT NULL AND
+        c.power_true IS NOT NULL
+    GROUP BY
+        t.datetime / 24,
+        t.model;
+"""
+
+# границы, охватывающие все часы БД
+ALL_HOURS = {'start': -2 ** 62, 'end': 2 ** 62}
+
+
+def _ensure_forecast_errors(conn: sqlite3.Connection) -> None:
+    """
+    создает таблицу forecast_errors, если ее нет, и заполняет ее по имеющимся
+    в БД прогнозам и факту. Вызывается внутри транзакции
+    """
+    if conn.execute(ERRORS_TABLE_EXISTS_QUERY).fetchone()[0] == 0:
+        conn.execute(ERRORS_SCHEMA)
+        conn.execute(REFRESH_FORECAST_ERRORS_QUERY, ALL_HOURS)
+    return None
+
+
+def _refresh_forecast_errors(conn: sqlite3.Connection, hours: np.ndarray) -> None:
+    """
+    пересчитывает агрегаты ошибок за сутки, в которые попадают часы hours
+    (в часах от начала эпохи). Вызывается внутри транзакции записи
+    """
+    _ensure_forecast_errors(conn)
+    days = [{'start': int(day) * 24, 'end': int(day) * 24 + 24}
+            for day in np.unique(np.asarray(hours, dtype='int64') // 24)]
+    conn.executemany(DELETE_FORECAST_ERRORS_QUERY, days)
+    conn.executemany(REFRESH_FORECAST_ERRORS_QUERY, days)
+    return None
+
+
+# запросы записи прогнозов для каждой из политик разрешения конфликтов
+WRITE_FORECAST_QUERIES = {
+    # имеющийся прогноз сохраняется
+    'skip': """
+        INSERT OR IGNORE INTO
+            predict_table (power_pred, datetime, model)
+        VALUES
+            (?, ?, ?);
+    """,
+    # имеющийся прогноз заменяется
+    'replace': """
+        INSERT INTO
+            predict_table (power_pred, datetime, model)
+        VALUES
+            (?, ?, ?)
+        ON CONFLICT (model, datetime) DO UPDATE SET
+            power_pred = excluded.power_pred;
+    """,
+    # имеющийся прогноз заменяется, если новый от него отличается
+    'version': """
+        INSERT INTO
+            predict_table (power_pred, datetime, model)
+        VALUES
+            (?, ?, ?)
+        ON CONFLICT (model, datetime) DO UPDATE SET
+            power_pred = excluded.power_pred
+        WHERE
+            predict_table.power_pred IS NOT excluded.power_pred;
+    """,
+}
+
+# перед заменой прогноз переносится в архив со следующим номером версии
+# (если новый прогноз отличается от него)
+ARCHIVE_FORECAST_QUERY = """
+    INSERT INTO
+        predict_archive_table (power_pred, model, datetime, version)
+    SELECT
+        t.power_pred,
+        t.model,
+        t.datetime,
+        COALESCE((SELECT
+                      MAX(a.version)
+                  FROM
+                      predict_archive_table AS a
+                  WHERE
+                      a.model = t.model AND
+                      a.datetime = t.datetime), 0) + 1
+    FROM
+        predict_table AS t
+    WHERE
+        t.datetime = ? AND
+        t.model = ? AND
+        t.power_pred IS NOT ?;
+"""
+
+
+def write_forecasts(forecasts: pd.DataFrame,
+                    policy   : str = 'skip',
+                    path     : Optional[str] = None) -> Dict[str, int]:
+    """
+    функция записывает в БД прогнозы любого числа моделей на любое число часов
+    одной транзакцией.
+
+    forecasts - датафрейм в длинном формате с колонками datetime, model, power_pred.
+    policy - политика при наличии в БД прогноза той же модели на тот же час:
+    skip - оставить имеющийся прогноз,
+    replace - заменить его,
+    version - заменить, сохранив прежний прогноз в predict_archive_table
+    (совпадающий с имеющимся прогноз пропускается, архив и версия не меняются).
+    Агрегаты ошибок forecast_errors за сутки прогнозов пересчитываются в той же транзакции.
+
+    Возвращает словарь с числом записанных (written) и пропущенных (skipped) строк
+    """
+    assert policy in WRITE_FORECAST_QUERIES, \
+        f'Неизвестная политика записи {policy}, доступны: {", ".join(WRITE_FORECAST_QUERIES)}'
+
+    hours = to_epoch_hours(forecasts['datetime']).tolist()
+    models = forecasts['model'].astype(str).tolist()
+    values = forecasts['power_pred'].astype(float).tolist()
+
+    conn = get_connection(path)
+    with conn:
+        if policy == 'version':
+            conn.execute(ARCHIVE_SCHEMA)
+            conn.executemany(ARCHIVE_FORECAST_QUERY, zip(hours, models, values))
+        changes_before = conn.total_changes
+        conn.executemany(WRITE_FORECAST_QUERIES[policy], zip(values, hours, models))
+        written = conn.total_changes - changes_before
+        if written:
+            _refresh_forecast_errors(conn, hours)
+    return {'written': written, 'skipped': len(hours) - written}
+
+
+FORECAST_MODELS_QUERY = """
+    SELECT
+        DISTINCT model
+    FROM
+        predict_table AS t
+    WHERE
+        t.datetime >= :start AND
+        t.datetime < :end;
+"""
+
+FACTS_QUERY = """
+    SELECT
+        t.power_true
+    FROM
+        consumption_table AS t
+    WHERE
+        t.power_true IS NOT NULL AND
+        t.datetime >= :start AND
+        t.datetime < :end;
+"""
+
+FORECASTS_QUERY = """
+    SELECT
+        t.datetime,
+        c.power_true,
+        t.model,
+        t.power_pred
+    FROM
+        predict_table AS t
+        INNER JOIN consumption_table AS c ON c.datetime = t.datetime
+    WHERE
+        t.datetime >= :start AND
+        t.datetime < :end;
+"""
+
+
+def forecast_models(start_time: datetime,
+                    end_time  : datetime,
+                    path      : Optional[str] = None) -> List[str]:
+    """
+    функция возвращает список моделей, прогнозы которых есть в интервале [start_time, end_time)
+    """
+    cursor = get_connection(path).execute(FORECAST_MODELS_QUERY,
+                                          _hour_range(start_time, end_time))
+    return [model[0] for model in cursor.fetchall()]
+
+
+def read_facts(start_time: datetime,
+               end_time  : datetime,
+               path      : Optional[str] = None) -> pd.DataFrame:
+    """
+    функция возвращает фактические значения потребления за интервал [start_time, end_time)
+    """
+    return pd.read_sql(sql=FACTS_QUERY,
+                       con=get_connection(path),
+                       params=_hour_range(start_time, end_time))
+
+
+def read_forecasts(start_time: datetime,
+                   end_time  : datetime,
+                   models    : List[str],
+                   path      : Optional[str] = None) -> pd.DataFrame:
+    """
+    функция возвращает датафрейм с индексом datetime, колонкой power_true
+    и колонками прогнозов моделей models за интервал [start_time, end_time).
+    Строки соответствуют часам, на которые есть хотя бы один прогноз
+    """
+    df = pd.read_sql(sql=FORECASTS_QUERY,
+                     con=get_connection(path),
+                     params=_hour_range(start_time, end_time))
+    df['datetime'] = from_epoch_hours(df['datetime'])
+    # развернем колонку с моделями (PIVOT)
+    preds = df.pivot(index='datetime', columns='model', values='power_pred') \
+        .reindex(columns=models)
+    preds.columns.name = None
+    facts = df.groupby('datetime')['power_true'].first()
+    return pd.concat([facts, preds], axis=1).sort_index()
+
+
+FORECAST_ERRORS_QUERY = """
+    SELECT
+        t.datetime,
+        t.model,
+        t.abs_error_sum,
+        t.pct_error_sum,
+        t.count
+    FROM
+        forecast_errors AS t
+    WHERE
+        t.datetime >= :start AND
+        t.datetime < :end
+    ORDER BY
+        t.datetime,
+        t.model;
+"""
+
+
+def read_forecast_errors(start_time: datetime,
+                         end_time  : datetime,
+                         path      : Optional[str] = None) -> pd.DataFrame:
+    """
+    функция возвращает суточные агрегаты ошибок прогнозов моделей за сутки,
+    начинающиеся в интервале [start_time, end_time): колонки datetime (начало суток),
+    model, abs_error_sum, pct_error_sum и count. Средние ошибки за любой период
+    получаются суммированием агрегатов его суток
+    """
+    conn = get_connection(path)
+    with conn:
+        _ensure_forecast_errors(conn)
+    df = pd.read_sql(sql=FORECAST_ERRORS_QUERY,
+                     con=conn,
+                     params=_hour_range(start_time, end_time))
+    df['datetime'] = from_epoch_hours(df['datetime'])
+    return df
+
+
+# строки без фактических данных (в том числе заготовки из календаря) дополняются,
+# уже заполненные строки не изменяются
+UPSERT_FACTS_QUERY = """
+    INSERT INTO
+        consumption_table (power_true, temperature, datetime)
+    VALUES
+        (?, ?, ?)
+    ON CONFLICT (datetime) DO UPDATE SET
+        power_true = excluded.power_true,
+        temperature = excluded.temperature
+    WHERE
+        consumption_table.power_true IS NULL OR
+        consumption_table.temperature IS NULL;
+"""
+
+EXISTING_HOURS_QUERY = """
+    SELECT
+        t.datetime
+    FROM
+        consumption_table AS t
+    WHERE
+        t.datetime >= ? AND
+        t.datetime <= ?;
+"""
+
+
+def update_facts(data: pd.DataFrame, path: Optional[str] = None) -> Dict[str, int]:
+    """
+    функция дописывает фактические потребление и температуру из датафрейма data
+    (колонки datetime, power_true, temperature) в БД.
+
+    Отсутствующие в БД часы добавляются, часы без фактических данных дополняются,
+    заполненные часы не изменяются. Запись ведется пакетами по db_upsert_batch_size
+    строк, каждый пакет - в своей транзакции, и затрагивает только пришедшие часы
+    (агрегаты ошибок forecast_errors пересчитываются за их сутки).
+
+    Возвращает словарь с числом добавленных (inserted), обновленных (updated)
+    и оставленных без изменений (skipped) строк
+    """
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    if len(data) == 0:
+        return counts
+
+    data = data[['datetime', 'power_true', 'temperature']] \
+        .drop_duplicates(subset='datetime', keep='last')
+    hours = to_epoch_hours(data['datetime']).to_numpy(dtype='int64')
+    power = data['power_true'].astype(float).to_numpy()
+    temperature = data['temperature'].astype(float).to_numpy()
+
+    conn = get_connection(path)
+    for start in range(0, len(hours), db_upsert_batch_size):
+        batch = slice(start, start + db_upsert_batch_size)
+        batch_hours = hours[batch]
+        with conn:
+            existing = [row[0] for row in conn.execute(EXISTING_HOURS_QUERY,
+                                                       (int(batch_hours.min()),
+                                                        int(batch_hours.max())))]
+            inserted = len(batch_hours) - int(np.isin(batch_hours, existing).sum())
+            changes_before = conn.total_changes
+            conn.executemany(UPSERT_FACTS_QUERY,
+                             zip(power[batch].tolist(),
+                                 temperature[batch].tolist(),
+                                 batch_hours.tolist()))
+            changes = conn.total_changes - changes_before
+            if changes:
+                _refresh_forecast_errors(conn, batch_hours)
+        counts['inserted'] += inserted
+        counts['updated'] += changes - inserted
+        counts['skipped'] += len(batch_hours) - changes
+    return counts
+
+
+INSERT_PLACEHOLDER_QUERY = """
+    INSERT OR IGNORE INTO
+        consumption_table (power_true, temperature, datetime)
+    VALUES
+        (NULL, NULL, ?);
+"""
+
+INSERT_DAY_OFF_QUERY = """
+    INSERT OR IGNORE INTO
+        day_off_table (day_off, datetime)
+    VALUES
+        (?, ?);
+"""
+
+
+def insert_calendar(days: pd.DataFrame, path: Optional[str] = None) -> None:
+    """
+    функция добавляет в БД сведения о выходных/рабочих днях из датафрейма days
+    (колонки day и day_off), а также пустые строки потребления на все часы этих суток
+    """
+    hours = pd.date_range(start=days['day'].min(),
+                          end=days['day'].max() + pd.Timedelta(hours=23),
+                          freq='H')
+    conn = get_connection(path)
+    with conn:
+        conn.executemany(INSERT_PLACEHOLDER_QUERY,
+                         [(to_epoch_hour(hour.to_pydatetime()),) for hour in hours])
+        conn.executemany(INSERT_DAY_OFF_QUERY,
+                         [(None if pd.isna(day_off) else int(day_off),
+                           to_epoch_hour(day.to_pydatetime()))
+                          for day, day_off in zip(days['day'], days['day_off'])])
+    return None
+
+
+# замеры последних :runs запусков (всех скриптов, если :script не задан)
+METRICS_QUERY = """
+    SELECT
+        t.run_id,
+        t.script,
+        t.stage,
+        t.started,
+        t.wall_seconds,
+        t.cpu_seconds,
+        t.rss_peak_mib,
+        t.peak_mib,
+        t.row_count,
+        t.status
+    FROM
+        pipeline_metrics AS t
+    WHERE
+        t.run_id IN (SELECT
+                         r.run_id
+                     FROM
+                         pipeline_metrics AS r
+                     WHERE
+                         :script IS NULL OR r.script = :script
+                     GROUP BY
+                         r.run_id
+                     ORDER BY
+                         MIN(r.started) DESC
+                     LIMIT :runs)
+    ORDER BY
+        t.started;
+"""
+
+
+def read_metrics(runs  : int,
+                 script: Optional[str] = None,
+                 path  : Optional[str] = None) -> pd.DataFrame:
+    """
+    функция возвращает замеры этапов последних runs запусков скрипта script
+    (или всех скриптов) в порядке начала этапов
+    """
+    conn = get_connection(path)
+    with conn:
+        ensure_metrics(conn)
+    return pd.read_sql(sql=METRICS_QUERY,
+                       con=conn,
+                       params={'runs': runs, 'script': script})
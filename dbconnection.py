@@ -0,0 +1,187 @@
+"""
+модуль подключений к базе данных и запросов, не требующих pandas.
+
+Хранит по одному настроенному подключению к БД на поток (подключение
+переиспользуется между вызовами). Запросы модуля нужны на путях запуска,
+которые должны завершаться без импорта pandas: проверка необходимости
+обновления БД и запись замеров этапов. Остальные запросы - в database.py
+"""
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Sequence, Tuple
+
+from config import path_to_base, db_cache_size_kib, db_mmap_size, db_busy_timeout, \
+    db_cached_statements
+from dbschema import METRICS_SCHEMA, from_epoch_hour
+
+
+# подключения текущего потока с ключом по пути к БД
+_local = threading.local()
+
+# режим журнала WAL позволяет читать БД (мониторинг) во время записи прогнозов
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL;',
+    'PRAGMA synchronous = NORMAL;',
+    f'PRAGMA mmap_size = {db_mmap_size};',
+    f'PRAGMA cache_size = -{db_cache_size_kib};',
+    'PRAGMA temp_store = MEMORY;',
+)
+
+
+def get_connection(path: Optional[str] = None) -> sqlite3.Connection:
+    """
+    функция возвращает подключение текущего потока к БД по пути path
+    (по умолчанию config.path_to_base), при первом обращении создает
+    и настраивает его
+    """
+    path = path or path_to_base
+    if not hasattr(_local, 'connections'):
+        _local.connections = {}
+    conn = _local.connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path,
+                               timeout=db_busy_timeout,
+                               cached_statements=db_cached_statements)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        _local.connections[path] = conn
+    return conn
+
+
+def close_connections() -> None:
+    """
+    функция закрывает все подключения текущего потока
+    """
+    connections: Dict[str, sqlite3.Connection] = getattr(_local, 'connections', {})
+    while connections:
+        _, conn = connections.popitem()
+        conn.close()
+    return None
+
+
+LAST_CONSUMPTION_QUERY = """
+    SELECT
+        MAX(t.datetime)
+    FROM
+        consumption_table AS t
+    WHERE
+        t.power_true IS NOT NULL;
+"""
+
+LAST_DAY_OFF_QUERY = """
+    SELECT
+        MAX(t.datetime)
+    FROM
+        day_off_table AS t
+    WHERE
+        t.day_off IS NOT NULL;
+"""
+
+FIRST_HOUR_QUERY = """
+    SELECT
+        MIN(t.datetime)
+    FROM
+        consumption_table AS t;
+"""
+
+LAST_CALENDAR_DAY_QUERY = """
+    SELECT
+        MAX(t.datetime)
+    FROM
+        day_off_table AS t;
+"""
+
+
+# число строк и заполненных значений потребления и температуры (меняется при дописывании,
+# заполнении пропусков и удалении строк, см. historycache.py)
+HISTORY_VALUES_QUERY = """
+    SELECT
+        COUNT(*) + COUNT(t.power_true) + COUNT(t.temperature)
+    FROM
+        consumption_table AS t;
+"""
+
+
+def _edge_hour(query: str, path: Optional[str]) -> Optional[datetime]:
+    """
+    выполняет запрос, возвращающий крайний номер часа, и переводит его в datetime
+    """
+    value = get_connection(path).execute(query).fetchone()[0]
+    return None if value is None else from_epoch_hour(value)
+
+
+def last_consumption_hour(path: Optional[str] = None) -> Optional[datetime]:
+    """
+    последний час, на который в БД имеются фактические данные о потреблении
+    """
+    return _edge_hour(LAST_CONSUMPTION_QUERY, path)
+
+
+def last_day_off_hour(path: Optional[str] = None) -> Optional[datetime]:
+    """
+    начало последних суток, на которые в БД имеются сведения о выходных/рабочих днях
+    """
+    return _edge_hour(LAST_DAY_OFF_QUERY, path)
+
+
+def first_hour(path: Optional[str] = None) -> Optional[datetime]:
+    """
+    первый час, имеющийся в БД
+    """
+    return _edge_hour(FIRST_HOUR_QUERY, path)
+
+
+def last_calendar_day(path: Optional[str] = None) -> Optional[datetime]:
+    """
+    начало последних суток, имеющихся в календаре БД
+    """
+    return _edge_hour(LAST_CALENDAR_DAY_QUERY, path)
+
+
+def history_values_count(path: Optional[str] = None) -> int:
+    """
+    суммарное число строк, значений потребления и значений температуры в БД
+    """
+    return get_connection(path).execute(HISTORY_VALUES_QUERY).fetchone()[0]
+
+
+INSERT_METRICS_QUERY = """
+    INSERT INTO
+        pipeline_metrics (run_id, script, stage, started, wall_seconds,
+                          cpu_seconds, peak_mib, row_count, status, rss_peak_mib)
+    VALUES
+        (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+METRICS_COLUMNS_QUERY = """
+    SELECT
+        name
+    FROM
+        pragma_table_info('pipeline_metrics');
+"""
+
+
+def ensure_metrics(conn: sqlite3.Connection) -> None:
+    """
+    создает таблицу pipeline_metrics, если ее нет, и добавляет в таблицу,
+    созданную до появления замера резидентной памяти, колонку rss_peak_mib.
+    Вызывается внутри транзакции
+    """
+    conn.execute(METRICS_SCHEMA)
+    if 'rss_peak_mib' not in [row[0] for row in conn.execute(METRICS_COLUMNS_QUERY)]:
+        conn.execute('ALTER TABLE pipeline_metrics ADD COLUMN rss_peak_mib REAL;')
+    return None
+
+
+def write_metrics(spans: Sequence[Tuple], path: Optional[str] = None) -> None:
+    """
+    функция записывает замеры этапов запуска одной транзакцией.
+    spans - кортежи (run_id, script, stage, started, wall_seconds,
+    cpu_seconds, peak_mib, row_count, status, rss_peak_mib)
+    """
+    conn = get_connection(path)
+    with conn:
+        ensure_metrics(conn)
+        conn.executemany(INSERT_METRICS_QUERY, spans)
+    return None
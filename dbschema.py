@@ -0,0 +1,148 @@
+"""
+модуль описывает схему базы данных (версия 2) и преобразование меток времени.
+
+Метки времени хранятся целым числом часов от начала эпохи (1970-01-01 00:00:00),
+сутки - номером часа их начала. Номер суток для часа h равен h / 24
+(целочисленное деление), начало суток - h - h % 24
+"""
+import sqlite3
+from datetime import datetime, timedelta
+
+
+SCHEMA_VERSION = 2
+
+EPOCH = datetime(1970, 1, 1)
+
+# замененные прогнозы (политика записи version), version нумеруется с 1
+# для каждой пары (model, datetime). Таблица создается и в БД версии 2 при первой записи
+ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS predict_archive_table
+        (id          INTEGER PRIMARY KEY AUTOINCREMENT,
+         power_pred  REAL,
+         model       TEXT,
+         datetime    INTEGER NOT NULL,
+         version     INTEGER NOT NULL,
+         UNIQUE (model, datetime, version));
+"""
+
+# замеры этапов запусков daily_predict.py и monthly_monitor.py (см. pipelinemetrics.py),
+# started - время начала этапа в секундах от начала эпохи, rss_peak_mib - пик
+# резидентной памяти процесса к концу этапа, peak_mib - пик памяти Python за этап
+# (tracemalloc, только при config.metrics_trace_memory).
+# Таблица создается и в БД версии 2 при первой записи
+METRICS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS pipeline_metrics
+        (id           INTEGER PRIMARY KEY AUTOINCREMENT,
+         run_id       TEXT NOT NULL,
+         script       TEXT NOT NULL,
+         stage        TEXT NOT NULL,
+         started      REAL NOT NULL,
+         wall_seconds REAL NOT NULL,
+         cpu_seconds  REAL NOT NULL,
+         peak_mib     REAL,
+         row_count    INTEGER,
+         status       TEXT NOT NULL,
+         rss_peak_mib REAL);
+"""
+
+# суточные агрегаты ошибок прогнозов моделей по часам с фактом: сумма абсолютных
+# ошибок (МВт), сумма абсолютных процентных ошибок (%) и число часов. datetime - начало суток.
+# Поддерживается при записи факта и прогнозов (см. database.py), создается
+# и заполняется по имеющимся данным при первом обращении к БД версии 2
+ERRORS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS forecast_errors
+        (id            INTEGER PRIMARY KEY AUTOINCREMENT,
+         model         TEXT NOT NULL,
+         datetime      INTEGER NOT NULL,
+         abs_error_sum REAL NOT NULL,
+         pct_error_sum REAL NOT NULL,
+         count         INTEGER NOT NULL,
+         UNIQUE (datetime, model));
+"""
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS consumption_table
+        (id          INTEGER PRIMARY KEY AUTOINCREMENT,
+         power_true  REAL,
+         temperature REAL,
+         datetime    INTEGER NOT NULL,
+         UNIQUE (datetime));
+
+    CREATE TABLE IF NOT EXISTS day_off_table
+        (id          INTEGER PRIMARY KEY AUTOINCREMENT,
+         day_off     INTEGER,
+         datetime    INTEGER NOT NULL,
+         UNIQUE (datetime),
+         FOREIGN KEY (datetime) REFERENCES consumption_table (datetime));
+
+    CREATE TABLE IF NOT EXISTS predict_table
+        (id          INTEGER PRIMARY KEY AUTOINCREMENT,
+         power_pred  REAL,
+         model       TEXT,
+         datetime    INTEGER NOT NULL,
+         UNIQUE (model, datetime),
+         FOREIGN KEY (datetime) REFERENCES consumption_table (datetime));
+""" + ARCHIVE_SCHEMA + METRICS_SCHEMA + ERRORS_SCHEMA
+
+INDEXES = """
+    -- чтение истории по диапазону часов без обращения к таблице
+    CREATE INDEX IF NOT EXISTS consumption_table_cover_idx
+        ON consumption_table (datetime, power_true, temperature);
+    -- последний час с фактическими данными
+    CREATE INDEX IF NOT EXISTS consumption_table_fact_idx
+        ON consumption_table (datetime) WHERE power_true IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS day_off_table_cover_idx
+        ON day_off_table (datetime, day_off);
+    -- чтение прогнозов всех моделей по диапазону часов
+    CREATE INDEX IF NOT EXISTS predict_table_cover_idx
+        ON predict_table (datetime, model, power_pred);
+"""
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    """
+    функция создает таблицы и индексы схемы версии 2 и проставляет версию схемы
+    """
+    conn.executescript(SCHEMA + INDEXES)
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION};')
+    conn.commit()
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """
+    функция возвращает версию схемы БД (0 - исходная схема с текстовыми датами)
+    """
+    return conn.execute('PRAGMA user_version;').fetchone()[0]
+
+
+def to_epoch_hour(value: datetime) -> int:
+    """
+    переводит метку времени в номер часа от начала эпохи
+    """
+    return (value - EPOCH) // timedelta(hours=1)
+
+
+def from_epoch_hour(value: int) -> datetime:
+    """
+    переводит номер часа от начала эпохи в метку времени
+    """
+    return EPOCH + timedelta(hours=value)
+
+
+def to_epoch_hours(values: 'pd.Series') -> 'pd.Series':
+    """
+    векторный вариант to_epoch_hour для колонки датафрейма
+    """
+    # pandas не нужен модулям, которым достаточно схемы и to_epoch_hour
+    import pandas as pd
+
+    return (pd.to_datetime(values) - EPOCH) // pd.Timedelta(hours=1)
+
+
+def from_epoch_hours(values: 'pd.Series') -> 'pd.Series':
+    """
+    векторный вариант from_epoch_hour для колонки датафрейма
+    """
+    import pandas as pd
+
+    return pd.to_datetime(values.astype('int64') * 3600, unit='s')
@@ -0,0 +1,226 @@
+"""
+Сервис прогнозов, работающий постоянно.
+
+Модели, скеллеры (через общий кэш моделей) и последние окна истории остаются
+в памяти между запросами, поэтому повторный прогноз не платит за запуск интерпретатора,
+импорт библиотек и загрузку моделей. Одновременные запросы объединяются в один
+пакетный вызов call_predictors_batch.
+
+Запуск:
+python forecastservice.py --port 8780
+
+Запросы:
+GET /predict?date=2024-03-01&date=2024-03-02 - прогнозы моделей и ансамбля на даты
+GET /stats - время обработки запросов и статистика кэша моделей
+"""
+import json
+import time
+import queue
+import argparse
+import threading
+import urllib.parse
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import predictors, service_host, service_port, service_batch_window_ms, \
+    use_history_cache
+from database import last_consumption_hour, last_day_off_hour, read_history
+from historycache import read_cached_history
+from predict import call_predictors_batch, resolve_predictors
+from predictors.modelcache import model_cache
+
+
+class HistoryWindows:
+    """
+    Окна истории, прочитанные для последних пакетов. Окно берется из памяти,
+    пока в БД не появились новые факты или сведения о выходных днях
+    """
+    def __init__(self, max_windows: int = 8):
+        self.max_windows = max_windows
+        self._windows: 'OrderedDict[Tuple[datetime, datetime], pd.DataFrame]' = OrderedDict()
+        self._state: Optional[Tuple[datetime, datetime]] = None
+
+    def read(self, start_time: datetime, end_time: datetime) -> pd.DataFrame:
+        """
+        Функция чтения окна истории для call_predictors_batch
+        """
+        state = (last_consumption_hour(), last_day_off_hour())
+        if state != self._state:
+            self._windows.clear()
+            self._state = state
+        key = (start_time, end_time)
+        if key not in self._windows:
+            read_data = read_cached_history if use_history_cache else read_history
+            self._windows[key] = read_data(start_time, end_time)
+            while len(self._windows) > self.max_windows:
+                self._windows.popitem(last=False)
+        self._windows.move_to_end(key)
+        return self._windows[key]
+
+
+class ForecastBatcher:
+    """
+    Объединяет запросы, пришедшие в течение batch_window секунд, в один вызов
+    call_predictors_batch. Все вызовы моделей выполняются в одном рабочем потоке
+    """
+    def __init__(self,
+                 predictors  : List[Tuple[Callable, str, str]],
+                 batch_window: float):
+        self.predictors = predictors
+        self.batch_window = batch_window
+        self.history = HistoryWindows()
+        self._requests: 'queue.Queue[Tuple[List[datetime], Future]]' = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, dates: List[datetime]) -> 'Future[Dict[datetime, pd.DataFrame]]':
+        """
+        Ставит запрос в очередь, результат - словарь {дата: прогнозы моделей}
+        """
+        future: Future = Future()
+        self._requests.put((dates, future))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.perf_counter() + self.batch_window
+            while time.perf_counter() < deadline:
+                try:
+                    batch.append(self._requests.get(timeout=deadline - time.perf_counter()))
+                except (queue.Empty, ValueError):
+                    break
+
+            dates = sorted({date for request_dates, _ in batch for date in request_dates})
+            try:
+                preds = call_predictors_batch(dates=dates,
+                                              predictors=self.predictors,
+                                              read_data=self.history.read)
+            except Exception as error:
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+            for request_dates, future in batch:
+                future.set_result({date: preds[date] for date in request_dates if date in preds})
+
+
+class LatencyStats:
+    """
+    Время обработки последних запросов
+    """
+    def __init__(self, max_size: int = 1000):
+        self._latencies: 'deque[float]' = deque(maxlen=max_size)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def add(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            self.requests += 1
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            requests = self.requests
+        if len(latencies) == 0:
+            return {'requests': requests}
+        return {'requests': requests,
+                'p50_ms'  : round(float(np.percentile(latencies, 50)), 2),
+                'p95_ms'  : round(float(np.percentile(latencies, 95)), 2),
+                'max_ms'  : round(float(latencies.max()), 2),}
+
+
+def preds_to_json(preds: Dict[datetime, pd.DataFrame]) -> Dict[str, Dict[str, List[float]]]:
+    """
+    прогнозы моделей с добавленным ансамблем в виде, пригодном для json
+    """
+    result = {}
+    for date, pred in preds.items():
+        pred = pred.assign(ensemble=pred.mean(axis=1))
+        result[str(date.date())] = {col: pred[col].round(3).tolist() for col in pred.columns}
+    return result
+
+
+def make_handler(batcher: ForecastBatcher, stats: LatencyStats) -> type:
+    """
+    класс обработчика HTTP-запросов сервиса
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, body: dict) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode('utf8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path == '/stats':
+                self._reply(200, {'latency': stats.summary(), 'model_cache': model_cache.stats()})
+                return
+            if url.path != '/predict':
+                self._reply(404, {'error': f'Неизвестный адрес {url.path}'})
+                return
+
+            start = time.perf_counter()
+            try:
+                dates = [datetime.strptime(value, '%Y-%m-%d')
+                         for value in urllib.parse.parse_qs(url.query)['date']]
+            except (KeyError, ValueError):
+                self._reply(400, {'error': 'Укажите даты прогноза: ?date=ГГГГ-ММ-ДД'})
+                return
+            try:
+                preds = batcher.submit(dates).result()
+            except Exception as error:
+                self._reply(500, {'error': str(error)})
+                return
+            latency = time.perf_counter() - start
+            stats.add(latency)
+
+            missing = [str(date.date()) for date in dates if date not in preds]
+            self._reply(200, {'predictions': preds_to_json(preds),
+                              'missing': missing,
+                              'latency_ms': round(latency * 1000, 2)})
+
+        def log_message(self, format, *args):
+            print(f'{self.address_string()} {format % args}')
+
+    return Handler
+
+
+def serve(host: str, port: int, warmup: bool = True) -> None:
+    """
+    функция запускает сервис прогнозов
+    """
+    batcher = ForecastBatcher(predictors=resolve_predictors(predictors),
+                              batch_window=service_batch_window_ms / 1000)
+    if warmup:
+        # прогрев: загрузка моделей и окна истории для последней доступной даты
+        last_fact = last_consumption_hour()
+        if last_fact is not None:
+            date = datetime.combine(last_fact.date(), datetime.min.time())
+            start = time.perf_counter()
+            batcher.submit([date]).result()
+            print(f'Модели загружены за {time.perf_counter() - start:.2f} с')
+
+    server = ThreadingHTTPServer((host, port), make_handler(batcher, LatencyStats()))
+    print(f'Сервис прогнозов запущен на http://{host}:{port}/')
+    server.serve_forever()
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default=service_host)
+    parser.add_argument('--port', type=int, default=service_port)
+    parser.add_argument('--no-warmup', action='store_true')
+    args = parser.parse_args()
+
+    serve(host=args.host, port=args.port, warmup=not args.no_warmup)
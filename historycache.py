@@ -0,0 +1,275 @@
+"""
+модуль содержит колоночный кэш почасовой истории (потребление, температура,
+признак выходного дня) в виде файлов, отображаемых в память (numpy.memmap).
+
+Строка кэша i соответствует часу start_hour + i (в часах от начала эпохи),
+часы, которых нет в БД, помечены в колонке exists нулем.
+Данные до последнего часа с фактом считаются неизменными, кроме пропусков
+(часов без строки, потребления или температуры): они запоминаются в описании кэша
+и перечитываются из БД при каждой синхронизации вместе со всем, что после
+последнего факта (заготовки календаря). Если после этого число строк и значений
+в кэше не совпадает с БД (например, строки удалены), кэш строится заново.
+
+Файлы колонок не изменяются после записи: синхронизация пишет новое поколение файлов
+и переключается на него атомарной заменой описания кэша (meta.json), поэтому
+процессы, отобразившие в память прежнее поколение, читают его без ошибок.
+Чтение возвращает потребление и температуру срезами файлов без копирования
+"""
+import os
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import path_to_base, path_to_history_cache
+from dbschema import to_epoch_hour, from_epoch_hour
+from database import first_hour, last_consumption_hour, last_day_off_hour, \
+    history_values_count, read_history_hours
+
+
+# колонки кэша и их типы
+COLUMNS = {'power_true' : np.float64,
+           'temperature': np.float64,
+           'day_off'    : np.int8,
+           'exists'     : np.uint8,}
+
+META_FILE = 'meta.json'
+
+# файлы прежних поколений удаляются не раньше, чем через это время после записи, с
+# (их еще могут открывать процессы, прочитавшие прежнее описание кэша)
+STALE_GENERATION_SECONDS = 600
+
+
+def _column_path(cache_path: str, col_name: str, generation: str) -> str:
+    """
+    путь к файлу колонки поколения generation
+    """
+    return os.path.join(cache_path, f'{col_name}.{generation}.bin')
+
+
+def _open_column(cache_path: str, col_name: str, meta: Dict[str, Any]) -> np.ndarray:
+    """
+    отображает файл колонки в память (только для чтения)
+    """
+    if meta['length'] == 0:
+        return np.zeros(0, dtype=COLUMNS[col_name])
+    return np.memmap(_column_path(cache_path, col_name, meta['generation']),
+                     dtype=COLUMNS[col_name],
+                     mode='r',
+                     shape=(meta['length'],))
+
+
+def _load_meta(cache_path: str) -> Optional[Dict[str, Any]]:
+    """
+    загружает описание кэша (None, если кэш еще не создан)
+    """
+    meta_path = os.path.join(cache_path, META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf8') as file:
+        return json.load(file)
+
+
+def _save_meta(cache_path: str, meta: Dict[str, Any]) -> None:
+    """
+    сохраняет описание кэша атомарно (после записи данных колонок).
+    Запись идет во временный файл процесса, поэтому кэш могут
+    синхронизировать несколько процессов сразу
+    """
+    meta_path = os.path.join(cache_path, META_FILE)
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf8') as file:
+        json.dump(meta, file)
+    os.replace(tmp_path, meta_path)
+    return None
+
+
+def _remove_stale_generations(cache_path: str, generation: str) -> None:
+    """
+    удаляет файлы колонок прежних поколений, записанные более STALE_GENERATION_SECONDS назад.
+    Файл, который еще отображен в память (под Windows), остается до следующей синхронизации
+    """
+    deadline = time.time() - STALE_GENERATION_SECONDS
+    for name in os.listdir(cache_path):
+        if not name.endswith('.bin') or name.endswith(f'.{generation}.bin'):
+            continue
+        file_path = os.path.join(cache_path, name)
+        try:
+            if os.path.getmtime(file_path) < deadline:
+                os.remove(file_path)
+        except OSError:
+            pass
+    return None
+
+
+def _db_state(db_path: str) -> Dict[str, Optional[int]]:
+    """
+    крайние часы и число значений БД, по которым определяется необходимость синхронизации
+    """
+    last_fact = last_consumption_hour(path=db_path)
+    last_day_off = last_day_off_hour(path=db_path)
+    return {'last_fact': None if last_fact is None else to_epoch_hour(last_fact),
+            'last_day_off': None if last_day_off is None else to_epoch_hour(last_day_off),
+            'values': history_values_count(path=db_path)}
+
+
+def _missing_ranges(columns: Dict[str, np.ndarray], start_hour: int, rows: int) -> List[List[int]]:
+    """
+    интервалы часов [начало, конец) среди первых rows строк кэша, для которых в БД
+    нет строки, потребления или температуры
+    """
+    missing = (columns['exists'][:rows] == 0) | \
+        np.isnan(columns['power_true'][:rows]) | np.isnan(columns['temperature'][:rows])
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], missing.astype(np.int8), [0]))))
+    return [[start_hour + int(begin), start_hour + int(end)]
+            for begin, end in zip(edges[0::2], edges[1::2])]
+
+
+def _place(columns: Dict[str, np.ndarray], data: pd.DataFrame, start_hour: int) -> None:
+    """
+    записывает строки БД data (колонка datetime - номер часа) в колонки кэша
+    """
+    positions = data['datetime'].to_numpy(dtype=np.int64) - start_hour
+    for col_name in ('power_true', 'temperature'):
+        columns[col_name][positions] = data[col_name].to_numpy(dtype=np.float64)
+    columns['day_off'][positions] = data['day_off'].to_numpy(dtype=np.int8)
+    columns['exists'][positions] = 1
+    return None
+
+
+def sync_history_cache(cache_path: Optional[str] = None,
+                       db_path   : Optional[str] = None,
+                       rebuild   : bool = False) -> int:
+    """
+    функция переносит в кэш изменения БД с последней синхронизации: перечитывает
+    пропуски и все, что после последнего факта, и записывает новое поколение файлов.
+    При rebuild=True (или если кэш построен по другой БД) кэш строится заново.
+
+    Возвращает число прочитанных из БД строк
+    """
+    cache_path = cache_path or path_to_history_cache
+    db_path = os.path.abspath(db_path or path_to_base)
+    os.makedirs(cache_path, exist_ok=True)
+
+    meta = None if rebuild else _load_meta(cache_path)
+    if meta is not None and (meta['db_path'] != db_path or 'generation' not in meta):
+        meta = None
+
+    state = _db_state(db_path)
+    if meta is None:
+        start = first_hour(path=db_path)
+        if start is None:
+            return 0
+        meta = {'db_path': db_path, 'start_hour': to_epoch_hour(start), 'length': 0,
+                'stable_end': to_epoch_hour(start), 'missing': [], 'generation': None}
+    start_hour = meta['start_hour']
+
+    # перечитаем из БД все начиная с первого часа без фактических данных
+    tail = read_history_hours(start_hour=meta['stable_end'],
+                              end_hour=np.iinfo(np.int64).max,
+                              path=db_path)
+    offset = meta['stable_end'] - start_hour
+    length = offset + (int(tail['datetime'].iloc[-1]) + 1 - meta['stable_end'] if len(tail) else 0)
+
+    columns = {col_name: np.zeros(length, dtype=dtype) for col_name, dtype in COLUMNS.items()}
+    for col_name in ('power_true', 'temperature'):
+        columns[col_name][offset:] = np.nan
+    for col_name, values in columns.items():
+        values[:offset] = _open_column(cache_path, col_name, meta)[:offset]
+
+    # пропуски до последнего факта могли быть заполнены
+    rows = len(tail)
+    for begin, end in meta['missing']:
+        data = read_history_hours(start_hour=begin, end_hour=end, path=db_path)
+        _place(columns, data, start_hour)
+        rows += len(data)
+    _place(columns, tail, start_hour)
+
+    # строки, удаленные или добавленные вне пропусков и хвоста, видны по числу значений
+    count = int(columns['exists'].sum()) + \
+        int(np.count_nonzero(~np.isnan(columns['power_true']))) + \
+        int(np.count_nonzero(~np.isnan(columns['temperature'])))
+    if count != state['values'] and not rebuild:
+        return sync_history_cache(cache_path=cache_path, db_path=db_path, rebuild=True)
+
+    last_fact = state['last_fact']
+    stable_end = meta['stable_end'] if last_fact is None else \
+        max(meta['stable_end'], min(last_fact + 1, start_hour + length))
+    generation = f'{time.time_ns():x}-{os.getpid()}'
+    for col_name, values in columns.items():
+        values.tofile(_column_path(cache_path, col_name, generation))
+
+    meta.update(length=length,
+                stable_end=stable_end,
+                missing=_missing_ranges(columns, start_hour, stable_end - start_hour),
+                generation=generation,
+                **state)
+    _save_meta(cache_path, meta)
+    _remove_stale_generations(cache_path, generation)
+
+    return rows
+
+
+def read_cached_history(start_time: datetime,
+                        end_time  : datetime,
+                        cache_path: Optional[str] = None,
+                        db_path   : Optional[str] = None) -> pd.DataFrame:
+    """
+    функция возвращает почасовые потребление, температуру и признак выходного дня
+    за интервал [start_time, end_time) в том же виде, что и database.read_history.
+
+    Если БД изменилась с последней синхронизации, кэш предварительно синхронизируется.
+    Колонки потребления и температуры - срезы файлов кэша без копирования
+    (только для чтения), если в интервале нет пропусков часов
+    """
+    cache_path = cache_path or path_to_history_cache
+    meta = _load_meta(cache_path)
+    if meta is None or meta['db_path'] != os.path.abspath(db_path or path_to_base) or \
+            any(meta.get(key) != value for key, value in _db_state(meta['db_path']).items()):
+        sync_history_cache(cache_path=cache_path, db_path=db_path)
+        meta = _load_meta(cache_path)
+
+    begin = min(max(to_epoch_hour(start_time) - meta['start_hour'], 0), meta['length'])
+    end = min(max(to_epoch_hour(end_time) - meta['start_hour'], begin), meta['length'])
+
+    try:
+        columns = {col_name: _open_column(cache_path, col_name, meta)[begin:end]
+                   for col_name in COLUMNS}
+    except FileNotFoundError:
+        # между чтением описания и открытием файлов другой процесс переключил кэш
+        # на новое поколение и удалил прежнее (или файлы удалены вручную - тогда кэш
+        # строится заново)
+        if _load_meta(cache_path) == meta:
+            sync_history_cache(cache_path=cache_path, db_path=db_path, rebuild=True)
+        return read_cached_history(start_time=start_time, end_time=end_time,
+                                   cache_path=cache_path, db_path=db_path)
+    hours = np.arange(meta['start_hour'] + begin, meta['start_hour'] + end, dtype=np.int64)
+
+    exists = columns.pop('exists')
+    if not exists.all():
+        # в БД есть пропуски часов - вернем только имеющиеся строки (с копированием)
+        rows = exists.astype(bool)
+        columns = {col_name: values[rows] for col_name, values in columns.items()}
+        hours = hours[rows]
+
+    # датафрейм из словаря с copy=False не объединяет колонки в общий блок,
+    # поэтому колонки потребления и температуры остаются срезами файлов
+    return pd.DataFrame({'power_true': columns['power_true'],
+                         'temperature': columns['temperature'],
+                         'datetime': (hours * 3600).astype('datetime64[s]').astype('datetime64[ns]'),
+                         'day_off': columns['day_off'].astype(np.int64),},
+                        copy=False)
+
+
+if __name__ == '__main__':
+    start_ = time.perf_counter()
+    print(f'В кэш записано {sync_history_cache()} строк за {time.perf_counter() - start_:.3f} с')
+
+    end_ = from_epoch_hour(_load_meta(path_to_history_cache)['last_fact'] + 1)
+    start_ = time.perf_counter()
+    df_ = read_cached_history(start_time=end_.replace(year=end_.year - 1), end_time=end_)
+    print(f'Чтение года истории из кэша: {time.perf_counter() - start_:.4f} с')
+    print(df_.tail())
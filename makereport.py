@@ -3,12 +3,28 @@
 а также сохраняет график как картинку в формате .jpg
 """
 from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 
 from config import path_to_reports
+from rendering import render_forecast, render_many
+
+
+def _write_table(data: pd.DataFrame, date: datetime) -> Tuple[Callable[..., None], Dict[str, Any]]:
+    """
+    записывает отчёт .xlsx с усредненным прогнозом моделей
+    и возвращает задание рисования картинки отчета
+    """
+    dates = [date + timedelta(hours=i) for i in range(24)]
+    report = pd.DataFrame({'power_pred': data.mean(axis=1).to_numpy()}, index=dates)
+    file_name = f'{path_to_reports}/Прогноз потребления электроэнергии на {date.date()}'
+    report.to_excel(f'{file_name}.xlsx')
+
+    return render_forecast, {'file_path': f'{file_name}.jpg',
+                             'values': report['power_pred'].to_numpy(),
+                             'title': f'Прогноз почасового потребления электроэнергии на {date.date()}'}
 
 
 def make_report(data: pd.DataFrame, date: datetime) -> None:
@@ -16,21 +32,26 @@ def make_report(data: pd.DataFrame, date: datetime) -> None:
     функция, формирующая отчёт в формате .xlsx,
     а также сохраняет график как картинку в формате .jpg
     """
-    dates = [date + timedelta(hours=i) for i in range(24)]
-    data['power_pred'] = data.mean(axis=1)
-    data.drop(data.columns[:-1], axis=1, inplace=True)
-    data.index = dates
-    data.to_excel(f'{path_to_reports}/Прогноз потребления электроэнергии на {date.date()}.xlsx')
+    func, kwargs = _write_table(data=data, date=date)
+    func(**kwargs)
+
+    return None
 
-    _, ax = plt.subplots(figsize=(6, 6))
 
-    ax.plot(range(24), data['power_pred'], label='Прогнозное значение потребления')
-    ax.set_xlabel('Время суток')
-    ax.set_ylabel('Среднечасовое потребление, МВт')
-    ax.set_title(f'Прогноз почасового потребления электроэнергии на {date.date()}')
+def write_tables(preds: Dict[datetime, pd.DataFrame]) -> List[Tuple[Callable[..., None], Dict[str, Any]]]:
+    """
+    функция записывает отчеты .xlsx на несколько дат (словарь {дата: прогнозы моделей})
+    и возвращает задания рисования их картинок для rendering.render_many
+    """
+    return [_write_table(data=data, date=date) for date, data in preds.items()]
 
-    plt.grid(True)
-    plt.savefig(f'{path_to_reports}/Прогноз потребления электроэнергии на {date.date()}.jpg')
+
+def make_reports(preds: Dict[datetime, pd.DataFrame]) -> None:
+    """
+    функция формирует отчеты на несколько дат (словарь {дата: прогнозы моделей},
+    как его возвращает call_predictors_batch). Картинки рисуются в пуле процессов
+    """
+    render_many(write_tables(preds))
 
     return None
 
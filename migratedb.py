@@ -0,0 +1,174 @@
+"""
+Скрипт переводит существующую базу данных на схему версии 2:
+метки времени становятся целыми номерами часов, добавляются ограничения
+уникальности и индексы. Миграция выполняется на месте в одной транзакции.
+
+Пример вызова:
+python migratedb.py --path energy_consumpion.sqlite
+"""
+import sqlite3
+import argparse
+from typing import Any, Dict, List, Tuple
+
+from config import path_to_base
+from dbschema import SCHEMA_VERSION, SCHEMA, INDEXES, schema_version
+from database import REFRESH_FORECAST_ERRORS_QUERY, ALL_HOURS
+
+
+# перенос данных в новые таблицы. При дублировании меток времени в consumption_table
+# сохраняется строка с фактическими данными, в predict_table - первый записанный прогноз
+MIGRATION = """
+    ALTER TABLE consumption_table RENAME TO consumption_table_v1;
+    ALTER TABLE day_off_table RENAME TO day_off_table_v1;
+    ALTER TABLE predict_table RENAME TO predict_table_v1;
+
+    {schema}
+
+    INSERT OR IGNORE INTO
+        consumption_table (power_true, temperature, datetime)
+    SELECT
+        t.power_true,
+        t.temperature,
+        CAST(strftime('%s', t.datetime) AS INTEGER) / 3600
+    FROM
+        consumption_table_v1 AS t
+    WHERE
+        t.datetime IS NOT NULL
+    ORDER BY
+        t.power_true IS NULL,
+        t.temperature IS NULL,
+        t.id;
+
+    INSERT OR IGNORE INTO
+        day_off_table (day_off, datetime)
+    SELECT
+        t.day_off,
+        CAST(strftime('%s', DATE(t.datetime)) AS INTEGER) / 3600
+    FROM
+        day_off_table_v1 AS t
+    WHERE
+        t.datetime IS NOT NULL
+    ORDER BY
+        t.day_off IS NULL,
+        t.id;
+
+    INSERT OR IGNORE INTO
+        predict_table (power_pred, model, datetime)
+    SELECT
+        t.power_pred,
+        t.model,
+        CAST(strftime('%s', t.datetime) AS INTEGER) / 3600
+    FROM
+        predict_table_v1 AS t
+    WHERE
+        t.datetime IS NOT NULL
+    ORDER BY
+        t.id;
+
+    DROP TABLE consumption_table_v1;
+    DROP TABLE day_off_table_v1;
+    DROP TABLE predict_table_v1;
+
+    {indexes}
+
+    PRAGMA user_version = {version};
+"""
+
+# строки исходной таблицы, метку времени которых не удается перевести в номер часа
+# (при переносе они были бы потеряны или слиты с другими строками)
+UNCONVERTIBLE_QUERY = """
+    SELECT
+        t.id,
+        t.datetime
+    FROM
+        {table} AS t
+    WHERE
+        CAST(strftime('%s', {value}) AS INTEGER) IS NULL
+    ORDER BY
+        t.id;
+"""
+# выражения меток времени таблиц, переводимые при переносе
+TIMESTAMPS = {'consumption_table': 't.datetime',
+              'day_off_table'    : 'DATE(t.datetime)',
+              'predict_table'    : 't.datetime',}
+
+
+class MigrationError(Exception):
+    """
+    Исключение, возникающее, если данные БД нельзя перенести на новую схему без потерь
+    """
+
+
+def unconvertible_rows(conn: sqlite3.Connection) -> Dict[str, List[Tuple[int, Any]]]:
+    """
+    функция возвращает для каждой таблицы исходной схемы строки (id, datetime),
+    метку времени которых не удается перевести в номер часа (пустую или
+    не разбираемую sqlite). Таблицы без таких строк не включаются
+    """
+    rows = {table: conn.execute(UNCONVERTIBLE_QUERY.format(table=table, value=value)).fetchall()
+            for table, value in TIMESTAMPS.items()}
+    return {table: table_rows for table, table_rows in rows.items() if table_rows}
+
+
+def migrate_db(path: str, vacuum: bool = True) -> bool:
+    """
+    функция переводит БД по пути path на схему версии 2.
+    Возвращает True, если миграция была выполнена, и False,
+    если БД уже имеет актуальную схему. Если метки времени части строк
+    не переводятся в номера часов, БД не изменяется и возникает MigrationError
+    """
+    conn = sqlite3.connect(path, isolation_level=None)
+    version = schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        print(f'БД уже имеет схему версии {version}')
+        conn.close()
+        return False
+
+    counts_before = {table: conn.execute(f'SELECT COUNT(*) FROM {table};').fetchone()[0]
+                     for table in ('consumption_table', 'day_off_table', 'predict_table')}
+
+    # строки с непереводимыми метками времени не отбрасываются молча
+    unconvertible = unconvertible_rows(conn)
+    if unconvertible:
+        conn.close()
+        details = '; '.join(f'{table}: {len(rows)} (id и datetime первых: '
+                            f'{", ".join(f"{row_id} {value!r}" for row_id, value in rows[:5])})'
+                            for table, rows in unconvertible.items())
+        raise MigrationError(f'Метки времени строк не переводятся в номера часов, '
+                             f'миграция не выполнена. Исправьте или удалите строки - {details}')
+
+    script = MIGRATION.format(schema=SCHEMA, indexes=INDEXES, version=SCHEMA_VERSION)
+    try:
+        conn.execute('BEGIN;')
+        for statement in script.split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        # агрегаты ошибок по перенесенным прогнозам и факту
+        conn.execute(REFRESH_FORECAST_ERRORS_QUERY, ALL_HOURS)
+        conn.execute('ANALYZE;')
+        conn.execute('COMMIT;')
+    except sqlite3.Error as error:
+        conn.execute('ROLLBACK;')
+        conn.close()
+        print(f'Ошибка {str(error)} при миграции БД, изменения отменены')
+        raise
+
+    for table, count_before in counts_before.items():
+        count_after = conn.execute(f'SELECT COUNT(*) FROM {table};').fetchone()[0]
+        print(f'{table}: {count_before} -> {count_after} записей')
+
+    if vacuum:
+        conn.execute('VACUUM;')
+    conn.close()
+
+    print(f'БД переведена на схему версии {SCHEMA_VERSION}')
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--path', type=str, default=path_to_base)
+    parser.add_argument('--no-vacuum', action='store_true')
+    args = parser.parse_args()
+
+    migrate_db(path=args.path, vacuum=not args.no_vacuum)
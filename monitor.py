@@ -1,173 +1,143 @@
 """
 модуль, выполняющий мониторинг качества предикта моделей
 """
-import sqlite3
+import argparse
 from datetime import datetime
+from typing import Any, Dict, List, Optional
 
 import pandas as pd
-import matplotlib.pyplot as plt
-from dateutil.relativedelta import relativedelta
-from sklearn.metrics import mean_absolute_error, mean_absolute_percentage_error
 
-from config import path_to_base, path_to_monitor_reports
+from config import path_to_monitor_reports
+from database import forecast_models, read_forecasts, read_forecast_errors
+from rendering import render_month, render_many
 
 
-def check_the_quality(check_date: datetime) -> None:
+def aggregate_errors(day_errors: pd.DataFrame,
+                     models    : List[str],
+                     keys      : pd.Series,
+                     groups    : pd.Index) -> pd.DataFrame:
     """
-    функция рассчитывает среднюю абсолютную ошибку
-    всех сделанных ранее прогнозов по отношению к фактическим
-    значениям потребления
+    функция рассчитывает MAE (МВт) и MAPE (%) прогнозов моделей models по группам
+    суток keys (сутки, месяцы) из суточных агрегатов ошибок (см. database.read_forecast_errors).
+    Часы без факта или прогноза модели не учитываются.
+
+    Возвращает датафрейм с индексом groups и колонками (mae|mape, модель),
+    группы и модели без ошибок заполняются NaN
+    """
+    sums = day_errors.groupby([keys, day_errors['model']])[['abs_error_sum', 'pct_error_sum', 'count']].sum()
+    errors = pd.concat({'mae': sums['abs_error_sum'] / sums['count'],
+                        'mape': sums['pct_error_sum'] / sums['count']}, axis=1).unstack('model')
+    return errors.reindex(index=groups,
+                          columns=pd.MultiIndex.from_product([['mae', 'mape'], models]))
+
+
+def write_month_report(file_path: str,
+                       month_str: str,
+                       month_df : pd.DataFrame,
+                       models   : List[str],
+                       errors   : pd.Series) -> None:
+    """
+    текстовый отчет за месяц: число записей и средние ошибки моделей
+    """
+    with open(file_path, 'w', encoding='utf8') as file:
+        file.write(f'За период {month_str} в БД {len(month_df)} записей за {len(month_df)//24} суток')
+        file.write('\n')
+        for model in models:
+            mae = errors[('mae', model)].round(1)
+            mape = errors[('mape', model)].round(1)
+            file.write(f'Средняя ошибка модели {model} составляет {mae} ({mape}) МВт (%)\n')
+    return None
+
 
-    на вход требует месяц периода в формате datetime
+def month_plot_days(month_df: pd.DataFrame,
+                    models  : List[str],
+                    errors  : pd.DataFrame) -> List[Dict[str, Any]]:
     """
-    check_date_str = check_date.strftime("%Y-%m")
-    start_date = check_date
-    end_date = start_date + relativedelta(months=1) - relativedelta(hours=1)
-
-    conn = sqlite3.connect(path_to_base)
-    cursor = conn.cursor()
-    # определим список уникальных моделей за указанный период
-    query = f"""
-        SELECT
-            DISTINCT model
-        FROM
-            predict_table AS t
-        WHERE
-            t.datetime BETWEEN'{start_date}' AND '{end_date}';
+    данные рисунка за месяц (см. rendering.render_month): по суткам факт и прогнозы
+    моделей, в заголовке - ошибки ансамбля за сутки
     """
+    days = []
+    for day, day_df in month_df.groupby(month_df.index.floor('D')):
+        title = f'{day.date()}'
+        if 'ensemble' in models:
+            mae = errors.loc[day, ('mae', 'ensemble')].round(1)
+            mape = errors.loc[day, ('mape', 'ensemble')].round(1)
+            title += f'\nMAE (MAPE): {mae} ({mape})'
+        days.append({'title': title,
+                     'hours': day_df.index.hour.to_numpy(),
+                     'true': day_df['power_true'].to_numpy(),
+                     'preds': {model: day_df[model].to_numpy() for model in models}})
+    return days
+
+
+def check_the_quality(check_date: datetime, last_month: Optional[datetime] = None) -> None:
+    """
+    функция рассчитывает среднюю абсолютную ошибку
+    всех сделанных ранее прогнозов по отношению к фактическим
+    значениям потребления
 
-    cursor.execute(query)
-    unique_models = [model[0] for model in cursor.fetchall()]
-
-    query = f"""
-        SELECT
-            t.power_true
-        FROM
-            consumption_table AS t
-        WHERE
-            t.power_true IS NOT NULL AND
-            t.datetime BETWEEN '{start_date}' AND '{end_date}';
+    на вход требует месяц периода в формате datetime.
+    Если задан последний месяц last_month, отчеты формируются за каждый месяц
+    от check_date до last_month включительно по одному чтению БД
     """
-    df = pd.read_sql(sql=query, con=conn)
-
-    if unique_models and len(df) > 0:
-        # сформируем перечни колонок для следующего динамического запроса
-        select_columns_inner = ', ' \
-            .join([
-                    f"MAX(CASE WHEN model = '{model}' THEN power_pred END) AS {model}"
-                    for model
-                    in unique_models
-                ])
-        select_columns_out = ', '.join(unique_models)
-        # данный запрос соберет PIVOT table разгруппировав колонку с моделями
-        # для этого мы предварительно получили список уникальных моделей
-        query = f"""
-                SELECT
-                    t.datetime,
-                    power_true,
-                    {select_columns_out}
-                FROM
-                    consumption_table
-                    INNER JOIN (
-                        SELECT
-                            datetime,
-                            {select_columns_inner}
-                        FROM
-                            predict_table
-                        WHERE
-                            datetime BETWEEN '{start_date}' AND '{end_date}'
-                        GROUP BY
-                            datetime
-                    ) AS t ON consumption_table.datetime = t.datetime
-                WHERE
-                    t.datetime BETWEEN '{start_date}' AND '{end_date}'
-                GROUP BY
-                    t.datetime
-            """
-
-        df = pd.read_sql(sql=query, con=conn)
-        conn.close()
-
-        df['datetime'] = pd.to_datetime(df['datetime'], format='%Y-%m-%d %H:%M:%S')
-        df.set_index('datetime', inplace=True)
-
-        with open(f'{path_to_monitor_reports}/report_{check_date_str}.txt',
-                  'w',
-                  encoding='utf8') as file:
-            file.write(f'За период {check_date_str} в БД {len(df)} записей за {len(df)//24} суток')
-            file.write('\n')
-            for model in unique_models:
-                tmp_df = pd.DataFrame(data={'power_true': df['power_true'],
-                                            'power_pred': df[model]}).dropna()
-                mae = mean_absolute_error(tmp_df['power_true'], tmp_df['power_pred']).round(1)
-                mape = mean_absolute_percentage_error(tmp_df['power_true'], tmp_df['power_pred']) * 100
-                mape = mape.round(1)
-                file.write(f'Средняя ошибка модели {model} составляет {mae} ({mape}) МВт (%)\n')
-
-        # все выбранные уникальные даты
-        uniq_dates = list(set(df.index.date))
-        uniq_dates.sort()
-
-        # нарисуем все предсказанные и реальные значения на одном холсте
-        nrows = len(uniq_dates)//7 + bool(len(uniq_dates)%7)
-        ncols = 7
-        _, axes = plt.subplots(nrows=nrows,
-                               ncols=ncols,
-                               figsize=(21, 3*len(uniq_dates)//7 + 3))
-
-        for i in range(nrows):
-            for j in range(ncols):
-                try:
-                    if nrows == 1:
-                        ax = axes[j]
-                    else:
-                        ax = axes[i, j]
-                    ax.plot(range(24),
-                            df[df.index.date == uniq_dates[i*7 + j]]['power_true'],
-                            color='blue',
-                            label='true')
-
-                    for model in unique_models:
-                        ax.plot(range(24),
-                                df[df.index.date == uniq_dates[i*7 + j]][model],
-                                label=model,
-                                alpha=0.6)
-
-                    ax.set_xticks(range(0, 24, 4))
-                    ax.set_yticks([])
-
-                    mae = mean_absolute_error(
-                        df[df.index.date == uniq_dates[i*7 + j]]['power_true'],
-                        df[df.index.date == uniq_dates[i*7 + j]]['ensemble']
-                    ).round(1)
-
-                    mape = mean_absolute_percentage_error(
-                        df[df.index.date == uniq_dates[i*7 + j]]['power_true'],
-                        df[df.index.date == uniq_dates[i*7 + j]]['ensemble']
-                    ) * 100
-                    mape = mape.round(1)
-
-                    ax.set_title(f'{uniq_dates[i*7 + j]}\nMAE (MAPE): {mae} ({mape})')
-                    ax.legend()
-
-                except IndexError:  # отловим ошибку, когда массив закончился
-                    if nrows == 1:
-                        ax = axes[j]
-                    else:
-                        ax = axes[i, j]
-                    ax.set_axis_off()
-
-        plt.tight_layout()
-        plt.savefig(f'{path_to_monitor_reports}/report_{check_date_str}.jpg')
-
-    else:
-        with open(f'{path_to_monitor_reports}/report_{check_date_str}.txt',
-                  'w',
-                  encoding='utf8') as file:
-            file.write(f'За период {check_date_str} в БД найдено 0 записей')
+    months = pd.period_range(start=check_date, end=last_month or check_date, freq='M')
+    start_date = months[0].to_timestamp().to_pydatetime()
+    end_date = (months[-1] + 1).to_timestamp().to_pydatetime()
+    # определим список уникальных моделей за весь период
+    unique_models = forecast_models(start_time=start_date, end_time=end_date)
+
+    month_frames, plots = {}, []
+    if unique_models:
+        # соберем прогнозы моделей в колонки (PIVOT) вместе с фактом
+        df = read_forecasts(start_time=start_date, end_time=end_date, models=unique_models)
+        month_keys = df.index.to_period('M')
+        month_frames = dict(tuple(df.groupby(month_keys)))
+        # ошибки по суткам и по месяцам для всех моделей - из суточных агрегатов
+        errors = read_forecast_errors(start_time=start_date, end_time=end_date)
+        day_errors = aggregate_errors(day_errors=errors,
+                                      models=unique_models,
+                                      keys=errors['datetime'],
+                                      groups=df.index.floor('D').unique())
+        month_errors = aggregate_errors(day_errors=errors,
+                                        models=unique_models,
+                                        keys=errors['datetime'].dt.to_period('M'),
+                                        groups=months)
+
+    for month in months:
+        month_str = month.strftime('%Y-%m')
+        month_df = month_frames.get(month)
+        # модели, прогнозы которых есть в этом месяце
+        models = [] if month_df is None else \
+            [model for model in unique_models if month_df[model].notna().any()]
+
+        if models and month_df['power_true'].notna().any():
+            write_month_report(file_path=f'{path_to_monitor_reports}/report_{month_str}.txt',
+                               month_str=month_str,
+                               month_df=month_df,
+                               models=models,
+                               errors=month_errors.loc[month])
+            plots.append((render_month,
+                          {'file_path': f'{path_to_monitor_reports}/report_{month_str}.jpg',
+                           'days': month_plot_days(month_df=month_df,
+                                                   models=models,
+                                                   errors=day_errors)}))
+        else:
+            with open(f'{path_to_monitor_reports}/report_{month_str}.txt',
+                      'w',
+                      encoding='utf8') as file:
+                file.write(f'За период {month_str} в БД найдено 0 записей')
+
+    # рисунки за все месяцы рисуются в пуле процессов
+    render_many(plots)
 
     return None
 
 
 if __name__ == '__main__':
-    check_the_quality(check_date = datetime.strptime('2023-10', '%Y-%m'))
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--start', type=str, default='2023-10')
+    parser.add_argument('--end', type=str)
+    args = parser.parse_args()
+
+    check_the_quality(check_date=datetime.strptime(args.start, '%Y-%m'),
+                      last_month=datetime.strptime(args.end, '%Y-%m') if args.end else None)
@@ -1,28 +1,41 @@
 """
 Файл, выполняющий месячный мониторинг качества модели
 """
+import time
+START_TIME = time.perf_counter()
+
 import os
+import atexit
 import argparse
 from datetime import datetime
 
 from dateutil.relativedelta import relativedelta
 
-from config import path_to_monitor_reports
-from accesstobase import check_base
-from predict import call_predictors
-from predictors.lgbm.predictor_lgbm import lgbm_model
-from predictors.rnn.predictor_rnn import rnn_model
-from writetodb import write_to_db
-from makereport import make_report
-from monitor import check_the_quality
-from connect_to_oik import load_data_to_oik
+from config import path_to_monitor_reports, predictors
+from pipelinemetrics import pipeline_run, span
+
+STARTUP_TIME = time.perf_counter() - START_TIME
+
 
+def print_timing() -> None:
+    """
+    выводит время запуска и общее время работы скрипта
+    """
+    print(f'Время запуска {STARTUP_TIME:.3f} с, '
+          f'общее время работы {time.perf_counter() - START_TIME:.3f} с')
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--date', type=str)
-args = parser.parse_args()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--date', type=str)
+    parser.add_argument('--timing', action='store_true')
+    # число процессов для догоняющих прогнозов (по умолчанию config.backfill_workers,
+    # 0 - по числу ядер)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    if args.timing:
+        atexit.register(print_timing)
 
     if args.date:
         date = datetime.strptime(args.date, '%Y-%m')
@@ -38,29 +51,67 @@ if __name__ == '__main__':
         print(f'Мониторинг за {date.strftime("%Y-%m")} выполнялся ранее')
 
     else:
+        with pipeline_run('monthly_monitor'):
+            # остальные модули нужны только если мониторинг еще не выполнялся
+            from accesstobase import check_base
+            from monitor import check_the_quality
+
+            with span('check_base'):
+                dates = check_base(date=date)
+
+            if dates is None:
+                print(f'За {date.strftime("%Y-%m")} были выполнены все прогнозы')
+            else:
+                from backfill import backfill
+                from writetodb import write_many_to_db
+                from makereport import write_tables
+                from connect_to_oik import load_data_to_oik
+                from rendering import render_many
+                from predictors.modelcache import stats_report
+
+                render_jobs = []
+
+                def store(part_dates, part_preds) -> None:
+                    """
+                    единственный писатель: прогнозы части дат записываются в БД одной
+                    транзакцией, затем формируются отчеты и выгружаются в ОИК в порядке дат
+                    """
+                    if part_preds:
+                        with span('write_many_to_db') as stage:
+                            write_many_to_db(preds=part_preds, policy='skip')
+                            stage.rows = sum(pred.size for pred in part_preds.values())
+
+                        with span('write_tables') as stage:
+                            render_jobs.extend(write_tables(
+                                preds={date_: pred.copy() for date_, pred in part_preds.items()}))
+                            stage.rows = len(part_preds)
 
-        dates = check_base(date=date)
+                    for date_ in part_dates:
+                        if date_ not in part_preds:
+                            print(f'Прогноз на {str(date_)} сделать невозможно...')
+                        else:
+                            print(f'Прогноз на {str(date_)} выполнен, результаты сохранены')
+                            with span('load_data_to_oik'):
+                                load_data_to_oik(date=date_)
+                    return None
 
-        if dates is None:
-            print(f'За {date.strftime("%Y-%m")} были выполнены все прогнозы')
-        else:
-            for date_ in dates['dates']:
+                # прогнозы на все пропущенные дни: одним пакетом или в пуле процессов
+                # (--workers), запись - в основном процессе по мере готовности.
+                # Модели загружаются в процессах пула, их кэши возвращаются в статистике
+                with span('backfill') as stage:
+                    preds, cache_stats = backfill(dates=list(dates['dates']),
+                                                  specs=predictors,
+                                                  on_ready=store,
+                                                  workers=args.workers)
+                    stage.rows = len(preds)
 
-                pred = call_predictors(date=date_,
-                                       predictors=[
-                    # (lgbm_model, 'lgbm'),
-                    # (rnn_model, 'rnn'),
-                    (rnn_model, 'rnn_v1', r'predictors\rnn\models\model_v1_2023-12-15'),
-                ])
+                # картинки отчетов по всем датам рисуются в пуле процессов
+                with span('render_reports') as stage:
+                    stage.rows = render_many(render_jobs)
 
-                if pred is None:
-                    print(f'Прогноз на {str(date_)} сделать невозможно...')
-                else:
-                    write_to_db(data=pred.copy(), date=date_)
-                    make_report(data=pred.copy(), date=date_)
-                    print(f'Прогноз на {str(date_)} выполнен, результаты сохранены')
-                    load_data_to_oik(date=date_)
+                print(stats_report(cache_stats, processes=cache_stats['processes']))
 
-        check_the_quality(check_date=date)
+            with span('check_the_quality'):
+                check_the_quality(check_date=date)
 
-        print(f'Выполнен мониторинг за {date.strftime("%Y-%m")}')
+            print(f'Выполнен мониторинг за {date.strftime("%Y-%m")}')
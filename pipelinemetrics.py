@@ -0,0 +1,206 @@
+"""
+модуль замеряет этапы запусков daily_predict.py и monthly_monitor.py.
+
+Запуск скрипта оборачивается в pipeline_run, этапы - в span. Для каждого этапа
+сохраняются время (по часам и процессорное время процесса), пик резидентной памяти
+процесса к концу этапа и число обработанных строк. Пик резидентной памяти учитывает
+и память, выделенную библиотеками моделей (onnxruntime, LightGBM), и не сбрасывается:
+рост пика за этап виден по сравнению с предыдущими этапами.
+Замеры накапливаются в памяти и записываются в таблицу pipeline_metrics
+одной транзакцией по окончании запуска. Вне pipeline_run span ничего не записывает,
+поэтому этапы библиотечных функций можно размечать без условий.
+
+При config.metrics_trace_memory дополнительно замеряется пик памяти Python сверх занятой
+на начало этапа (tracemalloc замедляет код, создающий много объектов, поэтому
+по умолчанию выключен). Пик памяти Python вложенных этапов учитывается и во внешних.
+tracemalloc общий для процесса, поэтому пик памяти Python замеряется только у этапов
+потока, открывшего запуск; этапы других потоков (например, моделей в пуле потоков
+call_predictors) его не сохраняют, а их память учитывается в пике внешнего этапа.
+
+Сводка по последним запускам:
+python pipelinemetrics.py --runs 30 --script daily_predict
+"""
+import sys
+import time
+import uuid
+import argparse
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import metrics_enabled, metrics_trace_memory
+from dbconnection import write_metrics
+
+
+# текущий запуск: идентификатор, имя скрипта и завершенные этапы
+_run: Optional[Dict[str, Any]] = None
+# стек открытых этапов потока
+_local = threading.local()
+
+
+class Span:
+    """
+    Открытый этап. Число обработанных строк задается атрибутом rows
+    """
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.rows: Optional[int] = None
+        # наибольший пик памяти вложенных этапов (tracemalloc сбрасывается в каждом)
+        self.peak = 0
+
+
+def peak_rss_mib() -> Optional[float]:
+    """
+    пик резидентной памяти процесса с его запуска, МиБ (None, если замер недоступен)
+    """
+    if sys.platform == 'win32':
+        try:
+            import win32api
+            import win32process
+        except ImportError:
+            return None
+        info = win32process.GetProcessMemoryInfo(win32api.GetCurrentProcess())
+        return round(info['PeakWorkingSetSize'] / 1024 ** 2, 3)
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # в macOS - байты, в Linux - КиБ
+    return round(max_rss / (1024 ** 2 if sys.platform == 'darwin' else 1024), 3)
+
+
+def _stack() -> List[Span]:
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def span(stage: str) -> Iterator[Span]:
+    """
+    этап запуска. Замер сохраняется, если открыт pipeline_run,
+    в том числе при исключении (со статусом error)
+    """
+    current = Span(stage)
+    run = _run
+    if run is None:
+        yield current
+        return
+
+    stack = _stack()
+    tracing = tracemalloc.is_tracing() and threading.get_ident() == run['thread']
+    if tracing:
+        start_memory, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, peak)
+        tracemalloc.reset_peak()
+    stack.append(current)
+    started = time.time()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    status = 'error'
+    try:
+        yield current
+        status = 'ok'
+    finally:
+        wall_seconds = time.perf_counter() - wall_start
+        cpu_seconds = time.process_time() - cpu_start
+        stack.pop()
+        peak_mib = None
+        if tracing and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], current.peak)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            peak_mib = round((peak - start_memory) / 1024 ** 2, 3)
+        with run['lock']:
+            run['spans'].append((run['run_id'], run['script'], stage, started,
+                                 wall_seconds, cpu_seconds, peak_mib, current.rows, status,
+                                 peak_rss_mib()))
+
+
+@contextmanager
+def pipeline_run(script: str, path: Optional[str] = None) -> Iterator[Optional[str]]:
+    """
+    запуск скрипта script: весь запуск замеряется как этап total,
+    по окончании замеры всех этапов записываются в БД path (по умолчанию config.path_to_base).
+    Возвращает идентификатор запуска (None, если замеры отключены в config)
+    """
+    global _run
+
+    if not metrics_enabled:
+        yield None
+        return
+
+    started_tracing = metrics_trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    run_id = f'{datetime.now().strftime("%Y%m%d%H%M%S")}-{uuid.uuid4().hex[:8]}'
+    _run = {'run_id': run_id, 'script': script, 'spans': [], 'lock': threading.Lock(),
+            'thread': threading.get_ident()}
+    try:
+        with span('total'):
+            yield run_id
+    finally:
+        run, _run = _run, None
+        if started_tracing:
+            tracemalloc.stop()
+        try:
+            write_metrics(run['spans'], path=path)
+        except Exception as error:
+            # сбой записи замеров не должен прерывать работу скрипта
+            print(f'Не удалось сохранить замеры этапов: {str(error)}')
+
+
+def summarize_metrics(runs  : int = 30,
+                      script: Optional[str] = None,
+                      path  : Optional[str] = None) -> 'pd.DataFrame':
+    """
+    функция возвращает сводку по этапам последних runs запусков скрипта script
+    (или всех скриптов): число замеров, процентили времени, медиану
+    процессорного времени, максимум пика резидентной памяти, 95-й процентиль пика
+    памяти Python (если замерялся), медиану числа строк
+    и число ошибок. Этапы упорядочены по времени начала в запуске
+    """
+    import pandas as pd
+    from database import read_metrics
+
+    df = read_metrics(runs=runs, script=script, path=path)
+    if len(df) == 0:
+        return pd.DataFrame()
+
+    df[['rss_peak_mib', 'peak_mib', 'row_count']] = \
+        df[['rss_peak_mib', 'peak_mib', 'row_count']].astype(float)
+    df['offset'] = df['started'] - df.groupby('run_id')['started'].transform('min')
+    grouped = df.groupby(['script', 'stage'])
+    summary = pd.DataFrame({
+        'spans'       : grouped.size(),
+        'runs'        : grouped['run_id'].nunique(),
+        'wall_p50_s'  : grouped['wall_seconds'].quantile(0.5),
+        'wall_p90_s'  : grouped['wall_seconds'].quantile(0.9),
+        'wall_p95_s'  : grouped['wall_seconds'].quantile(0.95),
+        'wall_max_s'  : grouped['wall_seconds'].max(),
+        'cpu_p50_s'   : grouped['cpu_seconds'].quantile(0.5),
+        'rss_max_mib' : grouped['rss_peak_mib'].max(),
+        'peak_p95_mib': grouped['peak_mib'].quantile(0.95),
+        'rows_p50'    : grouped['row_count'].median(),
+        'errors'      : grouped['status'].apply(lambda status: int((status != 'ok').sum())),
+        'offset'      : grouped['offset'].median(),
+    })
+    return summary.sort_values(['script', 'offset']).drop(columns='offset').round(3)
+
+
+if __name__ == '__main__':
+    import pandas as pd
+
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=30)
+    parser.add_argument('--script', type=str)
+    args = parser.parse_args()
+
+    summary_ = summarize_metrics(runs=args.runs, script=args.script)
+    if len(summary_) == 0:
+        print('В БД нет замеров этапов')
+    else:
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(summary_)
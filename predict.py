@@ -2,15 +2,20 @@
 модуль обращется к БД, получает данные для предсказания электропотребления
 на предстоящие сутки и передает их моделям на вход
 """
-import sqlite3
-from typing import List, Tuple, Callable, Optional
+from importlib import import_module
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple, Callable, Optional
 from datetime import datetime, timedelta
 
 from dateutil.relativedelta import relativedelta
 
 import pandas as pd
 
-from config import path_to_base
+from config import use_history_cache, predictor_threads
+from database import last_consumption_hour, last_day_off_hour, read_history
+from historycache import read_cached_history
+from pipelinemetrics import span
+from preprocessing.preparedinput import prepare_input
 
 
 def call_predictors(date: datetime,
@@ -24,99 +29,131 @@ def call_predictors(date: datetime,
     А также лист кортежей с функциями, которые делают предсказания,
     и их строковые представления
     """
-    conn = sqlite3.connect(path_to_base)
-    cursor = conn.cursor()
-    # получим последнюю дату, на которую в БД имеются записи о потреблении и температуре
-    query = """
-        SELECT
-            MAX(t.datetime)
-        FROM
-            consumption_table AS t
-        WHERE
-            t.power_true IS NOT NULL;
-        """
-    cursor.execute(query)
-    max_datetime_in_db_str = cursor.fetchone()[0]
-    max_datetime_in_db = datetime.strptime(max_datetime_in_db_str, '%Y-%m-%d %H:%M:%S')
-    if max_datetime_in_db.date() < (date - timedelta(days=1)).date():
-        # в случае отстутствия исходных данных:
-        print(f'В БД пока нет данных для прогноза на {date.date()}')
-        return None
+    return call_predictors_batch(dates=[date], predictors=predictors).get(date)
+
+
+def call_predictors_batch(dates: List[datetime],
+                          predictors: List[Tuple[Callable, str, str]],
+                          read_data: Optional[Callable[[datetime, datetime], pd.DataFrame]] = None,
+                          ) -> Dict[datetime, pd.DataFrame]:
+    """
+    пакетный вариант call_predictors для списка дат.
+
+    Одним запросом выкачивает из БД непрерывное окно истории, покрывающее все даты,
+    и вызывает каждую модель один раз сразу для всех дат. Модели вызываются
+    одновременно в пуле из predictor_threads потоков (onnxruntime и lightgbm
+    отпускают GIL), поэтому ансамбль работает примерно как самая долгая модель.
+    Окно истории разбирается один раз в общие исходные данные (PreparedInput):
+    модели читают их без копирования, а признаки, общие для нескольких моделей
+    (например, для версий одной модели), вычисляются один раз.
+    Функцией read_data(start_time, end_time) можно подменить чтение окна истории
+    (по умолчанию - кэш истории или БД)
 
+    Возвращает словарь {дата: датафрейм с предиктами моделей}.
+    Даты, для которых в БД нет исходных данных, в словарь не попадают
+    """
+    # получим последнюю дату, на которую в БД имеются записи о потреблении и температуре
+    max_consumption_in_db = last_consumption_hour()
     # получим последнюю дату, на которую в БД имеются записи о выходных/рабочих днях
-    query = """
-        SELECT
-            MAX(t.datetime)
-        FROM
-            day_off_table AS t
-        WHERE
-            t.day_off IS NOT NULL;
-        """
-    cursor.execute(query)
-    max_datetime_in_db_str = cursor.fetchone()[0]
-    max_datetime_in_db = datetime.strptime(max_datetime_in_db_str, '%Y-%m-%d 00:00:00')
-    if max_datetime_in_db.date() < date.date():
-        # в случае отстутствия исходных данных:
-        print(f'В БД пока нет сведений о выходных/рабочих днях на {date.date()}')
-        return None
-    query = """
-        SELECT
-            MAX(t.datetime)
-        FROM
-            day_off_table AS t
-        WHERE
-            t.day_off IS NOT NULL;
-        """
+    max_day_off_in_db = last_day_off_hour()
+
+    available_dates = []
+    for date in dates:
+        if max_consumption_in_db.date() < (date - timedelta(days=1)).date():
+            # в случае отстутствия исходных данных:
+            print(f'В БД пока нет данных для прогноза на {date.date()}')
+        elif max_day_off_in_db.date() < date.date():
+            # в случае отстутствия исходных данных:
+            print(f'В БД пока нет сведений о выходных/рабочих днях на {date.date()}')
+        else:
+            available_dates.append(date)
+
+    if not available_dates:
+        return {}
 
     # в случае наличия всех данных:
-    start_time = (date - relativedelta(years=1)).replace(hour=0,
-                                                         minute=0,
-                                                         second=0,
-                                                         microsecond=0)
-    end_time = date.replace(hour=23,
-                            minute=0,
-                            second=0,
-                            microsecond=0)
+    # окно истории от года до самой ранней даты и до конца самой поздней
+    start_time = (min(available_dates) - relativedelta(years=1)).replace(hour=0,
+                                                                         minute=0,
+                                                                         second=0,
+                                                                         microsecond=0)
+    end_time = (max(available_dates) + timedelta(days=1)).replace(hour=0,
+                                                                  minute=0,
+                                                                  second=0,
+                                                                  microsecond=0)
     # данное время будет передано моделям для подготовки исходных данных
     # в этот момент делается предсказание
-    predict_time = (date - timedelta(days=1)).replace(hour=11,
-                                                      minute=0,
-                                                      second=0,
-                                                      microsecond=0)
-
-    query = f"""
-        SELECT
-            t.power_true,
-            t.temperature,
-            t.datetime,
-            (CASE WHEN
-                day_off_table.day_off = 1
-            THEN
-                1
-            ELSE
-                0
-            END) AS day_off
-        FROM
-            consumption_table AS t
-            LEFT JOIN day_off_table ON DATE(t.datetime) = DATE(day_off_table.datetime)
-        WHERE
-            t.datetime >= '{start_time}' AND
-            t.datetime <= '{end_time}';
-        """
-    data = pd.read_sql(sql=query, con=conn)
-    conn.close()
-    data['datetime'] = pd.to_datetime(data['datetime'], format='%Y-%m-%d %H:%M:%S')
-
-    predicts = pd.DataFrame()
-    # просуммируем значения, пришедшие от моделей
-    for (predictor_obj, predictor_name, predictor_path) in predictors:
-        predicts[predictor_name] = predictor_obj(data=data.copy(),
-                                                 date=predict_time,
-                                                 model_path=predictor_path)[0]
+    predict_times = [(date - timedelta(days=1)).replace(hour=11,
+                                                        minute=0,
+                                                        second=0,
+                                                        microsecond=0)
+                     for date in available_dates]
+
+    if read_data is None:
+        read_data = read_cached_history if use_history_cache else read_history
+    with span('read_history') as stage:
+        data = prepare_input(read_data(start_time, end_time))
+        stage.rows = len(data)
+
+    def run_predictor(predictor: Tuple[Callable, str, str]) -> Any:
+        predictor_obj, predictor_name, predictor_path = predictor
+        with span(f'predict.{predictor_name}') as stage:
+            predictor_pred = predictor_obj(data=data,
+                                           date=predict_times,
+                                           model_path=predictor_path)
+            stage.rows = len(predict_times)
+        return predictor_pred
+
+    # каждая модель вызывается один раз для всех дат,
+    # общие исходные данные доступны только для чтения, поэтому копии не нужны
+    # и модели могут читать их одновременно
+    n_threads = min(predictor_threads or len(predictors), len(predictors))
+    if n_threads > 1:
+        with ThreadPoolExecutor(max_workers=n_threads, thread_name_prefix='predictor') as executor:
+            predictor_preds = list(executor.map(run_predictor, predictors))
+    else:
+        predictor_preds = [run_predictor(predictor) for predictor in predictors]
+
+    # колонки прогнозов - в порядке моделей
+    predicts = {date: pd.DataFrame() for date in available_dates}
+    for (_, predictor_name, _), predictor_pred in zip(predictors, predictor_preds):
+        for date, pred in zip(available_dates, predictor_pred):
+            predicts[date][predictor_name] = pred
 
     return predicts
 
 
+# модули и функции моделей по их типу, импортируются при первом обращении
+PREDICTOR_FUNCTIONS = {'lgbm': ('predictors.lgbm.predictor_lgbm', 'lgbm_model'),
+                       'rnn' : ('predictors.rnn.predictor_rnn', 'rnn_model'),}
+
+
+def _lazy_predictor(kind: str) -> Callable:
+    """
+    функция модели типа kind, импортирующая модуль модели при первом вызове
+    """
+    module_name, function_name = PREDICTOR_FUNCTIONS[kind]
+
+    def predictor(**kwargs):
+        return getattr(import_module(module_name), function_name)(**kwargs)
+
+    predictor.__name__ = function_name
+    return predictor
+
+
+def resolve_predictors(specs: List[Tuple[str, str, str]]) -> List[Tuple[Callable, str, str]]:
+    r"""
+    функция переводит описания моделей (тип, имя, путь к модели), например
+    ('rnn', 'rnn_v1', r'predictors\rnn\models\model_v1_2023-12-15'),
+    в кортежи для call_predictors. Модули моделей (onnxruntime, lightgbm)
+    импортируются только при первом вызове модели
+    """
+    for kind, _, _ in specs:
+        assert kind in PREDICTOR_FUNCTIONS, \
+            f'Неизвестный тип модели {kind}, доступны: {", ".join(PREDICTOR_FUNCTIONS)}'
+    return [(_lazy_predictor(kind), name, model_path) for kind, name, model_path in specs]
+
+
 if __name__ == '__main__':
     from predictors.lgbm.predictor_lgbm import lgbm_model
     from predictors.rnn.predictor_rnn import rnn_model
@@ -0,0 +1,195 @@
+"""
+Скрипт переводит модели lgbm по горизонтам (model.pickle - словарь {горизонт: бустер})
+в один граф onnx (model.onnx в той же папке), который вызывает lgbm_model
+через onnxruntime одним вызовом.
+
+Граф принимает всю матрицу признаков make_data (float64, колонки в порядке make_data,
+их имена сохраняются в метаданных columns), для каждого горизонта выбирает его колонки
+(Gather) и вычисляет ансамбль деревьев (TreeEnsembleRegressor из ai.onnx.ml).
+Выход power_pred_{горизонт} имеет форму (строки, 1). Признаки и пороги - float64,
+поэтому выбор листьев совпадает с lightgbm, а прогноз отличается только округлением
+до float32 (тип выхода TreeEnsembleRegressor).
+
+Деревья переводятся из dump_model бустера без дополнительных библиотек.
+Поддерживаются регрессионные цели без преобразования выхода и числовые признаки;
+пропуски обрабатываются как в lightgbm (missing_type NaN и None).
+В метаданные графа записываются размер, время изменения и sha256 model.pickle:
+если модели переобучены, а граф не пересобран, lgbm_model использует model.pickle.
+lgbm_model вызывает граф только при config.lgbm_use_onnx = True.
+После сохранения прогнозы графа сверяются с бустерами на случайных признаках с пропусками.
+
+Пример вызова:
+python -m predictors.lgbm.export_onnx --model predictors/lgbm/models/model_v0
+"""
+import os
+import json
+import argparse
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from onnx import ModelProto, TensorProto, helper, numpy_helper, checker, save_model
+
+from predictors.modelcache import load_pickle
+from predictors.lgbm.predictor_lgbm import LAGS, Y_LAGS, TIME_FREQ, HorizonPlan, \
+    OnnxHorizonPlan, make_data, source_signature
+
+
+# цели lightgbm, прогноз которых равен сумме значений листьев
+IDENTITY_OBJECTIVES = ('regression', 'regression_l1', 'huber', 'fair', 'quantile', 'mape')
+
+ONNX_OPSET = 13
+ONNX_ML_OPSET = 3
+# версия формата, которую читает onnxruntime из requirements.txt
+ONNX_IR_VERSION = 8
+
+
+def feature_columns() -> List[str]:
+    """
+    колонки матрицы признаков make_data в порядке, в котором их получает lgbm_model
+    """
+    hours = pd.date_range(start='2000-01-01', periods=24 * 14, freq='H')
+    sample = pd.DataFrame({'datetime': hours,
+                           'power_true': 0.0,
+                           'temperature': 0.0,
+                           'day_off': 0})
+    return list(make_data(df=sample,
+                          lags=LAGS,
+                          y_lags=Y_LAGS,
+                          time_freq=TIME_FREQ,
+                          points=[hours[-1]]).columns)
+
+
+def _tree_attributes(booster: Any) -> Dict[str, Any]:
+    """
+    атрибуты TreeEnsembleRegressor для бустера lightgbm (Booster или LGBMRegressor)
+    """
+    dump = getattr(booster, 'booster_', booster).dump_model()
+    objective = dump['objective'].split()[0]
+    assert objective in IDENTITY_OBJECTIVES, f'Цель {objective} не поддерживается'
+
+    nodes: Dict[str, list] = {key: [] for key in ('treeids', 'nodeids', 'featureids', 'modes',
+                                                  'values', 'truenodeids', 'falsenodeids',
+                                                  'missing_value_tracks_true')}
+    targets: Dict[str, list] = {key: [] for key in ('treeids', 'nodeids', 'ids', 'weights')}
+
+    def add_node(tree_id: int, node: Dict[str, Any], counter: List[int]) -> int:
+        node_id = counter[0]
+        counter[0] += 1
+        position = len(nodes['nodeids'])
+        for values in nodes.values():
+            values.append(0)
+        nodes['treeids'][position] = tree_id
+        nodes['nodeids'][position] = node_id
+
+        if 'leaf_value' in node:
+            nodes['modes'][position] = 'LEAF'
+            nodes['values'][position] = 0.0
+            targets['treeids'].append(tree_id)
+            targets['nodeids'].append(node_id)
+            targets['ids'].append(0)
+            targets['weights'].append(node['leaf_value'])
+            return node_id
+
+        assert node['decision_type'] == '<=', \
+            f'Категориальные признаки не поддерживаются ({node["decision_type"]})'
+        assert node['missing_type'] in ('None', 'NaN'), \
+            f'Пропуски типа {node["missing_type"]} не поддерживаются'
+        nodes['featureids'][position] = node['split_feature']
+        nodes['modes'][position] = 'BRANCH_LEQ'
+        nodes['values'][position] = node['threshold']
+        # при missing_type None lightgbm заменяет пропуск нулем
+        nodes['missing_value_tracks_true'][position] = int(
+            node['default_left'] if node['missing_type'] == 'NaN' else 0 <= node['threshold'])
+        nodes['truenodeids'][position] = add_node(tree_id, node['left_child'], counter)
+        nodes['falsenodeids'][position] = add_node(tree_id, node['right_child'], counter)
+        return node_id
+
+    for tree in dump['tree_info']:
+        add_node(tree['tree_index'], tree['tree_structure'], [0])
+
+    attributes = {f'nodes_{key}': values for key, values in nodes.items() if key != 'values'}
+    attributes.update({f'target_{key}': values for key, values in targets.items() if key != 'weights'})
+    attributes.update(
+        nodes_values_as_tensor=numpy_helper.from_array(np.array(nodes['values'], dtype=np.float64)),
+        target_weights_as_tensor=numpy_helper.from_array(np.array(targets['weights'], dtype=np.float64)),
+        base_values_as_tensor=numpy_helper.from_array(np.zeros(1, dtype=np.float64)),
+        n_targets=1,
+        aggregate_function='AVERAGE' if dump.get('average_output') else 'SUM',
+        post_transform='NONE',
+    )
+    return attributes
+
+
+def build_graph(model  : Dict[int, Any],
+                columns: List[str],
+                source : Optional[Dict[str, str]] = None) -> ModelProto:
+    """
+    функция собирает граф onnx из словаря бустеров {горизонт: бустер}
+    для матрицы признаков с колонками columns. Описание исходного файла моделей
+    source (см. predictor_lgbm.source_signature) сохраняется в метаданных графа
+    """
+    indices = HorizonPlan(model=model).indices(columns)
+    nodes, initializers, outputs = [], [], []
+    for lag, booster in model.items():
+        initializers.append(numpy_helper.from_array(indices[lag].astype(np.int64),
+                                                    name=f'columns_{lag}'))
+        nodes.append(helper.make_node('Gather', ['X', f'columns_{lag}'], [f'X_{lag}'], axis=1))
+        nodes.append(helper.make_node('TreeEnsembleRegressor', [f'X_{lag}'], [f'power_pred_{lag}'],
+                                      domain='ai.onnx.ml', name=f'lgbm_{lag}',
+                                      **_tree_attributes(booster)))
+        outputs.append(helper.make_tensor_value_info(f'power_pred_{lag}', TensorProto.FLOAT, ['n', 1]))
+
+    graph = helper.make_graph(
+        nodes=nodes,
+        name='lgbm_horizons',
+        inputs=[helper.make_tensor_value_info('X', TensorProto.DOUBLE, ['n', len(columns)])],
+        outputs=outputs,
+        initializer=initializers)
+    onnx_model = helper.make_model(graph,
+                                   opset_imports=[helper.make_opsetid('', ONNX_OPSET),
+                                                  helper.make_opsetid('ai.onnx.ml', ONNX_ML_OPSET)],
+                                   producer_name='export_onnx')
+    onnx_model.ir_version = ONNX_IR_VERSION
+    helper.set_model_props(onnx_model, {'columns': json.dumps(columns),
+                                        'y_lags': json.dumps(sorted(model)),
+                                        **(source or {})})
+    checker.check_model(onnx_model)
+    return onnx_model
+
+
+def export_lgbm(model_path: str, rows: int = 1000, seed: int = 0) -> float:
+    """
+    функция сохраняет граф onnx моделей lgbm из папки model_path (model.pickle)
+    в model.onnx и сверяет прогнозы графа и бустеров на rows случайных строках.
+
+    Возвращает наибольшее абсолютное расхождение прогнозов, МВт
+    """
+    from predictors.ortsession import load_session
+
+    pickle_path = os.path.join(model_path, 'model.pickle')
+    source = source_signature(pickle_path)
+    model = load_pickle(pickle_path)
+    assert sorted(model) == Y_LAGS, f'Ожидаются модели горизонтов {Y_LAGS[0]}..{Y_LAGS[-1]}'
+    columns = feature_columns()
+    onnx_path = os.path.join(model_path, 'model.onnx')
+    save_model(build_graph(model=model, columns=columns, source=source), onnx_path)
+
+    # случайные признаки с пропусками и нулями
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(rows, len(columns))) * 1000, columns=columns)
+    X = X.mask(rng.random(size=X.shape) < 0.05).mask(rng.random(size=X.shape) < 0.05, 0.0)
+    expected = HorizonPlan(model=model).predict(X=X, y_lags=Y_LAGS)
+    actual = OnnxHorizonPlan(session=load_session(onnx_path)).predict(X=X, y_lags=Y_LAGS)
+    return float(np.abs(actual - expected).max())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, required=True)
+    parser.add_argument('--rows', type=int, default=1000)
+    args = parser.parse_args()
+
+    max_diff = export_lgbm(model_path=args.model, rows=args.rows)
+    print(f'Граф сохранен в {os.path.join(args.model, "model.onnx")}, '
+          f'наибольшее расхождение с lightgbm {max_diff:.2e} МВт')
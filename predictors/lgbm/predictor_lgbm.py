@@ -1,177 +1,326 @@
 """
 модуль вызывает модель lgdm и возвращает
-предсказанные значения потребления на следующие сутки. 
+предсказанные значения потребления на следующие сутки.
 """
-import warnings
 import re
-import pickle
 import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import pandas as pd
 import numpy as np
-from dateutil.relativedelta import relativedelta
 
+from config import lgbm_horizon_threads, lgbm_use_onnx
+from pipelinemetrics import span
+from predictors.modelcache import model_cache, load_pickle
+from preprocessing.calendarfeatures import take
+from preprocessing.preparedinput import PreparedInput, prepare_input
 
-def lgbm_model(data: pd.DataFrame,
-               date: datetime,
-               model_path: str) -> np.array:
+
+# сдвиги назад, горизонты прогноза и частоты кодирования времени, на которых обучены модели
+LAGS = list(range(180))
+Y_LAGS = list(range(12, 36))
+TIME_FREQ = ['hour', 'day_of_year', 'month', 'weekday']
+
+# устаревшие графы onnx, о которых уже выведено предупреждение:
+# (путь к графу, размер и время изменения model.pickle)
+_reported_stale: Set[Tuple[str, int, int]] = set()
+
+
+def source_signature(file_path: str) -> Dict[str, str]:
     """
-    Функция делает предсказание потребления элетроэнергии на предстоящие сутки вперед
-    На вход необходимо передать датафрейм с данными за год
-    момент времени, из которого делается предикт
-    11:00 соответствует полудню... Вот такие пироги...
-    путь к акутальной версии модели
+    описание файла моделей lgbm (размер, время изменения, sha256), которое
+    export_onnx.py сохраняет в метаданные графа onnx для проверки его актуальности
     """
-    def make_data(df       : pd.DataFrame,
-                  lags     : List[int],
-                  y_lags   : List[int],
-                  time_freq: List[str],) -> pd.DataFrame:
+    stat = os.stat(file_path)
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 ** 2), b''):
+            sha256.update(chunk)
+    return {'source_size'    : str(stat.st_size),
+            'source_mtime_ns': str(stat.st_mtime_ns),
+            'source_sha256'  : sha256.hexdigest(),}
+
+
+def make_data(df       : Union[pd.DataFrame, PreparedInput],
+              lags     : List[int],
+              y_lags   : List[int],
+              time_freq: List[str],
+              points   : Optional[List[datetime]] = None,) -> pd.DataFrame:
+    """
+    Функция, формирующая исходные для предикта от регрессионной модели LGBM.
+    На вход требует:
+
+    Датафрейм data, содержащий данные о почасовом потреблении, темпераутре и выходных днях,
+    или общие исходные данные прогноза PreparedInput (см. preprocessing.preparedinput)
+
+    Список лагов, по которым будет осуществляться сдвиг во времени назад.
+    Рекомендуется давать начиная с нуля. Последнее значение не включается.
+
+    Список лагов для целевой переменной,
+    по которым будет осуществляться сдвиг во времени вперед.
+    Рекомендуется давать начиная с единицы. Последнее значение не включается.
+
+    Список частот, по которым необходимо кодировать время и дату.
+    Доступны: {'hour', 'day_of_year', 'month', 'weekday'}
+
+    Необязательный список моментов времени points. Если он передан, признаки
+    рассчитываются только для этих строк, иначе - для всех.
+
+    Сдвиги считаются по позициям строк (как shift), прошлогодние значения -
+    по меткам времени. Входные данные не изменяются
+    """
+    prepared = prepare_input(df)
+    positions = prepared.positions(points=points)
+
+    columns = {}
+    # сдвиги во времени для мощности и температуры
+    for lag in lags:
+        columns[f'P_lag_{lag}'] = take(prepared.power, positions - lag)
+        columns[f't_lag_{lag}'] = take(prepared.temperature, positions - lag)
+
+    # данные о времени, назначенном для конкретного предсказания,
+    # а также инфа о рабочем/выходном дне
+    columns.update(prepared.future_features(positions=positions,
+                                            y_lags=y_lags,
+                                            time_freq=time_freq))
+
+    # прошлогодние потребление, температура и сведения о выходном/праздничном дне
+    columns.update(prepared.previous_year_features(positions=positions, y_lags=y_lags))
+
+    return pd.DataFrame(columns, index=prepared.index[positions])
+
+
+class HorizonPlan:
+    """
+    Скомпилированный план инференса для набора моделей по горизонтам (лагам).
+
+    Хранит модели и для каждого горизонта целочисленные индексы колонок матрицы
+    признаков, которые передаются соответствующей модели. Индексы строятся один раз
+    для каждого набора колонок make_data и затем переиспользуются
+    """
+    def __init__(self, model: Dict[int, Any]):
+        self.model = model
+        self._indices: Dict[Tuple[str, ...], Dict[int, np.ndarray]] = {}
+
+    def indices(self, columns: List[str]) -> Dict[int, np.ndarray]:
+        """
+        Возвращает индексы колонок для каждого горизонта
+        """
+        key = tuple(columns)
+        if key not in self._indices:
+            self._indices[key] = self._compile(columns)
+        return self._indices[key]
+
+    def _compile(self, columns: List[str]) -> Dict[int, np.ndarray]:
+        """
+        Разделяет колонки по группам и собирает перечень колонок для каждого горизонта
+        """
+        # для разделения данных по группам для каждой из вызываемой модели,
+        # определим перечни колонок
+        p_lag_regex = r'P_lag_(\d+)'
+        t_lag_regex = r't_lag_(\d+)'
+        trig_func_regex = r'[a-zA-Z_]+(?:sin|cos)_(\d+)'
+        day_off_regex = r'day_off_(\d+)'
+        previos_data_regex = r'[a-zA-Z_]+previos_year_(\d+)'
+
+        p_lag_cols = []
+        t_lag_cols = []
+        trig_func_cols = []
+        day_off_cols = []
+        previos_data_cols = []
+
+        for regex, cols in zip([p_lag_regex,
+                                t_lag_regex,
+                                trig_func_regex,
+                                day_off_regex,
+                                previos_data_regex,],
+                               [p_lag_cols,
+                                t_lag_cols,
+                                trig_func_cols,
+                                day_off_cols,
+                                previos_data_cols,]):
+            cols.extend([col_name for col_name in columns if re.match(regex, col_name)])
+
+        positions = {col_name: i for i, col_name in enumerate(columns)}
+        indices = {}
+        for lag in self.model:
+            # сформируем фичи
+            x_cols = p_lag_cols + t_lag_cols
+            x_cols.extend([col_name for col_name in \
+                (trig_func_cols + day_off_cols + previos_data_cols) \
+                    if re.match(f'[a-zA-Z_]+_{lag}', col_name)])
+            indices[lag] = np.array([positions[col_name] for col_name in x_cols])
+
+        return indices
+
+    def predict(self,
+                X: pd.DataFrame,
+                y_lags: List[int],
+                n_threads: int = 1) -> np.ndarray:
         """
-        Функция, формирующая исходные для предикта от регрессионной модели LGBM.
-        На вход требует:
+        Вызывает модели всех горизонтов y_lags на одной матрице признаков X.
+        При n_threads > 1 горизонты распределяются по потокам.
+        Возвращает матрицу (строки X, горизонты)
+        """
+        indices = self.indices(list(X.columns))
+        matrix = np.ascontiguousarray(X.to_numpy(dtype=float))
+
+        def predict_lag(lag: int) -> np.ndarray:
+            return self.model[lag].predict(matrix[:, indices[lag]])
 
-        Датафрейм data, содержащий данные о почасовом потреблении, темпераутре и выходных днях
+        if n_threads > 1:
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                power_pred = list(executor.map(predict_lag, y_lags))
+        else:
+            power_pred = [predict_lag(lag) for lag in y_lags]
 
-        Список лагов, по которым будет осуществляться сдвиг во времени назад.
-        Рекомендуется давать начиная с нуля. Последнее значение не включается.
+        return np.array(power_pred).reshape(len(y_lags), len(X)).T
 
-        Список лагов для целевой переменной,
-        по которым будет осуществляться сдвиг во времени вперед.
-        Рекомендуется давать начиная с единицы. Последнее значение не включается.
 
-        Список частот, по которым необходимо кодировать время и дату.
-        Доступны: {'hour', 'day_of_year', 'month', 'weekday'}
+class OnnxHorizonPlan:
+    """
+    План инференса по графу onnx, объединяющему модели всех горизонтов
+    (см. export_onnx.py): граф принимает всю матрицу признаков, сам выбирает
+    колонки каждого горизонта и возвращает по выходу power_pred_{горизонт}.
+
+    В метаданных графа хранится описание model.pickle, из которого он экспортирован
+    (см. source_signature), по нему is_current проверяет, не переобучены ли модели
+    """
+    def __init__(self, session: Any):
+        self.session = session
+        meta = session.get_modelmeta().custom_metadata_map
+        self.columns: List[str] = json.loads(meta['columns'])
+        self.source = {key: meta.get(key) for key in ('source_size',
+                                                      'source_mtime_ns',
+                                                      'source_sha256')}
+        self.input_name = session.get_inputs()[0].name
+        # результаты сверки sha256 по (размеру, времени изменения) model.pickle
+        self._checked: Dict[Tuple[str, str], bool] = {}
+
+    def is_current(self, pickle_path: str) -> bool:
+        """
+        Проверяет, что граф экспортирован из текущего файла моделей pickle_path.
+        При совпадении размера и времени изменения файл не читается,
+        иначе сверяется sha256 (файл мог быть скопирован без изменений) - один раз
+        для каждого состояния файла. Граф без описания источника считается устаревшим
         """
-        time_dict = {'hour'        : 24,
-                     'day_of_year' : 365.25,
-                     'month'       : 12,
-                     'weekday'     : 7}
-        df.set_index('datetime', inplace=True)
-
-        # извлечем тригонометрическую фичу из времени
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            for time_component in time_freq:
-                df[time_component] = getattr(df.index, time_component)
-                df[f'{time_component}_sin'] = \
-                    np.sin( 2 * np.pi * df[time_component] / time_dict[time_component])
-                df[f'{time_component}_cos'] = \
-                    np.cos( 2 * np.pi * df[time_component] / time_dict[time_component])
-                df.drop([time_component], axis=1, inplace=True)
-
-        # присоединим сдвиги во времени для мощности и температуры
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            for lag in lags:
-                df[f'P_lag_{lag}'] = df['power_true'].shift(lag)
-                df[f't_lag_{lag}'] = df['temperature'].shift(lag)
-
-        # присоединим к вектору из данных о потреблении и температуре данные о времени,
-        # назначенном для конкретного предсказания, а также инфу о рабочем/выходном дне
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            for lag in y_lags:
-                for time_component in time_freq:
-                    df[f'{time_component}_sin_{lag}'] = df[f'{time_component}_sin'].shift(-lag - 1)
-                    df[f'{time_component}_cos_{lag}'] = df[f'{time_component}_cos'].shift(-lag - 1)
-                df[f'day_off_{lag}'] = df['day_off'].shift(-lag - 1)
-
-
-        # присоединим к вектору данные о прошлогоднем потреблении и температуре в этот же час,
-        # а также сведения о выходном/праздничном дне
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            # создадим временный датафрейм, расширенный на год назад,
-            # чтобы получить временные сдвиги
-            temp_df = pd.concat([pd.DataFrame(columns=df.columns,
-                                              index = pd.date_range(start=df.index[0] - \
-                                                                    relativedelta(years=1),
-                                                                    end=df.index[0],
-                                                                    freq='H')[:-1]),
-                                 df[['power_true',
-                                     'temperature',
-                                     'day_off']].copy()
-                                ], axis=0)
-
-            for lag in y_lags:
-                # получим соответствующие лагу индексы
-                shifted_index = tuple(index - \
-                                      relativedelta(years=1) + \
-                                        relativedelta(hours=lag + 1) for index in df.index)
-                # получим значения по временным сдвигам
-                df[[f'one_hour_consumption_previos_year_{lag}',
-                    f'one_hour_temperature_previos_year_{lag}',
-                    f'day_off_previos_year_{lag}']] = \
-                        temp_df.loc[pd.DatetimeIndex(shifted_index),
-                                    ['power_true',
-                                     'temperature',
-                                     'day_off']].values
-
-        # удалим более не нужные колонки
-        df.drop(['power_true',
-                 'temperature',
-                 'day_off',], axis=1, inplace=True)
-
-        for time_component in time_freq:
-            df.drop([f'{time_component}_sin',
-                     f'{time_component}_cos',], axis=1, inplace=True)
-
-        return df
+        if not os.path.isfile(pickle_path):
+            # моделей lgbm в pickle нет - сверять не с чем
+            return True
+        if self.source['source_sha256'] is None:
+            return False
+        stat = os.stat(pickle_path)
+        key = (str(stat.st_size), str(stat.st_mtime_ns))
+        if key[0] != self.source['source_size']:
+            return False
+        if key == (self.source['source_size'], self.source['source_mtime_ns']):
+            return True
+        if key not in self._checked:
+            self._checked[key] = \
+                source_signature(pickle_path)['source_sha256'] == self.source['source_sha256']
+        return self._checked[key]
+
+    def predict(self,
+                X: pd.DataFrame,
+                y_lags: List[int],
+                n_threads: int = 1) -> np.ndarray:
+        """
+        Вызывает граф один раз для всех горизонтов y_lags.
+        Потоки задаются настройками сессии onnxruntime, n_threads не используется.
+        Возвращает матрицу (строки X, горизонты)
+        """
+        if list(X.columns) != self.columns:
+            X = X[self.columns]
+        matrix = np.ascontiguousarray(X.to_numpy(dtype=np.float64))
+        power_pred = self.session.run([f'power_pred_{lag}' for lag in y_lags],
+                                      {self.input_name: matrix})
+        return np.hstack(power_pred).reshape(len(X), len(y_lags)).astype(np.float64)
 
 
+def load_plan(file_path: str) -> HorizonPlan:
+    """
+    Загрузчик моделей lgbm для кэша моделей: возвращает план инференса
+    """
+    return HorizonPlan(model=load_pickle(file_path))
+
+
+def load_onnx_plan(file_path: str) -> OnnxHorizonPlan:
+    """
+    Загрузчик графа onnx моделей lgbm для кэша моделей: возвращает план инференса
+    """
+    # onnxruntime нужен только для моделей, экспортированных в onnx
+    from predictors.ortsession import load_session
+
+    return OnnxHorizonPlan(session=load_session(file_path))
+
+
+def current_onnx_plan(onnx_path: str, pickle_path: str, model_path: str) -> Optional[OnnxHorizonPlan]:
+    """
+    Возвращает план инференса по графу onnx_path из кэша моделей или None, если граф
+    экспортирован не из текущего model.pickle (модели переобучены, а граф не пересобран).
+    Об устаревшем графе выводится одно предупреждение на каждое состояние model.pickle
+    """
+    plan = model_cache.get(onnx_path, loader=load_onnx_plan)
+    if plan.is_current(pickle_path):
+        return plan
+    stat = os.stat(pickle_path)
+    key = (onnx_path, stat.st_size, stat.st_mtime_ns)
+    if key not in _reported_stale:
+        _reported_stale.add(key)
+        print(f'Граф {onnx_path} устарел (model.pickle изменился после экспорта), '
+              f'используются модели из model.pickle. '
+              f'Пересоберите граф: python -m predictors.lgbm.export_onnx --model {model_path}')
+    return None
+
+
+def lgbm_model(data: Union[pd.DataFrame, PreparedInput],
+               date: Union[datetime, List[datetime]],
+               model_path: str) -> np.array:
+    """
+    Функция делает предсказание потребления элетроэнергии на предстоящие сутки вперед
+    На вход необходимо передать датафрейм с данными за год
+    момент времени, из которого делается предикт
+    11:00 соответствует полудню... Вот такие пироги...
+    путь к акутальной версии модели
+
+    Вместо одного момента времени можно передать их список - тогда каждая модель
+    вызывается один раз для всех моментов, а результат имеет по строке на момент
+    """
+    dates = [date] if isinstance(date, datetime) else list(date)
+    data = prepare_input(data)
+
     # получим вектор исходных данных для предикта
-    lags=list(range(180))
-    y_lags=list(range(12, 36))
-    time_freq = ['hour', 'day_of_year', 'month', 'weekday']
-    X = make_data(df=data,
-                  lags=lags,
-                  y_lags=y_lags,
-                  time_freq=time_freq)
-    X = pd.DataFrame(X.loc[date]).astype(float).T
-
-    # для разделения данных по группам для каждой из вызываемой модели,
-    # определим перечни колонок
-    p_lag_regex = r'P_lag_(\d+)'
-    t_lag_regex = r't_lag_(\d+)'
-    trig_func_regex = r'[a-zA-Z_]+(?:sin|cos)_(\d+)'
-    day_off_regex = r'day_off_(\d+)'
-    previos_data_regex = r'[a-zA-Z_]+previos_year_(\d+)'
-
-    p_lag_cols = []
-    t_lag_cols = []
-    trig_func_cols = []
-    day_off_cols = []
-    previos_data_cols = []
-
-    power_pred = []
-
-    for regex, cols in zip([p_lag_regex,
-                            t_lag_regex,
-                            trig_func_regex,
-                            day_off_regex,
-                            previos_data_regex,],
-                           [p_lag_cols,
-                            t_lag_cols,
-                            trig_func_cols,
-                            day_off_cols,
-                            previos_data_cols,]):
-        cols.extend([col_name for col_name in X.columns if re.match(regex, col_name)])
+    # признаки считаются только для моментов времени dates.
+    # Матрица признаков хранится в общих исходных данных и переиспользуется
+    # остальными версиями моделей lgbm ансамбля (модели ее не изменяют)
+    with span('lgbm.features') as stage:
+        X = data.cached(('lgbm.make_data', tuple(dates)),
+                        lambda: make_data(df=data,
+                                          lags=LAGS,
+                                          y_lags=Y_LAGS,
+                                          time_freq=TIME_FREQ,
+                                          points=dates))
+        stage.rows = len(X)
 
     # последовательно вызовем все модели и передадим им
-    # для предсказания соответсвущие части вектора X
-    with open(os.path.join(os.getcwd(), model_path, 'model.pickle'), 'rb') as file:
-        model = pickle.load(file)
-
-    for lag in y_lags:
-        # сформируем фичи
-        x_cols = p_lag_cols + t_lag_cols
-        x_cols.extend([col_name for col_name in \
-            (trig_func_cols + day_off_cols + previos_data_cols) \
-                if re.match(f'[a-zA-Z_]+_{lag}', col_name)])
-        X_lag = X.loc[:, x_cols]
-        # вызовем predict у модели
-        power_pred.append(model[lag].predict(X_lag))
-
-    return np.array(power_pred).reshape(1, -1)
+    # для предсказания соответсвущие части матрицы X
+    # (или один раз вызовем граф onnx со всеми моделями, см. export_onnx.py).
+    # План инференса строится один раз и хранится в общем кэше процесса.
+    # Устаревший граф onnx не используется (см. current_onnx_plan)
+    with span('lgbm.load_model'):
+        onnx_path = os.path.join(os.getcwd(), model_path, 'model.onnx')
+        pickle_path = os.path.join(os.getcwd(), model_path, 'model.pickle')
+        plan = None
+        if lgbm_use_onnx and os.path.isfile(onnx_path):
+            plan = current_onnx_plan(onnx_path=onnx_path, pickle_path=pickle_path,
+                                     model_path=model_path)
+        if plan is None:
+            plan = model_cache.get(pickle_path, loader=load_plan)
+
+    with span('lgbm.inference') as stage:
+        stage.rows = len(X)
+        return plan.predict(X=X, y_lags=Y_LAGS, n_threads=lgbm_horizon_threads)
@@ -0,0 +1,152 @@
+"""
+модуль содержит кэш загруженных артефактов моделей (моделей, сессий onnxruntime,
+скеллеров), который живет в течение всего процесса
+"""
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+from config import model_cache_max_bytes
+
+
+def load_pickle(file_path: str) -> Any:
+    """
+    Загрузчик артефактов, сохраненных через pickle
+    """
+    with open(file_path, 'rb') as file:
+        return pickle.load(file)
+
+
+class ModelCache:
+    """
+    Кэш артефактов моделей с ключом по пути к файлу.
+
+    Запись перезагружается, если у файла изменилось время модификации или размер.
+    Объем кэша оценивается по размеру файлов на диске: при превышении max_bytes
+    вытесняются давно не использованные записи (последняя загруженная запись
+    остается в кэше, даже если сама превышает лимит).
+    Доступ к кэшу потокобезопасен: каждый файл загружает один поток,
+    остальные потоки, запросившие его одновременно, ждут и получают тот же артефакт
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[Tuple[int, int], int, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        # блокировки загрузки по пути к файлу
+        self._loading: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def get(self, file_path: str, loader: Callable[[str], Any]) -> Any:
+        """
+        Возвращает артефакт из кэша или загружает его функцией loader(file_path)
+        """
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            artifact = self._lookup(file_path, signature)
+            if artifact is not None:
+                return artifact
+            load_lock = self._loading.setdefault(file_path, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                # артефакт мог загрузить другой поток, пока этот ждал блокировку
+                artifact = self._lookup(file_path, signature)
+                if artifact is not None:
+                    return artifact
+                self.misses += 1
+                if file_path in self._entries:
+                    # файл изменился - выбросим устаревшую запись
+                    self.reloads += 1
+                    del self._entries[file_path]
+
+            artifact = loader(file_path)
+
+            with self._lock:
+                self._entries[file_path] = (signature, stat.st_size, artifact)
+                self._entries.move_to_end(file_path)
+                self._evict()
+
+        return artifact
+
+    def _lookup(self, file_path: str, signature: Tuple[int, int]) -> Any:
+        """
+        Возвращает актуальный артефакт из кэша или None (вызывается под блокировкой)
+        """
+        entry = self._entries.get(file_path)
+        if entry is None or entry[0] != signature:
+            return None
+        self.hits += 1
+        self._entries.move_to_end(file_path)
+        return entry[2]
+
+    def _evict(self) -> None:
+        """
+        Вытесняет давно не использованные записи сверх лимита памяти
+        """
+        while len(self._entries) > 1 and self.size > self.max_bytes:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def size(self) -> int:
+        """
+        Оценка занимаемой памяти (суммарный размер файлов артефактов), байт
+        """
+        return sum(entry[1] for entry in self._entries.values())
+
+    def clear(self) -> None:
+        """
+        Очищает кэш и счетчики
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.reloads = self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Возвращает счетчики попаданий/промахов и текущий объем кэша
+        """
+        with self._lock:
+            return {'hits'     : self.hits,
+                    'misses'   : self.misses,
+                    'reloads'  : self.reloads,
+                    'evictions': self.evictions,
+                    'entries'  : len(self._entries),
+                    'bytes'    : self.size}
+
+    def report(self) -> str:
+        """
+        Строковое представление статистики кэша для вывода в консоль
+        """
+        return stats_report(self.stats())
+
+
+def sum_stats(stats: List[Dict[str, int]]) -> Dict[str, int]:
+    """
+    суммарная статистика кэшей нескольких процессов
+    """
+    return {key: sum(process_stats[key] for process_stats in stats)
+            for key in ('hits', 'misses', 'reloads', 'evictions', 'entries', 'bytes')}
+
+
+def stats_report(stats: Dict[str, int], processes: int = 1) -> str:
+    """
+    строковое представление статистики кэша (или суммы по processes процессам)
+    для вывода в консоль
+    """
+    label = 'Кэш моделей' if processes == 1 else f'Кэш моделей (процессов пула: {processes})'
+    return (f'{label}: попаданий {stats["hits"]}, промахов {stats["misses"]} '
+            f'(перезагрузок {stats["reloads"]}, вытеснений {stats["evictions"]}), '
+            f'записей {stats["entries"]}, {stats["bytes"] / 1024 ** 2:.1f} МБ')
+
+
+# общий для процесса кэш
+model_cache = ModelCache(max_bytes=model_cache_max_bytes)
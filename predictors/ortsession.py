@@ -0,0 +1,189 @@
+"""
+модуль создает сессии onnxruntime с настройками из config (число потоков,
+уровень оптимизации графа, порядок выполнения операторов, арена памяти).
+
+Оптимизированный граф модели сохраняется в папку config.path_to_ort_cache (папки моделей
+могут быть доступны только для чтения). Имя файла графа содержит хэш пути исходной модели
+и хэш ее описания: размер и время изменения модели, уровень оптимизации и версия
+onnxruntime, - поэтому готовый граф загружается, пока файл с таким именем есть,
+а отдельное описание не требуется. Файл записывается атомарно, и модель могут загружать
+несколько процессов сразу. Если папка кэша недоступна для записи, граф оптимизируется
+при каждой загрузке. Сохраняется граф не выше уровня extended (не зависит от процессора),
+оптимизации уровня all выполняются при загрузке и занимают мало времени.
+
+Время загрузки и предикта при текущих настройках:
+python -m predictors.ortsession --model predictors/rnn/models/model_v1_2023-12-15/model.onnx --batch 31
+"""
+import os
+import glob
+import json
+import time
+import hashlib
+import argparse
+from typing import Any, Dict, Optional
+
+import numpy as np
+import onnxruntime as ort
+
+from config import ort_intra_op_threads, ort_inter_op_threads, ort_graph_optimization, \
+    ort_execution_mode, ort_cpu_mem_arena, ort_mem_pattern, ort_cache_optimized_graph, \
+    path_to_ort_cache
+
+
+GRAPH_OPTIMIZATION = {'disable' : ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+                      'basic'   : ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+                      'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+                      'all'     : ort.GraphOptimizationLevel.ORT_ENABLE_ALL,}
+
+EXECUTION_MODE = {'sequential': ort.ExecutionMode.ORT_SEQUENTIAL,
+                  'parallel'  : ort.ExecutionMode.ORT_PARALLEL,}
+
+# наибольший уровень оптимизации сохраняемого графа
+SAVED_OPTIMIZATION = 'extended'
+
+
+def session_options(graph_optimization: Optional[str] = None) -> ort.SessionOptions:
+    """
+    настройки сессии из config. Уровень оптимизации graph_optimization
+    (по умолчанию config.ort_graph_optimization): disable, basic, extended, all
+    """
+    graph_optimization = graph_optimization or ort_graph_optimization
+    assert graph_optimization in GRAPH_OPTIMIZATION, \
+        f'Неизвестный уровень оптимизации {graph_optimization}, доступны: {", ".join(GRAPH_OPTIMIZATION)}'
+    assert ort_execution_mode in EXECUTION_MODE, \
+        f'Неизвестный порядок выполнения {ort_execution_mode}, доступны: {", ".join(EXECUTION_MODE)}'
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = ort_intra_op_threads
+    options.inter_op_num_threads = ort_inter_op_threads
+    options.graph_optimization_level = GRAPH_OPTIMIZATION[graph_optimization]
+    options.execution_mode = EXECUTION_MODE[ort_execution_mode]
+    options.enable_cpu_mem_arena = ort_cpu_mem_arena
+    options.enable_mem_pattern = ort_mem_pattern
+    return options
+
+
+def _saved_optimization() -> str:
+    """
+    уровень оптимизации сохраняемого графа: настроенный, но не выше SAVED_OPTIMIZATION
+    """
+    levels = list(GRAPH_OPTIMIZATION)
+    return levels[min(levels.index(ort_graph_optimization), levels.index(SAVED_OPTIMIZATION))]
+
+
+def _graph_signature(file_path: str) -> Dict[str, Any]:
+    """
+    описание, при совпадении которого сохраненный граф соответствует модели
+    """
+    stat = os.stat(file_path)
+    return {'source_size'    : stat.st_size,
+            'source_mtime_ns': stat.st_mtime_ns,
+            'optimization'   : _saved_optimization(),
+            'onnxruntime'    : ort.__version__,}
+
+
+def _hash(value: str) -> str:
+    """
+    короткий хэш строки для имен файлов кэша
+    """
+    return hashlib.sha256(value.encode('utf8')).hexdigest()[:16]
+
+
+def _model_prefix(file_path: str, cache_path: str) -> str:
+    """
+    общее начало путей оптимизированных графов модели file_path в папке кэша
+    """
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(cache_path, f'{stem}-{_hash(os.path.abspath(file_path))}-')
+
+
+def optimized_path(file_path: str, cache_path: Optional[str] = None) -> str:
+    """
+    путь оптимизированного графа, соответствующего текущему состоянию модели file_path
+    и настройкам, в папке кэша cache_path (по умолчанию config.path_to_ort_cache)
+    """
+    signature = json.dumps(_graph_signature(file_path), sort_keys=True)
+    return f'{_model_prefix(file_path, cache_path or path_to_ort_cache)}{_hash(signature)}.opt.onnx'
+
+
+def _save_optimized(file_path: str, opt_path: str) -> None:
+    """
+    оптимизирует граф модели и сохраняет его. Запись идет во временный файл процесса
+    с атомарной заменой. Графы прежних состояний модели удаляются
+    """
+    os.makedirs(os.path.dirname(opt_path), exist_ok=True)
+    tmp_path = f'{opt_path}.{os.getpid()}.tmp'
+    options = session_options(graph_optimization=_saved_optimization())
+    options.optimized_model_filepath = tmp_path
+    ort.InferenceSession(file_path, sess_options=options)
+    os.replace(tmp_path, opt_path)
+
+    prefix = opt_path[:opt_path.rindex('-') + 1]
+    for old_path in glob.glob(glob.escape(prefix) + '*.opt.onnx'):
+        if old_path != opt_path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+    return None
+
+
+def load_session(file_path: str) -> ort.InferenceSession:
+    """
+    Загрузчик сессии onnxruntime с настройками из config (для model_cache.get).
+    При ort_cache_optimized_graph загружается сохраненный оптимизированный граф,
+    при его отсутствии или устаревании он предварительно создается
+    """
+    options = session_options()
+    if not ort_cache_optimized_graph or ort_graph_optimization == 'disable':
+        return ort.InferenceSession(file_path, sess_options=options)
+
+    opt_path = optimized_path(file_path)
+    if not os.path.isfile(opt_path):
+        try:
+            _save_optimized(file_path, opt_path)
+        except OSError as error:
+            # папка кэша недоступна для записи - граф оптимизируется при каждой загрузке
+            print(f'Не удалось сохранить оптимизированный граф {opt_path}: {str(error)}')
+            return ort.InferenceSession(file_path, sess_options=options)
+
+    return ort.InferenceSession(opt_path, sess_options=options)
+
+
+def measure_latency(session: ort.InferenceSession, batch: int, runs: int = 20) -> Dict[str, float]:
+    """
+    функция замеряет время предикта сессии на пакете из batch случайных входов
+    (динамические размерности входов заменяются размером пакета).
+    Возвращает медиану и максимум времени runs запусков после прогревочного, мс
+    """
+    rng = np.random.default_rng(0)
+    feed = {input_.name: rng.random([dim if isinstance(dim, int) else batch
+                                     for dim in input_.shape]).astype(np.float32)
+            for input_ in session.get_inputs()}
+    session.run(None, feed)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.run(None, feed)
+        times.append(time.perf_counter() - start)
+    return {'median_ms': float(np.median(times) * 1000), 'max_ms': float(np.max(times) * 1000)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, required=True)
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    if os.path.isfile(optimized_path(args.model)):
+        os.remove(optimized_path(args.model))
+
+    for label_ in ('с оптимизацией графа', 'из сохраненного графа'):
+        start_ = time.perf_counter()
+        session_ = load_session(args.model)
+        print(f'Загрузка {label_}: {time.perf_counter() - start_:.3f} с')
+
+    latency_ = measure_latency(session=session_, batch=args.batch, runs=args.runs)
+    print(f'Предикт пакета из {args.batch}: медиана {latency_["median_ms"]:.2f} мс, '
+          f'максимум {latency_["max_ms"]:.2f} мс')
@@ -1,22 +1,81 @@
 """
 модуль вызывает модель нейронной сети и возвращает
-предсказанные значения потребления на следующие сутки. 
+предсказанные значения потребления на следующие сутки.
 """
-import warnings
 import re
 import os
-import pickle
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional, Union
 
 import pandas as pd
 import numpy as np
-import onnxruntime as ort
-from dateutil.relativedelta import relativedelta
 
+from pipelinemetrics import span
+from predictors.modelcache import model_cache, load_pickle
+from predictors.ortsession import load_session
+from preprocessing.preparedinput import PreparedInput, prepare_input
 
-def rnn_model(data: pd.DataFrame,
-              date: datetime,
+
+# горизонты прогноза, длина окна рекуррентного входа (без текущего часа)
+# и частоты кодирования времени, на которых обучены модели
+Y_LAGS = list(range(12, 36))
+WINDOW_SIZE = 179
+TIME_FREQ = ['hour', 'day_of_year', 'month', 'weekday']
+
+
+def make_data(df       : Union[pd.DataFrame, PreparedInput],
+              y_lags   : List[int],
+              time_freq: List[str],
+              points   : Optional[List[datetime]] = None,) -> pd.DataFrame:
+    """
+    Функция, формирующая исходные для предикта от рекурренной нейронной сети
+    На вход требует:
+
+    Датафрейм df, содержащий данные о почасовом потреблении и темпераутре,
+    или общие исходные данные прогноза PreparedInput (см. preprocessing.preparedinput).
+
+    Список лагов для целевой переменной,
+    по которым будет осуществляться сдвиг во времени вперед.
+    Рекомендуется давать начиная с единицы. Последнее значение не включается.
+
+    Список частот, по которым необходимо кодировать время и дату.
+    Доступны: {'hour', 'day_of_year', 'month', 'weekday'}
+
+    Необязательный список моментов времени points. Если он передан, признаки
+    рассчитываются только для этих строк, иначе - для всех.
+
+    Сдвиги считаются по позициям строк (как shift), прошлогодние значения -
+    по меткам времени. Входные данные не изменяются
+    """
+    prepared = prepare_input(df)
+    positions = prepared.positions(points=points)
+    trig = prepared.trig(time_freq=time_freq)
+
+    # следующеие фичи нужны для рекуррентного входа
+    columns = {'one_hour_consumption': prepared.power[positions],
+               'one_hour_temperature': prepared.temperature[positions],
+               'day_off': prepared.day_off[positions],}
+
+    # тригонометрическая фича из времени
+    for col_name, values in trig.items():
+        columns[col_name] = values[positions]
+
+    # следующеие фичи нужны для полносвязного входа
+
+    # данные о времени, назначенном для конкретного предсказания,
+    # а также инфа о рабочем/выходном дне
+    columns.update(prepared.future_features(positions=positions,
+                                            y_lags=y_lags,
+                                            time_freq=time_freq))
+
+    # прошлогодние потребление, температура и сведения о выходном/праздничном дне
+    columns.update(prepared.previous_year_features(positions=positions, y_lags=y_lags))
+
+    return pd.DataFrame(columns, index=prepared.index[positions])
+
+
+def rnn_model(data: Union[pd.DataFrame, PreparedInput],
+              date: Union[datetime, List[datetime]],
               model_path: str) -> np.array:
     """
     Функция делает предсказание потребления элетроэнергии на предстоящие сутки вперед
@@ -24,101 +83,32 @@ def rnn_model(data: pd.DataFrame,
     момент времени, из которого делается предикт
     11:00 соответствует полудню... Вот такие пироги...
     путь к акутальной версии модели
-    """
-    def make_data(df       : pd.DataFrame,
-                  y_lags   : List[int],
-                  time_freq: List[str],) -> pd.DataFrame:
-        """
-        Функция, формирующая исходные для предикта от рекурренной нейронной сети
-        На вход требует:
-
-        Датафрейм df, содержащий данные о почасовом потреблении и темпераутре.
-
-        Список лагов, по которым будет осуществляться сдвиг во времени назад.
-        Рекомендуется давать начиная с нуля. Последнее значение не включается.
-
-        Список лагов для целевой переменной,
-        по которым будет осуществляться сдвиг во времени вперед.
-        Рекомендуется давать начиная с единицы. Последнее значение не включается.
-
-        Список частот, по которым необходимо кодировать время и дату.
-        Доступны: {'hour', 'day_of_year', 'month', 'weekday'}
-        """
-        time_dict = {'hour'        : 24,
-                     'day_of_year' : 365.25,
-                     'month'       : 12,
-                     'weekday'     : 7}
-        df.set_index('datetime', inplace=True)
-
-        # следующеие фичи нужны для рекуррентного входа
-
-        # извлечем тригонометрическую фичу из времени
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            for time_component in time_freq:
-                df[time_component] = getattr(df.index, time_component)
-                df[f'{time_component}_sin'] = \
-                    np.sin( 2 * np.pi * df[time_component] / time_dict[time_component])
-                df[f'{time_component}_cos'] = \
-                    np.cos( 2 * np.pi * df[time_component] / time_dict[time_component])
-                df.drop([time_component], axis=1, inplace=True)
-
-        # следующеие фичи нужны для полносвязного входа
-
-        # присоединим к полносвязному вектору данные о времени,
-        # назначенном для конкретного предсказания, а также инфу о рабочем/выходном дне
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            for lag in y_lags:
-                for time_component in time_freq:
-                    df[f'{time_component}_sin_{lag}'] = df[f'{time_component}_sin'].shift(-lag - 1)
-                    df[f'{time_component}_cos_{lag}'] = df[f'{time_component}_cos'].shift(-lag - 1)
-                df[f'day_off_{lag}'] = df['day_off'].shift(-lag - 1)
-
-        # присоединим к вектору данные о прошлогоднем потреблении и температуре в этот же час,
-        # а также сведения о выходном/праздничном дне
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            # создадим временный датафрейм, расширенный на год назад,
-            # чтобы получить временные сдвиги
-            temp_df = pd.concat([pd.DataFrame(columns=df.columns,
-                                              index = pd.date_range(start=df.index[0] - \
-                                                                    relativedelta(years=1),
-                                                                    end=df.index[0],
-                                                                    freq='H')[:-1]),
-                                 df[['power_true',
-                                     'temperature',
-                                     'day_off']].copy()
-                                ], axis=0)
-
-            for lag in y_lags:
-                # получим соответствующие лагу индексы
-                shifted_index = tuple(index - \
-                                      relativedelta(years=1) + \
-                                        relativedelta(hours=lag + 1) for index in df.index)
-                # получим значения по временным сдвигам
-                df[[f'one_hour_consumption_previos_year_{lag}',
-                    f'one_hour_temperature_previos_year_{lag}',
-                    f'day_off_previos_year_{lag}']] = \
-                        temp_df.loc[pd.DatetimeIndex(shifted_index),
-                                    ['power_true',
-                                     'temperature',
-                                     'day_off']].values
-
-        df.rename(columns={'power_true': 'one_hour_consumption',
-                           'temperature': 'one_hour_temperature'},
-                  inplace=True)
-
-        return df
 
+    Вместо одного момента времени можно передать их список - тогда модель
+    вызывается один раз для всех моментов, а результат имеет по строке на момент
+    """
+    dates = [date] if isinstance(date, datetime) else list(date)
+    data = prepare_input(data)
 
     # получим исходные данные для предикта
-    y_lags=list(range(12, 36))
-    window_size = 179
-    time_freq = ['hour', 'day_of_year', 'month', 'weekday']
-    X = make_data(df=data,
-                  y_lags=y_lags,
-                  time_freq=time_freq)
+    # признаки считаются только для окон рекуррентного входа
+    positions = data.positions(points=dates)
+    window_starts = data.index.searchsorted(pd.DatetimeIndex(dates) - timedelta(hours=WINDOW_SIZE))
+    assert ((positions - window_starts) == WINDOW_SIZE).all(), \
+        f'Для рекуррентного входа требуется непрерывная история за {WINDOW_SIZE + 1} часов'
+    # позиции строк всех окон и их индексы в датафрейме признаков
+    window_positions = positions[:, None] + np.arange(-WINDOW_SIZE, 1)[None, :]
+    unique_positions, window_rows = np.unique(window_positions, return_inverse=True)
+    window_rows = window_rows.reshape(window_positions.shape)
+    # датафрейм признаков хранится в общих исходных данных и переиспользуется
+    # остальными версиями моделей rnn ансамбля (модели его не изменяют)
+    with span('rnn.features') as stage:
+        X = data.cached(('rnn.make_data', unique_positions.tobytes()),
+                        lambda: make_data(df=data,
+                                          y_lags=Y_LAGS,
+                                          time_freq=TIME_FREQ,
+                                          points=data.index[unique_positions]))
+        stage.rows = len(X)
 
     # для дальнейшей обработки определим перечни колонок
 
@@ -157,33 +147,35 @@ def rnn_model(data: pd.DataFrame,
 
     # выделим из полученных данных матрицу для рекуррентного слоя и
     # вектор для полносвязного слоя
-    RNN_input = X.loc[date - timedelta(hours=window_size): date, RNN_input_cols]
-    Dense_input = pd.DataFrame(X.loc[date, Dense_input_cols]).astype(float).T
-
-    # загрузим модель и скеллеры для обработки данных
-    session = ort.InferenceSession(os.path.join(os.getcwd(), model_path, 'model.onnx'))
-
-    with open(os.path.join(os.getcwd(), model_path, 'scallers.pickle'), 'rb') as file:
-        scaller_RNN, scaller_Dense = pickle.load(file)
-
-    # проскаллируем данные
-    RNN_input.loc[:, RNN_input_scalled_cols] = scaller_RNN \
-        .transform(RNN_input.loc[:, RNN_input_scalled_cols] \
-                   .values.reshape(-1, len(RNN_input_scalled_cols)))
-    Dense_input.loc[:, Dense_input_scalled_cols] = scaller_Dense \
-        .transform(Dense_input.loc[:, Dense_input_scalled_cols] \
-                   .values.reshape(-1, len(Dense_input_scalled_cols)))
-
-    # приведем данные к типу np.array
-    RNN_input = np.array(RNN_input).reshape(-1, *RNN_input.shape)
-    Dense_input = np.array(Dense_input).reshape(Dense_input.shape)
+    RNN_input = X.loc[:, RNN_input_cols].to_numpy(dtype=float)
+    Dense_input = X.iloc[window_rows[:, -1]].loc[:, Dense_input_cols].to_numpy(dtype=float)
+
+    # загрузим модель и скеллеры для обработки данных (из общего кэша процесса)
+    with span('rnn.load_model'):
+        session = model_cache.get(os.path.join(os.getcwd(), model_path, 'model.onnx'),
+                                  loader=load_session)
+        scaller_RNN, scaller_Dense = model_cache.get(
+            os.path.join(os.getcwd(), model_path, 'scallers.pickle'),
+            loader=load_pickle
+        )
+
+    # проскаллируем данные (скаллируемые колонки идут первыми)
+    RNN_input[:, :len(RNN_input_scalled_cols)] = scaller_RNN \
+        .transform(RNN_input[:, :len(RNN_input_scalled_cols)])
+    Dense_input[:, :len(Dense_input_scalled_cols)] = scaller_Dense \
+        .transform(Dense_input[:, :len(Dense_input_scalled_cols)])
+
+    # соберем окна рекуррентного входа в тензор (моменты, время, признаки)
+    RNN_input = RNN_input[window_rows]
     Input = [RNN_input, Dense_input]
 
     # вызовем predict у модели
     inputDetails = session.get_inputs()
-    pred = session.run(None, {
-        inputDetails[0].name: Input[0].astype(np.float32),
-        inputDetails[1].name: Input[1].astype(np.float32),
-    })
-
-    return np.array(pred).reshape(1, -1)
+    with span('rnn.inference') as stage:
+        pred = session.run(None, {
+            inputDetails[0].name: Input[0].astype(np.float32),
+            inputDetails[1].name: Input[1].astype(np.float32),
+        })
+        stage.rows = len(dates)
+
+    return np.array(pred[0]).reshape(len(dates), -1)
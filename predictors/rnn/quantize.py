@@ -0,0 +1,165 @@
+"""
+Скрипт создает квантованный вариант модели rnn (динамическая квантизация весов в INT8)
+и публикует его, только если точность не хуже исходной модели сверх допустимого.
+
+Квантованная модель собирается во временной папке (model.onnx и копия scallers.pickle).
+Обе модели прогоняются через rnn_model на последних quantization_replay_days сутках
+с фактом из БД, их MAE и MAPE сравниваются, также замеряется время предикта.
+Результаты сохраняются в quantization.json в папке квантованной модели.
+Если MAE или MAPE выросли более чем на quantization_max_degradation (доля),
+временная папка удаляется, а скрипт завершается с кодом 1. При нулевой ошибке
+исходной модели допускается только нулевая ошибка квантованной.
+
+Квантованная модель подключается заменой пути модели в config.predictors.
+
+Пример вызова:
+python -m predictors.rnn.quantize --model predictors/rnn/models/model_v1_2023-12-15
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from onnxruntime.quantization import QuantType, quantize_dynamic
+
+from config import quantization_replay_days, quantization_max_degradation
+from database import last_consumption_hour, read_history
+from predict import call_predictors_batch
+from predictors.modelcache import model_cache
+from predictors.ortsession import load_session, measure_latency
+from predictors.rnn.predictor_rnn import rnn_model
+
+
+# ограничение снизу модуля факта при расчете MAPE (как в sklearn)
+MAPE_EPS = np.finfo(np.float64).eps
+
+
+def quantize_model(model_path: str, output_path: str) -> None:
+    """
+    функция сохраняет в папку output_path модель из папки model_path
+    с весами, квантованными в INT8, и копию ее скеллеров
+    """
+    os.makedirs(output_path, exist_ok=True)
+    quantize_dynamic(model_input=os.path.join(model_path, 'model.onnx'),
+                     model_output=os.path.join(output_path, 'model.onnx'),
+                     weight_type=QuantType.QInt8)
+    shutil.copy2(os.path.join(model_path, 'scallers.pickle'), output_path)
+    return None
+
+
+def replay_dates(days: int) -> List[datetime]:
+    """
+    последние days суток, на все часы которых в БД есть фактическое потребление
+    """
+    last_hour = last_consumption_hour()
+    assert last_hour is not None, 'В БД нет фактических данных о потреблении'
+    end = (last_hour + timedelta(hours=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return [end - timedelta(days=i) for i in range(days, 0, -1)]
+
+
+def replay_quality(model_paths: Dict[str, str], dates: List[datetime]) -> pd.DataFrame:
+    """
+    функция выполняет прогнозы моделей rnn {имя: папка модели} на даты dates
+    и возвращает их MAE (МВт) и MAPE (%) по часам с фактом (строки - имена моделей)
+    """
+    preds = call_predictors_batch(dates=dates,
+                                  predictors=[(rnn_model, name, model_path)
+                                              for name, model_path in model_paths.items()])
+    assert preds, 'Нет исходных данных для прогнозов на проверочные сутки'
+
+    facts = read_history(start_time=min(preds), end_time=max(preds) + timedelta(days=1)) \
+        .set_index('datetime')['power_true']
+    true = np.stack([facts.reindex(pd.date_range(start=date, periods=24, freq='H')).to_numpy()
+                     for date in preds])
+    quality = {}
+    for name in model_paths:
+        pred = np.stack([preds[date][name].to_numpy() for date in preds])
+        abs_error = np.abs(pred - true)
+        quality[name] = {'mae': np.nanmean(abs_error),
+                         'mape': np.nanmean(abs_error / np.maximum(np.abs(true), MAPE_EPS)) * 100}
+    return pd.DataFrame(quality).T
+
+
+def relative_increase(value: float, reference: float) -> float:
+    """
+    относительный рост метрики value по сравнению с reference (доля).
+    При reference, равном 0, рост бесконечен, если value больше нуля.
+    Если метрика не определена (nan), рост считается бесконечным
+    """
+    if np.isnan(value) or np.isnan(reference):
+        return np.inf
+    if reference == 0:
+        return 0.0 if value <= 0 else np.inf
+    return value / reference - 1
+
+
+def publish_quantized(model_path     : str,
+                      output_path    : str,
+                      days           : int = quantization_replay_days,
+                      max_degradation: float = quantization_max_degradation) -> bool:
+    """
+    функция создает квантованную модель из папки model_path, сравнивает ее
+    с исходной на последних days сутках и при росте MAE и MAPE не более чем
+    на долю max_degradation публикует ее в папку output_path (заменяя прежнюю).
+
+    Возвращает True, если модель опубликована
+    """
+    model_path = os.path.abspath(model_path)
+    output_path = os.path.abspath(output_path)
+    tmp_path = f'{output_path}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+    quantize_model(model_path=model_path, output_path=tmp_path)
+    dates = replay_dates(days=days)
+    quality = replay_quality(model_paths={'float32': model_path, 'int8': tmp_path}, dates=dates)
+
+    report: Dict[str, Any] = {'source': model_path,
+                              'created': datetime.now().isoformat(timespec='seconds'),
+                              'replay_start': str(dates[0].date()),
+                              'replay_end': str(dates[-1].date()),
+                              'max_degradation': max_degradation}
+    for name, path in (('float32', model_path), ('int8', tmp_path)):
+        session = model_cache.get(os.path.join(path, 'model.onnx'), loader=load_session)
+        report[name] = {'mae': round(float(quality.loc[name, 'mae']), 3),
+                        'mape': round(float(quality.loc[name, 'mape']), 3),
+                        'size_bytes': os.path.getsize(os.path.join(path, 'model.onnx')),
+                        'latency_1': measure_latency(session=session, batch=1),
+                        f'latency_{len(dates)}': measure_latency(session=session, batch=len(dates))}
+    degradation = {metric: relative_increase(value=float(quality.loc['int8', metric]),
+                                             reference=float(quality.loc['float32', metric]))
+                   for metric in quality.columns}
+    report['degradation'] = {metric: round(value, 4) for metric, value in degradation.items()}
+    report['published'] = all(value <= max_degradation for value in degradation.values())
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if not report['published']:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        print(f'Квантованная модель не опубликована: рост ошибок превышает {max_degradation:.1%}')
+        return False
+
+    with open(os.path.join(tmp_path, 'quantization.json'), 'w', encoding='utf8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    shutil.rmtree(output_path, ignore_errors=True)
+    os.replace(tmp_path, output_path)
+    print(f'Квантованная модель опубликована в {output_path}')
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, required=True)
+    parser.add_argument('--output', type=str)
+    parser.add_argument('--days', type=int, default=quantization_replay_days)
+    parser.add_argument('--max-degradation', type=float, default=quantization_max_degradation)
+    args = parser.parse_args()
+
+    published = publish_quantized(model_path=args.model,
+                                  output_path=args.output or f'{os.path.normpath(args.model)}_int8',
+                                  days=args.days,
+                                  max_degradation=args.max_degradation)
+    sys.exit(0 if published else 1)
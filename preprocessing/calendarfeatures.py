@@ -0,0 +1,165 @@
+"""
+модуль содержит общие для предикторов функции формирования календарных признаков
+и прошлогодних значений временного ряда в виде массивов numpy
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+import numpy as np
+
+
+time_dict = {'hour'        : 24,
+             'day_of_year' : 365.25,
+             'month'       : 12,
+             'weekday'     : 7}
+
+
+def take(values: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """
+    Выбирает значения по позициям, для позиций за пределами массива возвращает np.nan
+    (аналог сдвига shift для отдельных строк)
+    """
+    result = np.full(len(positions), np.nan)
+    valid = (positions >= 0) & (positions < len(values))
+    result[valid] = values[positions[valid]]
+    return result
+
+
+def to_hours(stamps: np.ndarray) -> np.ndarray:
+    """
+    Переводит метки времени в целое число часов от начала эпохи
+    """
+    return np.asarray(stamps, dtype='datetime64[ns]').astype('datetime64[h]').astype(np.int64)
+
+
+def row_positions(index: pd.DatetimeIndex,
+                  points: Optional[List[datetime]] = None) -> np.ndarray:
+    """
+    Возвращает позиции строк с метками points в индексе index
+    (все строки, если points не передан).
+    Отсутствие хотя бы одной метки вызывает KeyError, как и .loc
+    """
+    if points is None:
+        return np.arange(len(index))
+    positions = index.get_indexer(pd.DatetimeIndex(points))
+    if (positions == -1).any():
+        raise KeyError(f'В исходных данных нет строк для {list(points)}')
+    return positions
+
+
+def trig_features(index: pd.DatetimeIndex,
+                  time_freq: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Кодирует время и дату тригонометрическими функциями.
+    Возвращает словарь массивов {'hour_sin': ..., 'hour_cos': ..., ...}
+    в порядке time_freq.
+    Доступны: {'hour', 'day_of_year', 'month', 'weekday'}
+    """
+    features = {}
+    for time_component in time_freq:
+        component = np.asarray(getattr(index, time_component))
+        features[f'{time_component}_sin'] = \
+            np.sin( 2 * np.pi * component / time_dict[time_component])
+        features[f'{time_component}_cos'] = \
+            np.cos( 2 * np.pi * component / time_dict[time_component])
+    return features
+
+
+def year_ago(stamps: np.ndarray) -> np.ndarray:
+    """
+    Векторный аналог stamp - relativedelta(years=1):
+    29 февраля переходит в 28 февраля прошлого года
+    """
+    stamps = np.asarray(stamps, dtype='datetime64[ns]')
+    days = stamps.astype('datetime64[D]')
+    months = stamps.astype('datetime64[M]')
+    day_in_month = (days - months.astype('datetime64[D]')).astype(np.int64)
+    # тот же месяц год назад и число дней в нем
+    prev_months = months - 12
+    prev_month_start = prev_months.astype('datetime64[D]')
+    prev_month_len = ((prev_months + 1).astype('datetime64[D]') - prev_month_start) \
+        .astype(np.int64)
+    prev_days = prev_month_start + np.minimum(day_in_month, prev_month_len - 1)
+    return prev_days + (stamps - days)
+
+
+def year_ago_positions(index: pd.DatetimeIndex,
+                       positions: np.ndarray,
+                       hours: List[int]) -> np.ndarray:
+    """
+    Возвращает матрицу позиций строк индекса с метками
+    index[positions] - 1 год + hours[j] часов (строка на позицию, колонка на сдвиг).
+    Для меток в пределах года до начала индекса возвращает -1 (значения np.nan),
+    для остальных отсутствующих меток вызывает KeyError.
+
+    Для равномерного часового индекса позиция вычисляется арифметикой над
+    целым числом часов, иначе - поиском по индексу
+    """
+    index_hours = to_hours(index.values)
+    target_hours = to_hours(year_ago(index.values[positions]))[:, None] + \
+        np.asarray(hours, dtype=np.int64)[None, :]
+
+    first_hour = index_hours[0]
+    is_regular = len(index_hours) == index_hours[-1] - first_hour + 1 and \
+        bool((np.diff(index_hours) == 1).all())
+    if is_regular:
+        found = target_hours - first_hour
+        found[(found < 0) | (found >= len(index_hours))] = -1
+    else:
+        found = pd.Index(index_hours).get_indexer(target_hours.ravel()) \
+            .reshape(target_hours.shape)
+
+    # метки, попадающие в год до начала данных, считаются пустыми
+    padding_start = to_hours(year_ago(index.values[:1]))[0]
+    missing = (found == -1) & \
+        ((target_hours >= first_hour) | (target_hours < padding_start))
+    if missing.any():
+        missing_stamps = target_hours[missing].astype('datetime64[h]')
+        raise KeyError(f'В исходных данных нет строк для {list(missing_stamps)}')
+
+    return found
+
+
+def future_features(trig: Dict[str, np.ndarray],
+                    day_off: np.ndarray,
+                    positions: np.ndarray,
+                    y_lags: List[int],
+                    time_freq: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Признаки времени, назначенного для конкретного предсказания,
+    и сведения о рабочем/выходном дне для каждого лага целевой переменной.
+    Колонки {time_component}_sin_{lag}, {time_component}_cos_{lag}, day_off_{lag}
+    """
+    features = {}
+    for lag in y_lags:
+        shifted = positions + lag + 1
+        for time_component in time_freq:
+            features[f'{time_component}_sin_{lag}'] = \
+                take(trig[f'{time_component}_sin'], shifted)
+            features[f'{time_component}_cos_{lag}'] = \
+                take(trig[f'{time_component}_cos'], shifted)
+        features[f'day_off_{lag}'] = take(day_off, shifted)
+    return features
+
+
+def previous_year_features(index: pd.DatetimeIndex,
+                           power: np.ndarray,
+                           temperature: np.ndarray,
+                           day_off: np.ndarray,
+                           positions: np.ndarray,
+                           y_lags: List[int]) -> Dict[str, np.ndarray]:
+    """
+    Прошлогодние потребление, температура и сведения о выходном дне
+    для каждого лага целевой переменной
+    """
+    shifted_matrix = year_ago_positions(index=index,
+                                        positions=positions,
+                                        hours=[lag + 1 for lag in y_lags])
+    features = {}
+    for i, lag in enumerate(y_lags):
+        shifted = shifted_matrix[:, i]
+        features[f'one_hour_consumption_previos_year_{lag}'] = take(power, shifted)
+        features[f'one_hour_temperature_previos_year_{lag}'] = take(temperature, shifted)
+        features[f'day_off_previos_year_{lag}'] = take(day_off, shifted)
+    return features
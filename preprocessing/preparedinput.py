@@ -0,0 +1,119 @@
+"""
+модуль содержит общие для всех предикторов исходные данные прогноза.
+
+PreparedInput создается один раз на прогноз (см. predict.call_predictors_batch)
+по окну почасовой истории и передается всем моделям ансамбля вместо копий датафрейма.
+Индекс времени и колонки истории разбираются один раз, производные признаки
+(календарные, прошлогодние, матрицы признаков моделей) вычисляются при первом
+обращении и переиспользуются следующими моделями. Все массивы только для чтения.
+Кэш потокобезопасен: модели, вызванные одновременно, вычисляют признак один раз
+"""
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, List, Optional, Union
+
+import pandas as pd
+import numpy as np
+
+from preprocessing.calendarfeatures import row_positions, trig_features, \
+    future_features, previous_year_features
+
+
+def _read_only(values: np.ndarray) -> np.ndarray:
+    """
+    представление массива, запрещающее запись
+    """
+    view = values.view()
+    view.flags.writeable = False
+    return view
+
+
+def _read_only_columns(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    словарь колонок с массивами только для чтения
+    """
+    return {name: _read_only(values) for name, values in columns.items()}
+
+
+class PreparedInput:
+    """
+    Неизменяемые исходные данные прогноза: индекс времени, массивы потребления,
+    температуры и признака выходного дня и кэш производных признаков
+    """
+    def __init__(self, data: pd.DataFrame):
+        self.frame = data
+        self.index = pd.DatetimeIndex(data['datetime'])
+        self.power = _read_only(data['power_true'].to_numpy(dtype=float))
+        self.temperature = _read_only(data['temperature'].to_numpy(dtype=float))
+        self.day_off = _read_only(data['day_off'].to_numpy(dtype=float))
+        self._cache: Dict[Hashable, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def cached(self, key: Hashable, builder: Callable[[], Any]) -> Any:
+        """
+        Возвращает значение по ключу key, при первом обращении вычисляет его
+        функцией builder(). Результат не должен изменяться вызывающим кодом
+        """
+        with self._lock:
+            entry = self._cache.setdefault(key, [threading.Lock(), False, None])
+        with entry[0]:
+            if not entry[1]:
+                entry[2] = builder()
+                entry[1] = True
+        return entry[2]
+
+    def positions(self, points: Optional[List[datetime]] = None) -> np.ndarray:
+        """
+        позиции строк с метками points (все строки, если points не передан)
+        """
+        return row_positions(index=self.index, points=points)
+
+    def trig(self, time_freq: List[str]) -> Dict[str, np.ndarray]:
+        """
+        тригонометрические признаки времени для всех строк (см. calendarfeatures.trig_features)
+        """
+        return self.cached(('trig', tuple(time_freq)),
+                           lambda: _read_only_columns(trig_features(index=self.index,
+                                                                    time_freq=time_freq)))
+
+    def future_features(self,
+                        positions: np.ndarray,
+                        y_lags   : List[int],
+                        time_freq: List[str]) -> Dict[str, np.ndarray]:
+        """
+        признаки времени и выходного дня по лагам целевой переменной для строк positions
+        """
+        return self.cached(('future', positions.tobytes(), tuple(y_lags), tuple(time_freq)),
+                           lambda: _read_only_columns(future_features(trig=self.trig(time_freq),
+                                                                      day_off=self.day_off,
+                                                                      positions=positions,
+                                                                      y_lags=y_lags,
+                                                                      time_freq=time_freq)))
+
+    def previous_year_features(self,
+                               positions: np.ndarray,
+                               y_lags   : List[int]) -> Dict[str, np.ndarray]:
+        """
+        прошлогодние значения по лагам целевой переменной для строк positions
+        """
+        return self.cached(('previous_year', positions.tobytes(), tuple(y_lags)),
+                           lambda: _read_only_columns(previous_year_features(index=self.index,
+                                                                             power=self.power,
+                                                                             temperature=self.temperature,
+                                                                             day_off=self.day_off,
+                                                                             positions=positions,
+                                                                             y_lags=y_lags)))
+
+
+def prepare_input(data: Union[pd.DataFrame, PreparedInput]) -> PreparedInput:
+    """
+    функция возвращает общие исходные данные по окну истории
+    (колонки datetime, power_true, temperature, day_off) или сами data,
+    если они уже подготовлены
+    """
+    if isinstance(data, PreparedInput):
+        return data
+    return PreparedInput(data)
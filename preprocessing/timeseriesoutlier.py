@@ -1,10 +1,200 @@
 """
-модуль содержит функцию для очитски датафрейма с timeseries от аномалий
+модуль содержит функции для очитски датафрейма с timeseries от аномалий
 """
+from typing import Dict, Optional
+
 import pandas as pd
 import numpy as np
 
 
+time_delta_dict = {'H': 'hour',
+                   'min': 'min',
+                   'S': 'sec'}
+
+
+def _ffill(values: np.ndarray) -> np.ndarray:
+    """
+    прямое заполнение пропусков в одномерном массиве (аналог .ffill())
+    """
+    positions = np.where(np.isnan(values), 0, np.arange(len(values)))
+    np.maximum.accumulate(positions, out=positions)
+    return values[positions]
+
+
+def _time_units(df: pd.DataFrame, time_col: Optional[str], freq: str) -> np.ndarray:
+    """
+    время строк датафрейма в единицах частоты freq.
+    Берется из колонки time_col, из индекса (если он временной) или номера строки
+    """
+    if time_col is not None:
+        times = pd.DatetimeIndex(df[time_col])
+    elif isinstance(df.index, pd.DatetimeIndex):
+        times = df.index
+    else:
+        return np.arange(len(df), dtype=float)
+    unit = pd.Timedelta(value=1, unit=time_delta_dict[freq])
+    return times.asi8 / unit.value
+
+
+def outlier_mask(values    : np.ndarray,
+                 times     : np.ndarray,
+                 min_diff  : float,
+                 time_delta: float,
+                 fill_gaps : bool = True) -> np.ndarray:
+    """
+    values - значения временного ряда
+    times - время измерений (в единицах частоты ряда)
+    min_diff - минимальное значение разницы двух соседних измерений,
+    чтобы назвать его аномалией
+    time_delta - максимальное время существования данной аномалии
+    fill_gaps - считать разницу по заполненным значениям
+
+    Возвращает булеву маску аномальных измерений.
+    Аномалией считаются измерения от скачка до следующего скачка (не включая его),
+    если между скачками прошло не более time_delta.
+    При fill_gaps=True пропуск не скрывает скачок: разница через пропуск считается
+    от последнего известного значения. При fill_gaps=False разница с пропуском
+    не определена и скачком не считается (как в pandas .diff())
+    """
+    diff = np.abs(np.diff(_ffill(values) if fill_gaps else values, prepend=np.nan))
+    jumps = np.flatnonzero(diff > min_diff)
+    starts, ends = jumps[:-1], jumps[1:]
+    close = (times[ends] - times[starts]) <= time_delta
+
+    # разметка интервалов [start, end) через накопленную сумму границ
+    bounds = np.zeros(len(values) + 1, dtype=np.int64)
+    bounds[starts[close]] += 1
+    bounds[ends[close]] -= 1
+    return np.cumsum(bounds[:-1]) > 0
+
+
+def clean_outliers(df        : pd.DataFrame,
+                   thresholds: Dict[str, float],
+                   time_delta: int = 1,
+                   freq      : str = 'H',
+                   time_col  : Optional[str] = None,
+                   fill_gaps : bool = True) -> None:
+    """
+    df - датафейм с временными рядами
+    thresholds - словарь {имя колонки: минимальное значение разницы двух соседних
+    измерений, чтобы назвать его аномалией}
+    time_delta - максимальное время существования аномалии
+    freq - временная частота ряда ('H', 'min' или 'S')
+    time_col - колонка с временем измерений. Если не задана, используется индекс
+    (если он временной) или номер строки
+    fill_gaps - искать скачки через пропуски (см. outlier_mask)
+
+    Функция заменяет факты аномалии на np.nan и заполняет пропуски в колонках
+    thresholds предыдущими значениями. Время работы линейно по длине датафрейма
+    """
+    times = _time_units(df=df, time_col=time_col, freq=freq)
+    for col_name, min_diff in thresholds.items():
+        values = df[col_name].to_numpy(dtype=float)
+        mask = outlier_mask(values=values,
+                            times=times,
+                            min_diff=min_diff,
+                            time_delta=time_delta,
+                            fill_gaps=fill_gaps)
+        df[col_name] = _ffill(np.where(mask, np.nan, values))
+    return None
+
+
+class StreamingOutlierCleaner:
+    """
+    Потоковый вариант clean_outliers для очистки ряда по частям (чанкам).
+
+    Между вызовами хранится последнее выданное измерение (для расчета разницы
+    и заполнения пропусков) и хвост чанка после последнего скачка, если его
+    аномальность может решиться следующим скачком. Хвост выдается со следующим
+    чанком или при вызове flush(), поэтому результат совпадает с обработкой
+    всего ряда за раз, а в памяти находится только текущий чанк
+    """
+    def __init__(self,
+                 thresholds: Dict[str, float],
+                 time_delta: int = 1,
+                 freq      : str = 'H',
+                 time_col  : Optional[str] = None):
+        self.thresholds = thresholds
+        self.time_delta = time_delta
+        self.freq = freq
+        self.time_col = time_col
+        # хвост, ожидающий следующего чанка, и уже известные для него аномалии
+        # (от скачков, предшествующих хвосту)
+        self._tail: Optional[pd.DataFrame] = None
+        self._tail_masks: Dict[str, np.ndarray] = {}
+        # исходные (с заполненными пропусками) и очищенные значения последнего
+        # выданного измерения, а также его время
+        self._last_raw = {col_name: np.nan for col_name in thresholds}
+        self._last_clean = {col_name: np.nan for col_name in thresholds}
+        self._last_time = np.nan
+
+    def process(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """
+        Принимает очередной чанк и возвращает очищенную часть ряда,
+        аномальность которой уже определена
+        """
+        if self._tail is not None:
+            chunk = pd.concat([self._tail, chunk])
+            self._tail = None
+        return self._clean(chunk=chunk, final=False)
+
+    def flush(self) -> pd.DataFrame:
+        """
+        Возвращает очищенный хвост ряда после последнего чанка
+        """
+        if self._tail is None:
+            return pd.DataFrame()
+        tail, self._tail = self._tail, None
+        return self._clean(chunk=tail, final=True)
+
+    def _clean(self, chunk: pd.DataFrame, final: bool) -> pd.DataFrame:
+        """
+        Очищает чанк с учетом последнего выданного измерения.
+        Если final=False, хвост после последнего скачка может быть удержан
+        """
+        times = _time_units(df=chunk, time_col=self.time_col, freq=self.freq)
+        if self.time_col is None and not isinstance(chunk.index, pd.DatetimeIndex):
+            # время - номер строки, продолжим его от последнего выданного измерения
+            times = times + (0 if np.isnan(self._last_time) else self._last_time + 1)
+        times_ext = np.concatenate([[self._last_time], times])
+
+        masks, raws = {}, {}
+        hold_from = len(chunk)
+        for col_name, min_diff in self.thresholds.items():
+            raw = np.concatenate([[self._last_raw[col_name]],
+                                  chunk[col_name].to_numpy(dtype=float)])
+            raws[col_name] = raw
+            masks[col_name] = outlier_mask(values=raw,
+                                           times=times_ext,
+                                           min_diff=min_diff,
+                                           time_delta=self.time_delta)[1:]
+            carried = self._tail_masks.get(col_name)
+            if carried is not None:
+                masks[col_name][:len(carried)] |= carried
+            # последний скачок может составить пару со скачком следующего чанка
+            jumps = np.flatnonzero(np.abs(np.diff(_ffill(raw))) > min_diff)
+            if not final and len(jumps) > 0 and times[-1] - times[jumps[-1]] < self.time_delta:
+                hold_from = min(hold_from, jumps[-1])
+
+        if hold_from < len(chunk):
+            self._tail = chunk.iloc[hold_from:]
+        self._tail_masks = {col_name: mask[hold_from:] for col_name, mask in masks.items()}
+        result = chunk.iloc[:hold_from].copy()
+        if hold_from == 0:
+            return result
+
+        for col_name in self.thresholds:
+            values = np.where(masks[col_name][:hold_from],
+                              np.nan,
+                              raws[col_name][1:hold_from + 1])
+            values = _ffill(np.concatenate([[self._last_clean[col_name]], values]))
+            result[col_name] = values[1:]
+            self._last_clean[col_name] = values[-1]
+            self._last_raw[col_name] = _ffill(raws[col_name][:hold_from + 1])[-1]
+        self._last_time = times[hold_from - 1]
+        return result
+
+
 def catch_time_series_outs(df: pd.DataFrame,
                            col_name: str,
                            min_diff: int,
@@ -23,30 +213,13 @@ def catch_time_series_outs(df: pd.DataFrame,
     min - minutely frequency
     S - secondly frequency
 
-    Функция заменяет факты аномалии на np.nan и вызывает метод .ffill() у датафрейма
+    Функция заменяет факты аномалии на np.nan и вызывает метод .ffill() у датафрейма.
+    Если индекс датафрейма не временной, время считается по номеру строки.
+    Скачки через пропуски не ищутся (разница с пропуском не определена, как в .diff())
     """
-    df_diff = np.abs(df.diff())
-    out_series = df_diff[df_diff[col_name] > min_diff].loc[:,col_name]
-    out_times = out_series.index
-    out_indexis = pd.Series(dtype='datetime64[ns]')
-
-    time_delta_dict = {'H': 'hour',
-                       'min': 'min',
-                       'S': 'sec'}
-
-    for i in range(len(out_times) - 1):
-
-        timediff = out_times[i+1] - out_times[i]
-        timediff /= pd.Timedelta(value=1,
-                                 unit = time_delta_dict[freq])
-
-        if timediff <= time_delta:
-            time_range = pd.Series(pd.date_range(start=out_times[i],
-                                                end=out_times[i+1],
-                                                freq=freq,
-                                                inclusive='left'))
-
-            out_indexis = pd.concat([out_indexis, time_range])
-
-    df.loc[out_indexis, col_name] = np.nan
+    clean_outliers(df=df,
+                   thresholds={col_name: min_diff},
+                   time_delta=time_delta,
+                   freq=freq,
+                   fill_gaps=False)
     df.ffill(inplace=True)
@@ -0,0 +1,113 @@
+"""
+модуль рисует картинки отчетов на холстах Agg без pyplot.
+
+Фигуры не регистрируются в глобальном состоянии pyplot и освобождаются сразу
+после сохранения, поэтому память не растет с числом картинок. Функции рисования
+принимают только простые данные (списки, массивы numpy), поэтому могут выполняться
+в пуле процессов: render_many распределяет картинки по ядрам, держа в работе
+не более двух заданий на процесс
+"""
+import os
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from config import render_workers
+
+
+def _new_figure(figsize: Tuple[float, float]) -> Figure:
+    """
+    фигура с холстом Agg, не связанная с pyplot
+    """
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def render_forecast(file_path: str,
+                    values   : Sequence[float],
+                    title    : str) -> None:
+    """
+    картинка прогноза на сутки: почасовое потребление values
+    """
+    fig = _new_figure(figsize=(6, 6))
+    ax = fig.subplots()
+
+    ax.plot(range(24), values, label='Прогнозное значение потребления')
+    ax.set_xlabel('Время суток')
+    ax.set_ylabel('Среднечасовое потребление, МВт')
+    ax.set_title(title)
+
+    ax.grid(True)
+    fig.savefig(file_path)
+    fig.clear()
+    return None
+
+
+def render_month(file_path: str, days: List[Dict[str, Any]]) -> None:
+    """
+    картинка мониторинга за месяц: по графику на сутки (по 7 в ряд).
+    days - список суток со словарями: title - заголовок, hours - часы суток,
+    true - факт, preds - {модель: прогноз}
+    """
+    nrows = len(days)//7 + bool(len(days)%7)
+    ncols = 7
+    fig = _new_figure(figsize=(21, 3*len(days)//7 + 3))
+    axes = fig.subplots(nrows=nrows, ncols=ncols, squeeze=False)
+
+    for i in range(nrows):
+        for j in range(ncols):
+            ax = axes[i, j]
+            if i*7 + j >= len(days):
+                ax.set_axis_off()
+                continue
+
+            day = days[i*7 + j]
+            ax.plot(day['hours'], day['true'], color='blue', label='true')
+            for model, values in day['preds'].items():
+                ax.plot(day['hours'], values, label=model, alpha=0.6)
+
+            ax.set_xticks(range(0, 24, 4))
+            ax.set_yticks([])
+            ax.set_title(day['title'])
+            ax.legend()
+
+    fig.tight_layout()
+    fig.savefig(file_path)
+    fig.clear()
+    return None
+
+
+def render_many(jobs   : Iterable[Tuple[Callable[..., None], Dict[str, Any]]],
+                workers: Optional[int] = None) -> int:
+    """
+    функция выполняет задания рисования (функция, именованные аргументы).
+    Задания распределяются по workers процессам (по умолчанию config.render_workers,
+    0 - по числу ядер); одно задание или один процесс выполняются без пула.
+    Функции заданий должны импортироваться на верхнем уровне модуля.
+
+    Возвращает число нарисованных картинок
+    """
+    jobs = list(jobs)
+    workers = min(workers or render_workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        for func, kwargs in jobs:
+            func(**kwargs)
+        return len(jobs)
+
+    # spawn - как в Windows: процессы не наследуют потоки и состояние родителя
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = set()
+        for func, kwargs in jobs:
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(executor.submit(func, **kwargs))
+        for future in wait(pending).done:
+            future.result()
+    return len(jobs)
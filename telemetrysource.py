@@ -0,0 +1,301 @@
+"""
+модуль описывает источники телеметрии (почасовых потребления и температуры)
+и догрузку данных за длинный период по частям.
+
+Источники:
+OikMacroSource - ОИК через макрос connection/load_data.xlsm (только Windows)
+LocalDirectorySource - папка с файлами .csv/.parquet (локальная замена ОИК)
+HttpSource - HTTP-сервис, отдающий csv (например, локальная заглушка,
+запускаемая этим же модулем)
+
+Пример запуска HTTP-заглушки над папкой с файлами:
+python telemetrysource.py --serve data/telemetry --port 8765
+"""
+import os
+import glob
+import time
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+import argparse
+import urllib.parse
+import urllib.request
+from io import StringIO
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from config import telemetry_source, telemetry_path, telemetry_url, telemetry_chunk_days, \
+    telemetry_workers, telemetry_retries
+
+
+# переименование колонок, в которых ОИК отдает телеметрию
+OIK_COLUMNS = {'average_hourly_consumption': 'power_true',
+               'average_hourly_temperature': 'temperature',}
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class TelemetryError(Exception):
+    """
+    Исключение, возникающее при неудачном получении телеметрии из источника
+    """
+
+
+class TelemetrySource(ABC):
+    """
+    Источник телеметрии (абстрактный класс, источники реализуют fetch).
+
+    Метод fetch возвращает датафрейм с колонками datetime, power_true, temperature
+    (метки времени в соглашении ОИК) за интервал [begin_time, end_time]
+    (границы включаются) или None, если данных нет.
+    Атрибут max_workers ограничивает число одновременных запросов
+    """
+    max_workers = telemetry_workers
+
+    @abstractmethod
+    def fetch(self, begin_time: datetime, end_time: datetime) -> Optional[pd.DataFrame]:
+        """
+        Получение телеметрии за интервал [begin_time, end_time]
+        """
+
+
+def _normalize(data      : pd.DataFrame,
+               begin_time: Optional[datetime] = None,
+               end_time  : Optional[datetime] = None) -> Optional[pd.DataFrame]:
+    """
+    приводит данные источника к колонкам datetime, power_true, temperature,
+    оставляет строки интервала [begin_time, end_time] (если он задан)
+    и сортирует по времени
+    """
+    data = data.rename(columns=OIK_COLUMNS)
+    data['datetime'] = pd.to_datetime(data['datetime'])
+    if begin_time is not None and end_time is not None:
+        data = data[(data['datetime'] >= begin_time) & (data['datetime'] <= end_time)]
+    data = data.loc[:, ['datetime', 'power_true', 'temperature']]
+    if len(data) == 0:
+        return None
+    return data.sort_values('datetime', kind='stable').reset_index(drop=True)
+
+
+class OikMacroSource(TelemetrySource):
+    """
+    ОИК через Excel-макрос. COM-объект Excel не допускает параллельных вызовов
+    """
+    max_workers = 1
+
+    def fetch(self, begin_time: datetime, end_time: datetime) -> Optional[pd.DataFrame]:
+        # модуль требует pywin32 и импортируется только при обращении к ОИК
+        from connect_to_oik import load_data_from_oik
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            data = load_data_from_oik(begin_time=begin_time,
+                                      end_time=end_time,
+                                      file_name=os.path.join(temp_dir, 'data_from_oik'))
+        if data is None:
+            return None
+        # интервал уже выдан макросом, метки времени ОИК не фильтруются
+        return _normalize(data)
+
+
+class LocalDirectorySource(TelemetrySource):
+    """
+    Папка с файлами .csv и .parquet, содержащими колонки datetime и
+    power_true, temperature (или колонки в наименованиях ОИК).
+
+    Файлы читаются один раз в общий отсортированный по времени датафрейм,
+    запросы частей периода получают его срезы. Датафрейм перечитывается,
+    если изменился состав файлов папки, их размер или время изменения
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[Tuple[str, int, int], ...]] = None
+        self._data: Optional[pd.DataFrame] = None
+
+    def _load(self) -> Optional[pd.DataFrame]:
+        """
+        данные всех файлов папки, отсортированные по времени (None, если файлов нет)
+        """
+        file_paths = [file_path for file_path in sorted(glob.glob(os.path.join(self.path, '*')))
+                      if file_path.endswith(('.csv', '.parquet'))]
+        signature = tuple((file_path, stat.st_size, stat.st_mtime_ns)
+                          for file_path, stat in ((file_path, os.stat(file_path))
+                                                  for file_path in file_paths))
+        # части периода запрашиваются параллельно, файлы читает только первый запрос
+        with self._lock:
+            if signature != self._signature:
+                # колонки переименовываются до объединения: файлы могут быть в разных наименованиях
+                frames = [(pd.read_csv(file_path) if file_path.endswith('.csv')
+                           else pd.read_parquet(file_path)).rename(columns=OIK_COLUMNS)
+                          for file_path in file_paths]
+                self._data = _normalize(pd.concat(frames, ignore_index=True)) if frames else None
+                self._signature = signature
+            return self._data
+
+    def fetch(self, begin_time: datetime, end_time: datetime) -> Optional[pd.DataFrame]:
+        data = self._load()
+        if data is None:
+            return None
+        times = data['datetime'].to_numpy()
+        begin = times.searchsorted(pd.Timestamp(begin_time).to_datetime64(), side='left')
+        end = times.searchsorted(pd.Timestamp(end_time).to_datetime64(), side='right')
+        if begin == end:
+            return None
+        return data.iloc[begin:end].reset_index(drop=True)
+
+
+class HttpSource(TelemetrySource):
+    """
+    HTTP-сервис, отвечающий на GET {url}?begin=...&end=... таблицей csv
+    """
+    def __init__(self, url: str, timeout: float = 60):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self, begin_time: datetime, end_time: datetime) -> Optional[pd.DataFrame]:
+        query = urllib.parse.urlencode({'begin': begin_time.strftime(TIME_FORMAT),
+                                        'end': end_time.strftime(TIME_FORMAT)})
+        with urllib.request.urlopen(f'{self.url}?{query}', timeout=self.timeout) as response:
+            text = response.read().decode('utf8')
+        if not text.strip():
+            return None
+        return _normalize(pd.read_csv(StringIO(text)), begin_time, end_time)
+
+
+def get_telemetry_source(name: Optional[str] = None) -> TelemetrySource:
+    """
+    функция возвращает источник телеметрии по имени (oik, local или http),
+    по умолчанию - заданный в config.telemetry_source
+    """
+    name = name or telemetry_source
+    if name == 'oik':
+        return OikMacroSource()
+    if name == 'local':
+        return LocalDirectorySource(path=telemetry_path)
+    if name == 'http':
+        return HttpSource(url=telemetry_url)
+    raise ValueError(f'Неизвестный источник телеметрии {name}, доступны: oik, local, http')
+
+
+def split_period(begin_time: datetime,
+                 end_time  : datetime,
+                 chunk     : timedelta,
+                 step      : timedelta = timedelta(hours=1)) -> List[Tuple[datetime, datetime]]:
+    """
+    функция делит интервал [begin_time, end_time] на идущие подряд части
+    длиной не более chunk, границы частей включаются и отстоят на шаг step
+    """
+    assert end_time >= begin_time, \
+        'Укажите время начало среза не позднее времени окончания'
+    chunks = []
+    chunk_begin = begin_time
+    while chunk_begin <= end_time:
+        chunk_end = min(chunk_begin + chunk - step, end_time)
+        chunks.append((chunk_begin, chunk_end))
+        chunk_begin = chunk_end + step
+    return chunks
+
+
+def _fetch_with_retries(source    : TelemetrySource,
+                        begin_time: datetime,
+                        end_time  : datetime,
+                        retries   : int) -> Optional[pd.DataFrame]:
+    """
+    запрос части периода с повторами при ошибке (с нарастающей паузой)
+    """
+    for attempt in range(retries + 1):
+        try:
+            return source.fetch(begin_time=begin_time, end_time=end_time)
+        except Exception as error:
+            if attempt == retries:
+                raise TelemetryError(f'Не удалось получить телеметрию за {begin_time} - '
+                                     f'{end_time}: {str(error)}') from error
+            print(f'Ошибка {str(error)} при получении телеметрии за {begin_time} - '
+                  f'{end_time}, повтор {attempt + 1} из {retries}')
+            time.sleep(2 ** attempt)
+    return None
+
+
+def fetch_telemetry(begin_time: datetime,
+                    end_time  : datetime,
+                    source    : Optional[TelemetrySource] = None,
+                    chunk     : timedelta = timedelta(days=telemetry_chunk_days),
+                    retries   : int = telemetry_retries) -> Optional[pd.DataFrame]:
+    """
+    функция получает телеметрию за интервал [begin_time, end_time].
+
+    Длинный интервал делится на части по chunk, которые запрашиваются параллельно
+    (не более source.max_workers одновременно), каждая со своими повторами
+    при ошибке. Части собираются в хронологическом порядке.
+    Возвращает None, если источник не вернул данных
+    """
+    source = source or get_telemetry_source()
+    chunks = split_period(begin_time=begin_time, end_time=end_time, chunk=chunk)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(source.max_workers, len(chunks)))) as executor:
+        frames = list(executor.map(lambda period: _fetch_with_retries(source,
+                                                                      period[0],
+                                                                      period[1],
+                                                                      retries),
+                                   chunks))
+
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True) \
+        .drop_duplicates(subset='datetime', keep='last') \
+        .reset_index(drop=True)
+
+
+def make_directory_server(path: str, port: int) -> 'ThreadingHTTPServer':
+    """
+    функция создает локальную HTTP-заглушку ОИК, отдающую данные папки path
+    в формате, который ожидает HttpSource (port=0 - любой свободный порт,
+    занятый порт - server.server_address[1])
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    source = LocalDirectorySource(path=path)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            try:
+                data = source.fetch(begin_time=datetime.strptime(params['begin'][0], TIME_FORMAT),
+                                    end_time=datetime.strptime(params['end'][0], TIME_FORMAT))
+            except (KeyError, ValueError) as error:
+                self.send_error(400, str(error))
+                return
+            body = b'' if data is None else \
+                data.to_csv(index=False, date_format=TIME_FORMAT).encode('utf8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return ThreadingHTTPServer(('127.0.0.1', port), Handler)
+
+
+def serve_directory(path: str, port: int) -> None:
+    """
+    функция запускает локальную HTTP-заглушку ОИК над папкой path
+    (см. make_directory_server) и обслуживает запросы до остановки процесса
+    """
+    server = make_directory_server(path=path, port=port)
+    print(f'Заглушка ОИК отдает данные из {path} на http://127.0.0.1:{port}/')
+    server.serve_forever()
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serve', type=str)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve_directory(path=args.serve, port=args.port)
@@ -0,0 +1,46 @@
+"""
+общие фикстуры тестов: пустая БД и небольшая синтетическая БД
+(см. benchmarks/syntheticdata.py)
+"""
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from benchmarks.syntheticdata import synthetic_calendar, synthetic_history, create_synthetic_db
+from database import close_connections
+from dbschema import create_schema
+
+
+# факты есть до LAST_FACT включительно, календарь - до конца CALENDAR_END
+HISTORY_START = datetime(2022, 1, 1)
+LAST_FACT = datetime(2023, 1, 20, 23)
+CALENDAR_END = datetime(2023, 1, 31)
+
+
+@pytest.fixture
+def synthetic_db(tmp_path):
+    """
+    путь к синтетической БД схемы версии 2 с фактами и календарем
+    """
+    path = os.path.join(tmp_path, 'base.sqlite')
+    create_synthetic_db(path=path,
+                        history=synthetic_history(start=HISTORY_START, end=CALENDAR_END),
+                        calendar=synthetic_calendar(start=HISTORY_START, end=CALENDAR_END),
+                        last_fact=LAST_FACT)
+    yield path
+    close_connections()
+
+
+@pytest.fixture
+def empty_db(tmp_path):
+    """
+    путь к пустой БД схемы версии 2
+    """
+    path = os.path.join(tmp_path, 'empty.sqlite')
+    conn = sqlite3.connect(path)
+    create_schema(conn)
+    conn.close()
+    yield path
+    close_connections()
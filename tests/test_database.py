@@ -0,0 +1,123 @@
+"""
+тесты записи факта и прогнозов в БД (database.py)
+"""
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import database
+from database import get_connection, insert_calendar, update_facts, write_forecasts
+from dbschema import to_epoch_hour
+
+
+START = datetime(2024, 1, 1)
+
+
+def _facts(first_hour: int, hours: int, power: float = 5000.0) -> pd.DataFrame:
+    """
+    факты за hours часов начиная с часа first_hour от START
+    """
+    return pd.DataFrame({'datetime': pd.date_range(START + timedelta(hours=first_hour),
+                                                   periods=hours, freq='H'),
+                         'power_true': power,
+                         'temperature': -5.0})
+
+
+def _forecasts(power: float, models=('lgbm', 'rnn')) -> pd.DataFrame:
+    """
+    прогнозы моделей models на сутки START в длинном формате
+    """
+    hours = pd.date_range(START, periods=24, freq='H')
+    return pd.DataFrame({'datetime': list(hours) * len(models),
+                         'model': [model for model in models for _ in hours],
+                         'power_pred': power})
+
+
+def _stored(path: str, table: str = 'predict_table') -> list:
+    """
+    прогнозы таблицы table, упорядоченные по модели и часу
+    """
+    return get_connection(path).execute(
+        f'SELECT model, datetime, power_pred FROM {table} ORDER BY model, datetime;').fetchall()
+
+
+def test_update_facts_counts(empty_db, monkeypatch):
+    """
+    заготовки календаря дополняются (updated), новые часы добавляются (inserted),
+    заполненные часы не меняются (skipped), в том числе при записи несколькими пакетами
+    """
+    monkeypatch.setattr(database, 'db_upsert_batch_size', 10)
+    insert_calendar(pd.DataFrame({'day': [START, START + timedelta(days=1)], 'day_off': [0, 1]}),
+                    path=empty_db)
+
+    assert update_facts(_facts(0, 24), path=empty_db) == \
+        {'inserted': 0, 'updated': 24, 'skipped': 0}
+    assert update_facts(_facts(12, 42, power=6000.0), path=empty_db) == \
+        {'inserted': 6, 'updated': 24, 'skipped': 12}
+
+    rows = get_connection(empty_db).execute(
+        'SELECT datetime, power_true FROM consumption_table ORDER BY datetime;').fetchall()
+    first = to_epoch_hour(START)
+    assert [hour for hour, _ in rows] == list(range(first, first + 54))
+    assert [power for _, power in rows] == [5000.0] * 24 + [6000.0] * 30
+
+
+def test_write_forecasts_skip(empty_db):
+    """
+    политика skip оставляет имеющиеся прогнозы
+    """
+    assert write_forecasts(_forecasts(5000.0, models=('lgbm',)), policy='skip', path=empty_db) == \
+        {'written': 24, 'skipped': 0}
+    assert write_forecasts(_forecasts(6000.0), policy='skip', path=empty_db) == \
+        {'written': 24, 'skipped': 24}
+    stored = _stored(empty_db)
+    assert [power for model, _, power in stored if model == 'lgbm'] == [5000.0] * 24
+    assert [power for model, _, power in stored if model == 'rnn'] == [6000.0] * 24
+
+
+def test_write_forecasts_replace(empty_db):
+    """
+    политика replace заменяет имеющиеся прогнозы без архива
+    """
+    write_forecasts(_forecasts(5000.0), policy='replace', path=empty_db)
+    assert write_forecasts(_forecasts(6000.0), policy='replace', path=empty_db) == \
+        {'written': 48, 'skipped': 0}
+    assert [power for _, _, power in _stored(empty_db)] == [6000.0] * 48
+    assert _stored(empty_db, table='predict_archive_table') == []
+
+
+@pytest.mark.parametrize('rounds', [2, 3])
+def test_write_forecasts_version(empty_db, rounds):
+    """
+    политика version заменяет прогнозы, а прежние сохраняет в архиве с номерами версий
+    """
+    for i in range(rounds):
+        assert write_forecasts(_forecasts(5000.0 + i), policy='version', path=empty_db) == \
+            {'written': 48, 'skipped': 0}
+    assert [power for _, _, power in _stored(empty_db)] == [5000.0 + rounds - 1] * 48
+
+    archive = get_connection(empty_db).execute(
+        'SELECT version, power_pred FROM predict_archive_table ORDER BY model, datetime, version;'
+    ).fetchall()
+    assert archive == [(version, 5000.0 + version - 1)
+                       for _ in range(48) for version in range(1, rounds)]
+
+
+def test_write_forecasts_version_unchanged(empty_db):
+    """
+    политика version не архивирует и не пропускает в запись совпадающие прогнозы
+    """
+    write_forecasts(_forecasts(5000.0), policy='version', path=empty_db)
+    for _ in range(2):
+        assert write_forecasts(_forecasts(5000.0), policy='version', path=empty_db) == \
+            {'written': 0, 'skipped': 48}
+    assert _stored(empty_db, table='predict_archive_table') == []
+
+    # изменился прогноз только одной модели
+    changed = _forecasts(5000.0)
+    changed.loc[changed['model'] == 'rnn', 'power_pred'] = 5100.0
+    assert write_forecasts(changed, policy='version', path=empty_db) == \
+        {'written': 24, 'skipped': 24}
+    archive = _stored(empty_db, table='predict_archive_table')
+    assert [(model, power) for model, _, power in archive] == [('rnn', 5000.0)] * 24
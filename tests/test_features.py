@@ -0,0 +1,167 @@
+"""
+тесты признаков моделей: make_data lgbm и rnn и окна рекуррентного входа rnn
+совпадают с исходной реализацией на pandas (до расчета признаков только для нужных строк)
+"""
+import re
+import warnings
+from datetime import datetime, timedelta
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pytest
+from dateutil.relativedelta import relativedelta
+
+from database import read_history
+from predictors.lgbm.predictor_lgbm import LAGS, Y_LAGS, TIME_FREQ, make_data as lgbm_make_data
+from preprocessing.preparedinput import prepare_input
+
+
+# моменты прогноза (11:00 суток перед прогнозируемыми)
+PREDICT_TIMES = [datetime(2023, 1, 5, 11), datetime(2023, 1, 6, 11), datetime(2023, 1, 12, 11)]
+
+RNN_WINDOW = 179
+
+
+def _baseline_features(df: pd.DataFrame, y_lags: List[int], time_freq: List[str]) -> pd.DataFrame:
+    """
+    исходный расчет общих признаков всех строк: тригонометрические признаки времени,
+    признаки по горизонтам (сдвигом строк) и прошлогодние значения (по меткам времени)
+    """
+    time_dict = {'hour': 24, 'day_of_year': 365.25, 'month': 12, 'weekday': 7}
+    df = df.set_index('datetime')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for time_component in time_freq:
+            values = getattr(df.index, time_component)
+            df[f'{time_component}_sin'] = np.sin(2 * np.pi * values / time_dict[time_component])
+            df[f'{time_component}_cos'] = np.cos(2 * np.pi * values / time_dict[time_component])
+
+        for lag in y_lags:
+            for time_component in time_freq:
+                df[f'{time_component}_sin_{lag}'] = df[f'{time_component}_sin'].shift(-lag - 1)
+                df[f'{time_component}_cos_{lag}'] = df[f'{time_component}_cos'].shift(-lag - 1)
+            df[f'day_off_{lag}'] = df['day_off'].shift(-lag - 1)
+
+        temp_df = pd.concat([pd.DataFrame(columns=['power_true', 'temperature', 'day_off'],
+                                          index=pd.date_range(start=df.index[0] - relativedelta(years=1),
+                                                              end=df.index[0],
+                                                              freq='H')[:-1]),
+                             df[['power_true', 'temperature', 'day_off']].copy()], axis=0)
+        # DateOffset(years=1) сдвигает метки так же, как relativedelta(years=1) (29.02 -> 28.02)
+        year_ago = df.index - pd.DateOffset(years=1)
+        for lag in y_lags:
+            shifted_index = year_ago + pd.Timedelta(hours=lag + 1)
+            df[[f'one_hour_consumption_previos_year_{lag}',
+                f'one_hour_temperature_previos_year_{lag}',
+                f'day_off_previos_year_{lag}']] = \
+                temp_df.loc[shifted_index, ['power_true', 'temperature', 'day_off']].values
+    return df
+
+
+def _baseline_lgbm(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    исходная матрица признаков lgbm для всех строк
+    """
+    features = _baseline_features(df, y_lags=Y_LAGS, time_freq=TIME_FREQ)
+    lags = pd.DataFrame({f'{name}_lag_{lag}': features[col_name].shift(lag)
+                         for lag in LAGS
+                         for name, col_name in (('P', 'power_true'), ('t', 'temperature'))})
+    return pd.concat([lags, features.drop(columns=['power_true', 'temperature', 'day_off'] +
+                                          [f'{time_component}_{func}'
+                                           for time_component in TIME_FREQ
+                                           for func in ('sin', 'cos')])], axis=1)
+
+
+def _baseline_rnn(df: pd.DataFrame, y_lags: List[int], time_freq: List[str]) -> pd.DataFrame:
+    """
+    исходные признаки rnn для всех строк
+    """
+    return _baseline_features(df, y_lags=y_lags, time_freq=time_freq) \
+        .rename(columns={'power_true': 'one_hour_consumption',
+                         'temperature': 'one_hour_temperature'})
+
+
+@pytest.fixture
+def history(synthetic_db) -> pd.DataFrame:
+    """
+    окно истории, как его читает call_predictors_batch для PREDICT_TIMES
+    """
+    return read_history(start_time=datetime(2022, 1, 5), end_time=datetime(2023, 1, 14),
+                        path=synthetic_db)
+
+
+def test_lgbm_make_data(history):
+    """
+    признаки lgbm для моментов прогноза совпадают с исходными
+    """
+    expected = _baseline_lgbm(history).loc[PREDICT_TIMES].astype(float)
+    actual = lgbm_make_data(df=history, lags=LAGS, y_lags=Y_LAGS, time_freq=TIME_FREQ,
+                            points=PREDICT_TIMES)
+    pd.testing.assert_frame_equal(actual, expected, check_names=False, check_freq=False)
+
+    # общие исходные данные дают ту же матрицу и не изменяют датафрейм
+    source = history.copy()
+    prepared = prepare_input(history)
+    pd.testing.assert_frame_equal(lgbm_make_data(df=prepared, lags=LAGS, y_lags=Y_LAGS,
+                                                 time_freq=TIME_FREQ, points=PREDICT_TIMES),
+                                  actual)
+    pd.testing.assert_frame_equal(history, source)
+
+
+class _IdentityScaler:
+    """
+    скеллер, не изменяющий данные
+    """
+    def transform(self, values: np.ndarray) -> np.ndarray:
+        return values
+
+
+class _RecordingSession:
+    """
+    сессия onnxruntime, запоминающая входы модели
+    """
+    def __init__(self):
+        self.feeds = []
+
+    def get_inputs(self):
+        return [type('Input', (), {'name': name})() for name in ('rnn', 'dense')]
+
+    def run(self, output_names, feed):
+        self.feeds.append(feed)
+        return [np.zeros((len(feed['dense']), 24), dtype=np.float32)]
+
+
+def test_rnn_windows(history, monkeypatch):
+    """
+    окна рекуррентного входа и полносвязный вход rnn для нескольких моментов
+    прогноза (одним вызовом) совпадают с исходными для каждого момента
+    """
+    pytest.importorskip('onnxruntime')
+    from predictors.rnn import predictor_rnn
+
+    session = _RecordingSession()
+
+    class Cache:
+        def get(self, file_path, loader):
+            return session if file_path.endswith('model.onnx') else (_IdentityScaler(), _IdentityScaler())
+
+    monkeypatch.setattr(predictor_rnn, 'model_cache', Cache())
+    predictor_rnn.rnn_model(data=history, date=PREDICT_TIMES, model_path='unused')
+    feed, = session.feeds
+
+    X = _baseline_rnn(history, y_lags=predictor_rnn.Y_LAGS, time_freq=predictor_rnn.TIME_FREQ)
+    rnn_cols = ['one_hour_consumption', 'one_hour_temperature'] + \
+        [col_name for col_name in X.columns if re.findall(r'[a-zA-Z_]+(?:sin|cos|off)\b', col_name)]
+    dense_scalled = [col_name for col_name in X.columns if re.findall(
+        r'(?:one_hour_consumption_previos_year|one_hour_temperature_previos_year)_(\d+)', col_name)]
+    dense_not_scalled = [col_name for col_name in X.columns if re.findall(
+        r'[a-zA-Z_]+[(?:sin|cos|off)|(?:day_off_previos_year)]_(?=.*\d+)', col_name)
+        and col_name not in dense_scalled]
+
+    assert feed['rnn'].shape == (len(PREDICT_TIMES), RNN_WINDOW + 1, len(rnn_cols))
+    for i, date in enumerate(PREDICT_TIMES):
+        window = X.loc[date - timedelta(hours=RNN_WINDOW): date, rnn_cols].to_numpy(dtype=float)
+        dense = X.loc[date, dense_scalled + dense_not_scalled].to_numpy(dtype=float)
+        np.testing.assert_array_equal(feed['rnn'][i], window.astype(np.float32))
+        np.testing.assert_array_equal(feed['dense'][i], dense.astype(np.float32))
@@ -0,0 +1,112 @@
+"""
+тесты колоночного кэша истории (historycache.py)
+"""
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from database import get_connection, read_history, update_facts
+from dbschema import to_epoch_hour
+from historycache import read_cached_history, sync_history_cache, _load_meta
+
+
+# интервалы: внутри истории, захватывающие ее начало и заготовки календаря, вне истории
+INTERVALS = [(datetime(2022, 3, 1, 5), datetime(2022, 9, 1)),
+             (datetime(2021, 6, 1), datetime(2022, 2, 1)),
+             (datetime(2023, 1, 1), datetime(2023, 3, 1)),
+             (datetime(2024, 1, 1), datetime(2024, 2, 1)),]
+
+
+def _mapped_file(values: np.ndarray) -> np.ndarray:
+    """
+    массив, владеющий памятью values (для среза memmap - сам memmap)
+    """
+    while isinstance(values.base, np.ndarray):
+        values = values.base
+    return values
+
+
+def test_read_is_zero_copy(synthetic_db, tmp_path):
+    """
+    потребление и температура - срезы файлов кэша, доступные только для чтения
+    """
+    data = read_cached_history(start_time=datetime(2022, 6, 1),
+                               end_time=datetime(2023, 1, 1),
+                               cache_path=os.path.join(tmp_path, 'cache'),
+                               db_path=synthetic_db)
+
+    # каждая колонка - отдельный блок
+    assert data._mgr.nblocks == len(data.columns)
+    for col_name in ('power_true', 'temperature'):
+        values = data[col_name].to_numpy()
+        mapped = _mapped_file(values)
+        assert isinstance(mapped, np.memmap)
+        generation = _load_meta(os.path.join(tmp_path, 'cache'))['generation']
+        assert mapped.filename == os.path.join(tmp_path, 'cache', f'{col_name}.{generation}.bin')
+        assert np.shares_memory(values, mapped)
+        assert not values.flags.writeable
+
+
+def test_read_matches_database(synthetic_db, tmp_path):
+    """
+    чтение из кэша совпадает с чтением из БД после удаления часов, заполнения
+    пропусков задним числом и дописывания фактов
+    """
+    cache_path = os.path.join(tmp_path, 'cache')
+
+    def check() -> None:
+        for start_time, end_time in INTERVALS:
+            cached = read_cached_history(start_time=start_time, end_time=end_time,
+                                         cache_path=cache_path, db_path=synthetic_db)
+            expected = read_history(start_time=start_time, end_time=end_time, path=synthetic_db)
+            # у пустого результата запроса к БД колонки типа object
+            pd.testing.assert_frame_equal(cached, expected, check_dtype=len(expected) > 0)
+
+    def facts(start_time: datetime, hours: int) -> pd.DataFrame:
+        return pd.DataFrame({'datetime': pd.date_range(start_time, periods=hours, freq='H'),
+                             'power_true': 5000.0, 'temperature': -5.0})
+
+    check()
+
+    # пропуски часов и фактов в истории после построения кэша
+    conn = get_connection(synthetic_db)
+    with conn:
+        conn.execute('DELETE FROM consumption_table WHERE datetime >= ? AND datetime < ?;',
+                     (to_epoch_hour(datetime(2022, 5, 10)), to_epoch_hour(datetime(2022, 5, 11, 6))))
+        conn.execute('UPDATE consumption_table SET power_true = NULL, temperature = NULL '
+                     'WHERE datetime >= ? AND datetime < ?;',
+                     (to_epoch_hour(datetime(2022, 7, 1)), to_epoch_hour(datetime(2022, 7, 3))))
+    check()
+
+    # пропуски заполняются задним числом (последний час с фактом не меняется)
+    update_facts(facts(datetime(2022, 5, 10), 30), path=synthetic_db)
+    check()
+    update_facts(facts(datetime(2022, 7, 1), 48), path=synthetic_db)
+    check()
+    assert _load_meta(cache_path)['missing'] == []
+
+    # догрузка фактов в заготовки календаря
+    update_facts(facts(datetime(2023, 1, 21), 48), path=synthetic_db)
+    check()
+
+
+def test_sync_keeps_previous_generation(synthetic_db, tmp_path):
+    """
+    синхронизация не меняет файлы, уже отображенные в память читателем
+    """
+    cache_path = os.path.join(tmp_path, 'cache')
+    before = read_cached_history(start_time=datetime(2022, 1, 1), end_time=datetime(2023, 2, 1),
+                                 cache_path=cache_path, db_path=synthetic_db)
+    expected = before.copy()
+
+    hours = pd.date_range(datetime(2023, 1, 21), periods=48, freq='H')
+    update_facts(pd.DataFrame({'datetime': hours, 'power_true': 5000.0, 'temperature': -5.0}),
+                 path=synthetic_db)
+    assert sync_history_cache(cache_path=cache_path, db_path=synthetic_db) > 0
+
+    pd.testing.assert_frame_equal(before, expected)
+    after = read_cached_history(start_time=datetime(2022, 1, 1), end_time=datetime(2023, 2, 1),
+                                cache_path=cache_path, db_path=synthetic_db)
+    assert after['power_true'].notna().sum() == expected['power_true'].notna().sum() + 48
@@ -0,0 +1,98 @@
+"""
+тесты перевода БД исходной схемы на схему версии 2 (migratedb.py)
+"""
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from dbschema import SCHEMA_VERSION, to_epoch_hour
+from migratedb import MigrationError, migrate_db
+
+
+# исходная схема (см. createdb.py до версии 2): метки времени - текст
+V1_SCHEMA = """
+    CREATE TABLE consumption_table
+        (id INTEGER PRIMARY KEY AUTOINCREMENT, power_true REAL, temperature REAL, datetime TIMESTAMP);
+    CREATE TABLE day_off_table
+        (id INTEGER PRIMARY KEY AUTOINCREMENT, day_off INTEGER, datetime TIMESTAMP);
+    CREATE TABLE predict_table
+        (id INTEGER PRIMARY KEY AUTOINCREMENT, power_pred REAL, model TEXT, datetime TIMESTAMP);
+"""
+
+
+@pytest.fixture
+def v1_db(tmp_path):
+    """
+    БД исходной схемы с дублями часов, суток и прогнозов
+    """
+    path = os.path.join(tmp_path, 'v1.sqlite')
+    conn = sqlite3.connect(path)
+    conn.executescript(V1_SCHEMA)
+    conn.executemany('INSERT INTO consumption_table (power_true, temperature, datetime) VALUES (?, ?, ?);',
+                     [(None, None, '2024-01-01 00:00:00'),
+                      (5000.0, -3.0, '2024-01-01 00:00:00'),
+                      (5100.0, -4.0, '2024-01-01 01:00:00'),
+                      (5200.0, -5.0, '2024-01-01 01:00:00'),
+                      (None, None, '2024-01-01 02:00:00'),])
+    conn.executemany('INSERT INTO day_off_table (day_off, datetime) VALUES (?, ?);',
+                     [(None, '2024-01-01 00:00:00'),
+                      (1, '2024-01-01 00:00:00'),])
+    conn.executemany('INSERT INTO predict_table (power_pred, model, datetime) VALUES (?, ?, ?);',
+                     [(5050.0, 'lgbm', '2024-01-01 00:00:00'),
+                      (9999.0, 'lgbm', '2024-01-01 00:00:00'),
+                      (5000.0, 'lgbm', '2024-01-01 01:00:00'),])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_migration(v1_db):
+    """
+    миграция оставляет по строке на час (с фактом или первую), переводит метки
+    времени в номера часов, заполняет агрегаты ошибок и проставляет версию схемы
+    """
+    assert migrate_db(path=v1_db, vacuum=False)
+
+    conn = sqlite3.connect(v1_db)
+    hour = to_epoch_hour(datetime(2024, 1, 1))
+    assert conn.execute('PRAGMA user_version;').fetchone()[0] == SCHEMA_VERSION
+    assert conn.execute('SELECT datetime, power_true, temperature FROM consumption_table '
+                        'ORDER BY datetime;').fetchall() == \
+        [(hour, 5000.0, -3.0), (hour + 1, 5100.0, -4.0), (hour + 2, None, None)]
+    assert conn.execute('SELECT datetime, day_off FROM day_off_table;').fetchall() == [(hour, 1)]
+    assert conn.execute('SELECT datetime, model, power_pred FROM predict_table '
+                        'ORDER BY datetime;').fetchall() == \
+        [(hour, 'lgbm', 5050.0), (hour + 1, 'lgbm', 5000.0)]
+    assert conn.execute('SELECT datetime, model, abs_error_sum, count FROM forecast_errors;') \
+        .fetchall() == [(hour, 'lgbm', 150.0, 2)]
+    conn.close()
+
+    # повторный запуск ничего не меняет
+    assert not migrate_db(path=v1_db, vacuum=False)
+
+
+def test_unconvertible_timestamps_abort(v1_db):
+    """
+    строки с метками времени, которые не переводятся в номера часов, не теряются:
+    миграция не выполняется, БД остается в исходной схеме
+    """
+    conn = sqlite3.connect(v1_db)
+    conn.executemany('INSERT INTO consumption_table (power_true, temperature, datetime) VALUES (?, ?, ?);',
+                     [(5300.0, -6.0, '01.01.2024 03:00'),
+                      (5400.0, -7.0, None),])
+    conn.execute("INSERT INTO predict_table (power_pred, model, datetime) VALUES (1.0, 'rnn', 'вчера');")
+    conn.commit()
+    conn.close()
+
+    with pytest.raises(MigrationError) as error:
+        migrate_db(path=v1_db, vacuum=False)
+    assert 'consumption_table: 2' in str(error.value)
+    assert 'predict_table: 1' in str(error.value)
+    assert 'day_off_table' not in str(error.value)
+
+    conn = sqlite3.connect(v1_db)
+    assert conn.execute('PRAGMA user_version;').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM consumption_table;').fetchone()[0] == 7
+    conn.close()
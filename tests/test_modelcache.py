@@ -0,0 +1,35 @@
+"""
+тесты кэша артефактов моделей (predictors/modelcache.py)
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from predictors.modelcache import ModelCache
+
+
+def test_concurrent_miss_loads_once(tmp_path):
+    """
+    одновременные запросы незагруженного файла вызывают загрузчик один раз
+    """
+    file_path = os.path.join(tmp_path, 'model.bin')
+    with open(file_path, 'wb') as file:
+        file.write(b'model')
+
+    cache = ModelCache(max_bytes=1024)
+    calls = []
+    calls_lock = threading.Lock()
+
+    def loader(path: str) -> object:
+        with calls_lock:
+            calls.append(path)
+        time.sleep(0.1)
+        return object()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        artifacts = list(executor.map(lambda _: cache.get(file_path, loader=loader), range(8)))
+
+    assert len(calls) == 1
+    assert all(artifact is artifacts[0] for artifact in artifacts)
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 7
@@ -0,0 +1,79 @@
+"""
+тесты сессий onnxruntime с кэшем оптимизированного графа (predictors/ortsession.py)
+"""
+import os
+import stat
+
+import numpy as np
+import pytest
+
+pytest.importorskip('onnxruntime')
+onnx = pytest.importorskip('onnx')
+from onnx import helper, TensorProto
+
+from predictors import ortsession
+from predictors.ortsession import load_session, optimized_path
+
+
+@pytest.fixture
+def model_path(tmp_path) -> str:
+    """
+    модель y = x * 2 + 1 в папке, доступной только для чтения
+    """
+    graph = helper.make_graph(
+        [helper.make_node('Mul', ['x', 'two'], ['x2']), helper.make_node('Add', ['x2', 'one'], ['y'])],
+        'affine',
+        [helper.make_tensor_value_info('x', TensorProto.FLOAT, ['batch', 3])],
+        [helper.make_tensor_value_info('y', TensorProto.FLOAT, ['batch', 3])],
+        initializer=[helper.make_tensor('two', TensorProto.FLOAT, [1], [2.0]),
+                     helper.make_tensor('one', TensorProto.FLOAT, [1], [1.0])])
+    model_dir = os.path.join(tmp_path, 'model')
+    os.makedirs(model_dir)
+    path = os.path.join(model_dir, 'model.onnx')
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+    os.chmod(model_dir, stat.S_IRUSR | stat.S_IXUSR)
+    yield path
+    os.chmod(model_dir, stat.S_IRWXU)
+
+
+def _check(session) -> None:
+    x = np.arange(6, dtype=np.float32).reshape(2, 3)
+    np.testing.assert_allclose(session.run(None, {'x': x})[0], x * 2 + 1)
+
+
+def test_graph_cached_outside_model_dir(model_path, tmp_path, monkeypatch):
+    """
+    оптимизированный граф сохраняется в папку кэша, папка модели не изменяется,
+    при изменении модели граф прежнего состояния заменяется
+    """
+    cache_path = os.path.join(tmp_path, 'ort_cache')
+    monkeypatch.setattr(ortsession, 'path_to_ort_cache', cache_path)
+
+    _check(load_session(model_path))
+    assert os.listdir(os.path.dirname(model_path)) == ['model.onnx']
+    assert os.listdir(cache_path) == [os.path.basename(optimized_path(model_path))]
+
+    # повторная загрузка берет готовый граф
+    created = os.stat(optimized_path(model_path)).st_mtime_ns
+    _check(load_session(model_path))
+    assert os.stat(optimized_path(model_path)).st_mtime_ns == created
+
+    os.utime(model_path, ns=(0, 10 ** 18))
+    _check(load_session(model_path))
+    assert os.listdir(cache_path) == [os.path.basename(optimized_path(model_path))]
+
+
+def test_unwritable_cache_falls_back(model_path, tmp_path, monkeypatch, capsys):
+    """
+    если папку кэша нельзя создать или записать, сессия создается без кэша
+    """
+    # путь внутри файла не может быть папкой (в отличие от прав доступа, работает и под root)
+    blocker = os.path.join(tmp_path, 'blocker')
+    open(blocker, 'w').close()
+    monkeypatch.setattr(ortsession, 'path_to_ort_cache', os.path.join(blocker, 'ort_cache'))
+
+    _check(load_session(model_path))
+    assert os.listdir(os.path.dirname(model_path)) == ['model.onnx']
+    assert 'Не удалось сохранить оптимизированный граф' in capsys.readouterr().out
@@ -0,0 +1,77 @@
+"""
+тесты замеров этапов запусков (pipelinemetrics.py)
+"""
+import sqlite3
+
+import pipelinemetrics
+from database import close_connections, read_metrics
+from pipelinemetrics import pipeline_run, span
+
+
+# таблица замеров до появления колонки rss_peak_mib
+OLD_METRICS_SCHEMA = """
+    CREATE TABLE pipeline_metrics
+        (id           INTEGER PRIMARY KEY AUTOINCREMENT,
+         run_id       TEXT NOT NULL,
+         script       TEXT NOT NULL,
+         stage        TEXT NOT NULL,
+         started      REAL NOT NULL,
+         wall_seconds REAL NOT NULL,
+         cpu_seconds  REAL NOT NULL,
+         peak_mib     REAL,
+         row_count    INTEGER,
+         status       TEXT NOT NULL);
+"""
+
+
+def _run(path: str) -> None:
+    with pipeline_run('test', path=path):
+        with span('work') as stage:
+            stage.rows = len(bytearray(10 * 1024 ** 2))
+
+
+def test_spans_record_peak_rss(empty_db, monkeypatch):
+    """
+    каждый этап сохраняет пик резидентной памяти, tracemalloc по умолчанию выключен
+    """
+    monkeypatch.setattr(pipelinemetrics, 'metrics_enabled', True)
+    monkeypatch.setattr(pipelinemetrics, 'metrics_trace_memory', False)
+    _run(empty_db)
+
+    metrics = read_metrics(runs=1, path=empty_db).set_index('stage')
+    assert list(metrics.index) == ['total', 'work']
+    assert metrics.loc['work', 'row_count'] == 10 * 1024 ** 2
+    assert (metrics['rss_peak_mib'] > 10).all()
+    assert metrics['peak_mib'].isna().all()
+
+
+def test_trace_memory_is_opt_in(empty_db, monkeypatch):
+    """
+    при metrics_trace_memory этапы дополнительно сохраняют пик памяти Python
+    """
+    monkeypatch.setattr(pipelinemetrics, 'metrics_enabled', True)
+    monkeypatch.setattr(pipelinemetrics, 'metrics_trace_memory', True)
+    _run(empty_db)
+
+    metrics = read_metrics(runs=1, path=empty_db).set_index('stage')
+    assert metrics.loc['work', 'peak_mib'] >= 10
+
+
+def test_old_metrics_table_gets_rss_column(tmp_path, monkeypatch):
+    """
+    в таблицу замеров, созданную прежней версией, добавляется колонка rss_peak_mib
+    """
+    path = str(tmp_path / 'old.sqlite')
+    conn = sqlite3.connect(path)
+    conn.execute(OLD_METRICS_SCHEMA)
+    conn.execute("INSERT INTO pipeline_metrics (run_id, script, stage, started, wall_seconds, "
+                 "cpu_seconds, status) VALUES ('old', 'test', 'total', 0, 1, 1, 'ok');")
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(pipelinemetrics, 'metrics_enabled', True)
+    _run(path)
+    metrics = read_metrics(runs=2, path=path)
+    close_connections()
+    assert list(metrics['run_id'] == 'old') == [True, False, False]
+    assert metrics['rss_peak_mib'].isna().tolist() == [True, False, False]
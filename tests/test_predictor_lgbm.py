@@ -0,0 +1,93 @@
+"""
+тесты проверки актуальности графа onnx моделей lgbm (predictors/lgbm/predictor_lgbm.py)
+"""
+import os
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from predictors.lgbm import predictor_lgbm
+from predictors.lgbm.predictor_lgbm import OnnxHorizonPlan, source_signature, current_onnx_plan
+
+
+def _session(source: dict) -> SimpleNamespace:
+    """
+    заменитель сессии onnxruntime с метаданными графа, экспортированного из source
+    """
+    meta = SimpleNamespace(custom_metadata_map={'columns': json.dumps(['x']), **source})
+    return SimpleNamespace(get_modelmeta=lambda: meta,
+                           get_inputs=lambda: [SimpleNamespace(name='X')])
+
+
+@pytest.fixture
+def model_dir(tmp_path, monkeypatch):
+    """
+    папка модели с model.pickle и графом, экспортированным из него
+    (кэш моделей заменен словарем планов по пути к графу)
+    """
+    pickle_path = os.path.join(tmp_path, 'model.pickle')
+    with open(pickle_path, 'wb') as file:
+        file.write(b'boosters v1')
+    plans = {os.path.join(tmp_path, 'model.onnx'):
+             OnnxHorizonPlan(session=_session(source_signature(pickle_path)))}
+    monkeypatch.setattr(predictor_lgbm, 'model_cache',
+                        SimpleNamespace(get=lambda file_path, loader: plans[file_path]))
+    monkeypatch.setattr(predictor_lgbm, '_reported_stale', set())
+    return str(tmp_path)
+
+
+def _counting_signature(monkeypatch) -> list:
+    """
+    подменяет source_signature и возвращает список путей, по которым он вызывался
+    """
+    calls = []
+
+    def counted(file_path: str) -> dict:
+        calls.append(file_path)
+        return source_signature(file_path)
+
+    monkeypatch.setattr(predictor_lgbm, 'source_signature', counted)
+    return calls
+
+
+def _current(model_dir: str):
+    return current_onnx_plan(onnx_path=os.path.join(model_dir, 'model.onnx'),
+                             pickle_path=os.path.join(model_dir, 'model.pickle'),
+                             model_path=model_dir)
+
+
+def test_touched_pickle_keeps_graph(model_dir, monkeypatch):
+    """
+    model.pickle с тем же содержимым и новым временем изменения - граф актуален,
+    sha256 сверяется один раз
+    """
+    calls = _counting_signature(monkeypatch)
+    pickle_path = os.path.join(model_dir, 'model.pickle')
+    stat = os.stat(pickle_path)
+    os.utime(pickle_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert all(_current(model_dir) is not None for _ in range(3))
+    assert len(calls) == 1
+
+
+def test_stale_graph_is_reported_once(model_dir, monkeypatch, capsys):
+    """
+    устаревший граф не используется; предупреждение и сверка sha256 - один раз
+    на каждое состояние model.pickle
+    """
+    calls = _counting_signature(monkeypatch)
+    pickle_path = os.path.join(model_dir, 'model.pickle')
+    with open(pickle_path, 'wb') as file:
+        file.write(b'boosters v2')
+    os.utime(pickle_path, ns=(0, 10 ** 18))
+
+    assert all(_current(model_dir) is None for _ in range(3))
+    assert capsys.readouterr().out.count('устарел') == 1
+    assert len(calls) == 1
+
+    # модели снова переобучены
+    os.utime(pickle_path, ns=(0, 2 * 10 ** 18))
+    assert all(_current(model_dir) is None for _ in range(3))
+    assert capsys.readouterr().out.count('устарел') == 1
+    assert len(calls) == 2
@@ -0,0 +1,23 @@
+"""
+тесты проверки точности квантованной модели rnn (predictors/rnn/quantize.py)
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip('onnxruntime')
+
+from predictors.rnn.quantize import relative_increase
+
+
+@pytest.mark.parametrize('value, reference, expected', [
+    (1.01, 1.0, 0.01),
+    (0.0, 0.0, 0.0),
+    (0.1, 0.0, np.inf),
+    (np.nan, 1.0, np.inf),
+    (1.0, np.nan, np.inf),
+])
+def test_relative_increase(value, reference, expected):
+    """
+    нулевая или неопределенная ошибка исходной модели не дает nan
+    """
+    assert relative_increase(value=value, reference=reference) == pytest.approx(expected)
@@ -0,0 +1,206 @@
+"""
+тесты источников телеметрии и догрузки по частям (telemetrysource.py)
+"""
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import telemetrysource
+from telemetrysource import LocalDirectorySource, HttpSource, TelemetryError, \
+    split_period, fetch_telemetry, make_directory_server
+
+
+START = datetime(2023, 1, 1)
+END = datetime(2023, 3, 1, 23)
+
+
+@pytest.fixture
+def telemetry_dir(tmp_path) -> str:
+    """
+    папка с телеметрией за [START, END]: файл на каждый месяц, строки внутри
+    файлов перемешаны, один файл - с колонками в наименованиях ОИК
+    """
+    hours = pd.date_range(START, END, freq='H')
+    data = pd.DataFrame({'datetime': hours,
+                         'power_true': np.arange(len(hours), dtype=float),
+                         'temperature': -np.arange(len(hours), dtype=float)})
+    for month, part in data.groupby(data['datetime'].dt.month):
+        part = part.sample(frac=1, random_state=month)
+        if month == 2:
+            part = part.rename(columns={'power_true': 'average_hourly_consumption',
+                                        'temperature': 'average_hourly_temperature'})
+        part.to_csv(os.path.join(tmp_path, f'{month:02d}.csv'), index=False)
+    return str(tmp_path)
+
+
+def _expected(begin_time: datetime, end_time: datetime) -> pd.DataFrame:
+    """
+    телеметрия папки telemetry_dir за [begin_time, end_time] в хронологическом порядке
+    """
+    hours = pd.date_range(begin_time, end_time, freq='H')
+    first = int((begin_time - START) / timedelta(hours=1))
+    return pd.DataFrame({'datetime': hours,
+                         'power_true': np.arange(first, first + len(hours), dtype=float),
+                         'temperature': -np.arange(first, first + len(hours), dtype=float)})
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list:
+    """
+    паузы между повторами запросов (без ожидания)
+    """
+    calls = []
+    monkeypatch.setattr(telemetrysource.time, 'sleep', calls.append)
+    return calls
+
+
+class FlakySource(LocalDirectorySource):
+    """
+    папка с файлами, запросы к которой отвечают в случайном порядке, а запросы
+    частей, начинающихся в failing, завершаются ошибкой первые failures раз
+    """
+    def __init__(self, path: str, failing: set, failures: int = 1):
+        super().__init__(path=path)
+        self.failing = {begin_time: failures for begin_time in failing}
+        self.calls = []
+        self._calls_lock = threading.Lock()
+
+    def fetch(self, begin_time: datetime, end_time: datetime):
+        with self._calls_lock:
+            self.calls.append((begin_time, end_time))
+            failing = self.failing.get(begin_time, 0) > 0
+            if failing:
+                self.failing[begin_time] -= 1
+        # задержка до 20 мс, чтобы части завершались не по порядку
+        threading.Event().wait(random.random() / 50)
+        if failing:
+            raise ConnectionError('источник недоступен')
+        return super().fetch(begin_time=begin_time, end_time=end_time)
+
+
+@pytest.mark.parametrize('begin_time, end_time, chunk, expected', [
+    # части идут подряд, последняя короче
+    (datetime(2023, 1, 1), datetime(2023, 1, 3, 5), timedelta(days=1),
+     [(datetime(2023, 1, 1), datetime(2023, 1, 1, 23)),
+      (datetime(2023, 1, 2), datetime(2023, 1, 2, 23)),
+      (datetime(2023, 1, 3), datetime(2023, 1, 3, 5))]),
+    # интервал кратен длине части
+    (datetime(2023, 1, 1, 12), datetime(2023, 1, 2, 11), timedelta(hours=12),
+     [(datetime(2023, 1, 1, 12), datetime(2023, 1, 1, 23)),
+      (datetime(2023, 1, 2), datetime(2023, 1, 2, 11))]),
+    # один час
+    (datetime(2023, 1, 1), datetime(2023, 1, 1), timedelta(days=7),
+     [(datetime(2023, 1, 1), datetime(2023, 1, 1))]),
+])
+def test_split_period(begin_time, end_time, chunk, expected):
+    assert split_period(begin_time=begin_time, end_time=end_time, chunk=chunk) == expected
+
+
+def test_split_period_rejects_reversed_interval():
+    with pytest.raises(AssertionError):
+        split_period(begin_time=datetime(2023, 1, 2), end_time=datetime(2023, 1, 1),
+                     chunk=timedelta(days=1))
+
+
+def test_local_directory_fetch(telemetry_dir):
+    """
+    границы интервала включаются, данные нескольких файлов сливаются по времени,
+    изменение файла перечитывается
+    """
+    source = LocalDirectorySource(path=telemetry_dir)
+    begin_time, end_time = datetime(2023, 1, 31, 20), datetime(2023, 2, 1, 3)
+    pd.testing.assert_frame_equal(source.fetch(begin_time=begin_time, end_time=end_time),
+                                  _expected(begin_time, end_time))
+    assert source.fetch(begin_time=datetime(2024, 1, 1), end_time=datetime(2024, 2, 1)) is None
+
+    # новый файл с более поздними часами
+    hours = pd.date_range(datetime(2023, 3, 2), periods=24, freq='H')
+    pd.DataFrame({'datetime': hours, 'power_true': 1.0, 'temperature': 2.0}) \
+        .to_csv(os.path.join(telemetry_dir, '03_extra.csv'), index=False)
+    data = source.fetch(begin_time=datetime(2023, 3, 1, 23), end_time=datetime(2023, 3, 3))
+    assert len(data) == 25
+    assert data['power_true'].tolist()[1:] == [1.0] * 24
+
+
+def test_local_directory_reads_parquet(telemetry_dir):
+    """
+    файлы .parquet читаются вместе с .csv
+    """
+    pytest.importorskip('pyarrow')
+    march = os.path.join(telemetry_dir, '03.csv')
+    pd.read_csv(march).to_parquet(os.path.join(telemetry_dir, '03.parquet'))
+    os.remove(march)
+
+    source = LocalDirectorySource(path=telemetry_dir)
+    pd.testing.assert_frame_equal(source.fetch(begin_time=START, end_time=END),
+                                  _expected(START, END))
+
+
+@pytest.mark.parametrize('chunk', [timedelta(hours=5), timedelta(days=1), timedelta(days=7)])
+def test_fetch_telemetry_merges_chunks_in_order(telemetry_dir, sleeps, chunk):
+    """
+    части, завершающиеся в случайном порядке, собираются в хронологическом порядке
+    без потерь и повторов на границах частей
+    """
+    begin_time, end_time = datetime(2023, 1, 10, 7), datetime(2023, 2, 20, 13)
+    source = FlakySource(path=telemetry_dir, failing=set())
+    data = fetch_telemetry(begin_time=begin_time, end_time=end_time,
+                           source=source, chunk=chunk, retries=0)
+
+    pd.testing.assert_frame_equal(data, _expected(begin_time, end_time))
+    assert sorted(source.calls) == split_period(begin_time=begin_time, end_time=end_time,
+                                                chunk=chunk)
+    assert sleeps == []
+
+
+def test_fetch_telemetry_retries_failed_chunk(telemetry_dir, sleeps):
+    """
+    часть, запрос которой один раз завершился ошибкой, запрашивается повторно
+    после паузы, остальные части запрашиваются по одному разу
+    """
+    begin_time, end_time = datetime(2023, 1, 1), datetime(2023, 1, 28, 23)
+    failing = datetime(2023, 1, 8)
+    source = FlakySource(path=telemetry_dir, failing={failing})
+    data = fetch_telemetry(begin_time=begin_time, end_time=end_time,
+                           source=source, chunk=timedelta(days=7), retries=3)
+
+    pd.testing.assert_frame_equal(data, _expected(begin_time, end_time))
+    assert [call[0] for call in source.calls].count(failing) == 2
+    assert len(source.calls) == 5
+    assert sleeps == [1]
+
+
+def test_fetch_telemetry_gives_up_after_retries(telemetry_dir, sleeps):
+    """
+    после исчерпания повторов возникает TelemetryError, паузы растут вдвое
+    """
+    source = FlakySource(path=telemetry_dir, failing={datetime(2023, 1, 8)}, failures=10)
+    with pytest.raises(TelemetryError):
+        fetch_telemetry(begin_time=datetime(2023, 1, 1), end_time=datetime(2023, 1, 28, 23),
+                        source=source, chunk=timedelta(days=7), retries=3)
+    assert sleeps == [1, 2, 4]
+
+
+def test_http_source_matches_directory(telemetry_dir, sleeps):
+    """
+    HttpSource через HTTP-заглушку над папкой возвращает те же данные, что и папка
+    """
+    server = make_directory_server(path=telemetry_dir, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        source = HttpSource(url=f'http://127.0.0.1:{server.server_address[1]}/', timeout=10)
+        begin_time, end_time = datetime(2023, 1, 25, 3), datetime(2023, 2, 10, 17)
+        data = fetch_telemetry(begin_time=begin_time, end_time=end_time,
+                               source=source, chunk=timedelta(days=3), retries=0)
+        pd.testing.assert_frame_equal(data, _expected(begin_time, end_time))
+        assert source.fetch(begin_time=datetime(2024, 1, 1), end_time=datetime(2024, 1, 2)) is None
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert sleeps == []
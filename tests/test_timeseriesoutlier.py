@@ -0,0 +1,64 @@
+"""
+тесты очистки временных рядов от аномалий (preprocessing/timeseriesoutlier.py)
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.syntheticdata import synthetic_history
+from preprocessing.timeseriesoutlier import clean_outliers, catch_time_series_outs, \
+    StreamingOutlierCleaner
+
+
+THRESHOLDS = {'power_true': 650, 'temperature': 10}
+
+
+def _series_with_gap() -> pd.DataFrame:
+    """
+    кратковременный скачок сразу после пропуска
+    """
+    return pd.DataFrame({'power': [0.0, 0.0, np.nan, 20.0, 20.0, 0.0, 0.0]},
+                        index=pd.date_range('2024-01-01', periods=7, freq='H'))
+
+
+def test_clean_outliers_finds_jump_across_gap():
+    """
+    clean_outliers считает разницу от последнего известного значения
+    """
+    df = _series_with_gap()
+    clean_outliers(df=df, thresholds={'power': 10}, time_delta=3)
+    assert df['power'].tolist() == [0.0] * 7
+
+
+def test_catch_time_series_outs_keeps_gap_undefined():
+    """
+    catch_time_series_outs, как и прежняя реализация на .diff(),
+    не считает скачком разницу с пропуском
+    """
+    df = _series_with_gap()
+    catch_time_series_outs(df=df, col_name='power', min_diff=10, time_delta=3, freq='H')
+    assert df['power'].tolist() == [0.0, 0.0, 0.0, 20.0, 20.0, 0.0, 0.0]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 24 * 7, 10 ** 6])
+@pytest.mark.parametrize('time_delta', [1, 3])
+def test_streaming_matches_batch(chunk_size, time_delta):
+    """
+    потоковая очистка по частям совпадает с очисткой всего ряда за раз
+    """
+    history = synthetic_history(start=datetime(2023, 1, 1), end=datetime(2023, 3, 1))
+    rng = np.random.default_rng(0)
+    # пропуски, в том числе рядом с выбросами
+    history = history.mask(rng.random(size=history.shape) < 0.02) \
+        .assign(datetime=history['datetime'])
+
+    expected = history.copy()
+    clean_outliers(df=expected, thresholds=THRESHOLDS, time_delta=time_delta, time_col='datetime')
+
+    cleaner = StreamingOutlierCleaner(thresholds=THRESHOLDS, time_delta=time_delta, time_col='datetime')
+    parts = [cleaner.process(history.iloc[start:start + chunk_size])
+             for start in range(0, len(history), chunk_size)]
+    parts.append(cleaner.flush())
+    pd.testing.assert_frame_equal(pd.concat(parts), expected)
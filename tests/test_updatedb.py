@@ -0,0 +1,48 @@
+"""
+тесты обновления БД по телеметрии (updatedb.py)
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime
+
+from dbschema import to_epoch_hour
+
+
+# запуск daily_predict без необходимости обновления БД в отдельном процессе:
+# проверка и запись замеров этапов не импортируют pandas
+NO_OP_RUN = """
+import sys
+import config
+config.path_to_base = sys.argv[1]
+config.metrics_enabled = True
+
+from pipelinemetrics import pipeline_run, span
+from updatedb import update_db_by_data_from_oik
+
+with pipeline_run('daily_predict'):
+    with span('update_db'):
+        update_db_by_data_from_oik()
+assert 'pandas' not in sys.modules, 'pandas импортирован'
+"""
+
+
+def test_no_update_run_skips_pandas(empty_db):
+    conn = sqlite3.connect(empty_db)
+    with conn:
+        conn.execute('INSERT INTO consumption_table (power_true, temperature, datetime) '
+                     'VALUES (5000, -5, ?);',
+                     (to_epoch_hour(datetime.now().replace(minute=0, second=0, microsecond=0)),))
+    conn.close()
+
+    result = subprocess.run([sys.executable, '-c', NO_OP_RUN, empty_db],
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert 'БД не требует обновления' in result.stdout
+
+    conn = sqlite3.connect(empty_db)
+    stages = [row[0] for row in conn.execute('SELECT stage FROM pipeline_metrics ORDER BY id;')]
+    conn.close()
+    assert stages == ['update_db', 'total']
@@ -4,15 +4,11 @@
 прогноза на сутки вперед. База обновляется от последнего имеющегося значения
 и до последнего полуденного.
 """
-import sqlite3
-import tempfile
 from datetime import datetime, timedelta
 
-import pandas as pd
-
-from config import path_to_base
-from connect_to_oik import load_data_from_oik
-from preprocessing.timeseriesoutlier import catch_time_series_outs
+from config import use_history_cache
+from dbconnection import last_consumption_hour, last_calendar_day
+from pipelinemetrics import span
 
 
 def update_db_by_data_from_oik() -> None:
@@ -21,22 +17,10 @@ def update_db_by_data_from_oik() -> None:
     в случае необходимости обновления она дописывает данные,
     вызвав функцию connect_to_oik
     """
-    conn = sqlite3.connect(path_to_base)
-    cursor = conn.cursor()
     # получение текущего времени
     current_date = datetime.now().replace(minute=0, second=0, microsecond=0)
     # определение заполеннности БД свежими данными
-    query = """
-        SELECT
-            MAX(t.datetime)
-        FROM
-            consumption_table AS t
-        WHERE
-            t.power_true IS NOT NULL;
-        """
-    cursor.execute(query)
-    max_datetime_in_db_str = cursor.fetchone()[0]
-    max_datetime_in_db = datetime.strptime(max_datetime_in_db_str, '%Y-%m-%d %H:%M:%S')
+    max_datetime_in_db = last_consumption_hour()
     # определяемся, какие данные необходимо долить
     if current_date.hour >= 12:
         if current_date.date() > max_datetime_in_db.date():
@@ -71,69 +55,41 @@ def update_db_by_data_from_oik() -> None:
         else:
             print('БД не требует обновления')
             return None
-    with tempfile.TemporaryDirectory() as temp_dir:
-        data = load_data_from_oik(begin_time=begin_time,
-                                  end_time=end_time,
-                                  file_name=temp_dir+r'\data_from_oik')
+    # проверка выше обходится без pandas: запуск, не требующий обновления,
+    # завершается без импорта модулей загрузки и очистки данных
+    from database import update_facts
+    from historycache import sync_history_cache
+    from telemetrysource import fetch_telemetry
+    from preprocessing.timeseriesoutlier import clean_outliers
+
+    # длинный период догружается частями параллельно
+    with span('fetch_telemetry') as stage:
+        data = fetch_telemetry(begin_time=begin_time, end_time=end_time)
+        stage.rows = 0 if data is None else len(data)
     if data is None:
         print('ОИК не вернул данных')
         return None
-    data['datetime'] = pd.to_datetime(data['datetime'], format='%d.%m.%Y %H:%M:%S')
     data['datetime'] -= timedelta(hours=1)  # для совместимости времени...
-    data.rename(columns={'average_hourly_consumption': 'power_true',
-                         'average_hourly_temperature': 'temperature',},
-                inplace=True)
     # перед заливкой данных в БД, очистим выбросы
-    catch_time_series_outs(df=data,
-                           col_name='power_true',
-                           min_diff=650,
-                           time_delta=1,
-                           freq='H')
-    catch_time_series_outs(df=data,
-                           col_name='temperature',
-                           min_diff=10,
-                           time_delta=1,
-                           freq='H')
+    with span('clean_outliers') as stage:
+        clean_outliers(df=data,
+                       thresholds={'power_true': 650,
+                                   'temperature': 10},
+                       time_delta=1,
+                       freq='H',
+                       time_col='datetime')
+        stage.rows = len(data)
     # избавляемся от первой строки, чтобы не было пересечения данных
-    data = data.iloc[1:]
+    data = data.iloc[1:].copy()
     # зальем данные в БД
-    # для этого создадим временную таблицу, а потом обновим по ней основую
-    data.to_sql(name='temp_table',
-                con=conn,
-                if_exists='replace',
-                index=False)
-
-    query = """
-        UPDATE
-            consumption_table
-        SET
-            power_true = (
-                SELECT
-                    power_true
-                FROM
-                    temp_table
-                WHERE
-                    temp_table.datetime = consumption_table.datetime
-            ),
-            temperature = (
-                SELECT
-                    temperature
-                FROM
-                    temp_table
-                WHERE
-                    temp_table.datetime = consumption_table.datetime
-            )
-        WHERE
-            power_true IS NULL 
-            OR temperature IS NULL;
-        """
-    cursor.execute(query)
-
-    # удалим временную таблицу
-    cursor.execute("""DROP TABLE IF EXISTS temp_table;""")
-
-    conn.commit()
-    conn.close()
+    with span('update_facts') as stage:
+        counts = update_facts(data)
+        stage.rows = counts['inserted'] + counts['updated']
+    print(f'В БД добавлено {counts["inserted"]} и обновлено {counts["updated"]} часов, '
+          f'{counts["skipped"]} часов уже содержали данные')
+    if use_history_cache:
+        with span('sync_history_cache') as stage:
+            stage.rows = sync_history_cache()
     return None
 
 def update_calendar_in_db() -> None:
@@ -142,61 +98,22 @@ def update_calendar_in_db() -> None:
     Если в календаре имеются сведения о рабочих/выходных днях на предстоящий год
     и их нет в базе данных, то они будут добавлены в БД
     """
+    import pandas as pd
+    from database import insert_calendar
+    from historycache import sync_history_cache
+
     # прочитаем календарь из эксель-файла
     df = pd.read_excel('data/calendar.xlsx')
     df['day'] = pd.to_datetime(df['day'], format='%Y-%m-%d %H:%M:%s')
     last_date_in_calendar = df['day'].max()
 
     # определим последнюю дату, имеющуюся в БД
-    conn = sqlite3.connect(path_to_base)
-    cursor = conn.cursor()
-
-    query = """
-            SELECT
-                t1.datetime AS dates
-            FROM
-                day_off_table AS t1
-            ORDER
-                BY dates DESC
-            LIMIT 1;
-        """
-
-    cursor.execute(query)
-    last_date_in_base = datetime.strptime(cursor.fetchone()[0], '%Y-%m-%d %H:%M:%S')
+    last_date_in_base = last_calendar_day()
 
     if last_date_in_calendar > last_date_in_base:
-        df = df[df['day'] > last_date_in_base]
-        query = """
-            INSERT INTO
-                consumption_table (power_true, temperature, datetime)
-            VALUES
-                (?, ?, ?)
-        """
-        cursor.executemany(query, [
-            (None, None, hour.to_pydatetime())
-            for hour
-            in pd.date_range(
-                start=df['day'].min(),
-                end=df['day'].max() + timedelta(hours=23),
-                freq='H'
-            )
-        ])
-
-        df = df[df['day'] > last_date_in_base]
-        df.rename(columns={'day': 'datetime'}, inplace=True)
-        df.to_sql('temp_table', conn, if_exists='replace', index=False)
-
-        query = """
-        INSERT INTO day_off_table (day_off, datetime)
-        SELECT day_off, datetime FROM temp_table;
-        """
-        conn.execute(query)
-
-        cursor.execute("""DROP TABLE IF EXISTS temp_table;""")
-
-        conn.commit()
-        conn.close()
-
+        insert_calendar(df[df['day'] > last_date_in_base])
+        if use_history_cache:
+            sync_history_cache()
         print('Данные по выходным/рабочим дням были успешно добавлены в БД')
     else:
         print('Дополнительные данные по выходным/рабочим дням не были обнаружены')
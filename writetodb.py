@@ -2,11 +2,14 @@
 модуль предназначен для записи спрогнозированных значений в БД
 """
 import sqlite3
-from datetime import datetime, timedelta
+from typing import Dict
+from datetime import datetime
 
 import pandas as pd
 
 from config import path_to_base
+from dbschema import to_epoch_hour
+from database import write_forecasts
 
 
 def write_to_db(data: pd.DataFrame, date: datetime) -> None:
@@ -18,48 +21,53 @@ def write_to_db(data: pd.DataFrame, date: datetime) -> None:
     """
     assert data.shape[0] == 24, 'Неверный входной формат данных'
 
-    conn = sqlite3.connect(path_to_base)
-    cursor = conn.cursor()
-
-    dates = [date + timedelta(hours=i) for i in range(24)]
-
     data['ensemble'] = data.mean(axis=1)
 
-    cols = data.columns
-
-    for col in cols:
-        query = f"""
-            SELECT
-                t.power_pred
-            FROM
-                predict_table AS t
-            WHERE
-                t.datetime = '{dates[0]}' AND
-                t.model = '{col}'
-            """
-
-        df = pd.read_sql(sql=query, con=conn)
-
-        if len(df) == 0:
-            query = """
-                INSERT INTO
-                    predict_table (power_pred, datetime, model)
-                VALUES
-                    (?, ?, ?)
-            """
-            data_values = [(str(date), value) for date, value in zip(dates, data[col])]
-            cursor.executemany(query, [(value, date, col) for date, value in data_values])
-        else:
-            print(f'В БД на {date} имеется проноз от модели {col}')
-
-    conn.commit()
-    conn.close()
+    counts = write_forecasts(forecasts_to_long({date: data}, ensemble=False), policy='skip')
+    if counts['skipped']:
+        print(f'В БД на {date} уже имелось {counts["skipped"]} значений прогноза, они сохранены')
 
     print(f'Прогноз на {str(date)} внесен в БД')
 
     return None
 
 
+def forecasts_to_long(preds: Dict[datetime, pd.DataFrame], ensemble: bool = True) -> pd.DataFrame:
+    """
+    функция переводит прогнозы {дата: датафрейм на 24 часа с колонками моделей}
+    в длинный формат с колонками datetime, model, power_pred.
+    При ensemble=True добавляется среднее по моделям (модель ensemble)
+    """
+    frames = []
+    for date, data in preds.items():
+        assert data.shape[0] == 24, f'Неверный входной формат данных на {date}'
+        data = data.set_axis(pd.date_range(start=date, periods=24, freq='H'))
+        if ensemble:
+            data = data.assign(ensemble=data.mean(axis=1))
+        frames.append(data.rename_axis('datetime')
+                          .reset_index()
+                          .melt(id_vars='datetime', var_name='model', value_name='power_pred'))
+    if not frames:
+        return pd.DataFrame(columns=['datetime', 'model', 'power_pred'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_many_to_db(preds: Dict[datetime, pd.DataFrame], policy: str = 'skip') -> None:
+    """
+    функция записывает в ЛБД прогнозы на несколько дат одной транзакцией
+
+    принимает словарь {дата: датафрейм с предиктами моделей на 24 часа}
+    (как его возвращает call_predictors_batch) и политику записи
+    при наличии прогноза в БД: skip, replace или version
+    """
+    counts = write_forecasts(forecasts_to_long(preds), policy=policy)
+
+    print(f'Прогнозы на {len(preds)} дат внесены в БД: записано {counts["written"]}, '
+          f'пропущено {counts["skipped"]} значений')
+
+    return None
+
+
 if __name__ == '__main__':
     import numpy as np
 
@@ -72,24 +80,25 @@ if __name__ == '__main__':
 
     conn_ = sqlite3.connect(path_to_base)
     cursor_ = conn_.cursor()
+    day_start_ = to_epoch_hour(datetime.strptime('2017-01-01', '%Y-%m-%d'))
 
-    query_ = """
+    query_ = f"""
         SELECT
             *
         FROM
             predict_table AS t
         WHERE
-            DATE(t.datetime) = '2017-01-01'
+            t.datetime BETWEEN {day_start_} AND {day_start_ + 23}
     """
 
     sql_df = pd.read_sql(sql=query_, con=conn_)
     print(sql_df)
 
-    query_ = """
+    query_ = f"""
         DELETE FROM
             predict_table AS t
         WHERE
-            DATE(t.datetime) = '2017-01-01'
+            t.datetime BETWEEN {day_start_} AND {day_start_ + 23}
     """
     cursor_.execute(query_)
 